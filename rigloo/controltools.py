@@ -1,13 +1,100 @@
 import os
 import json
-import pymel.core as pmc
-import pymel.core.datatypes as dt
+import threading
+import maya.cmds as cmds
+import maya.api.OpenMaya as om2
+import maya.utils
+
+import rigstartup
+
+# Reading the control library doesn't need pymel, building and capturing controls does
+pmc = rigstartup.LazyModule('pymel.core', globals())
+dt = rigstartup.LazyModule('pymel.core.datatypes', globals())
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 CONTROLFILENAME = os.path.join(os.environ['MAYA_APP_DIR'],'control_cache.json')
 
 
 ########## Cache Functions ###############
+class ControlLibrary(object):
+    '''
+    Holds the shapes from the control cache file in memory as parsed Control objects.
+    The file is only parsed again when its modification time or size changes.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self._shapes = None
+        self._stamp = None
+
+        # The library can be read on a background thread while the tool opens
+        self._lock = threading.RLock()
+
+    def refresh(self):
+        '''
+        Reloads the library if the cache file changed since it was last read.
+        :return: True if the library was reloaded.
+        '''
+        with self._lock:
+            stamp = self._file_stamp()
+            if self._shapes is not None and stamp == self._stamp:
+                return False
+
+            self._shapes = parse_control_shapes(load_control_cache())
+            self._stamp = stamp
+            return True
+
+    def refresh_async(self, onLoaded=None):
+        '''
+        Reads the cache file on a background thread, so opening the tool doesn't wait on it.
+        :param onLoaded: An optional function, run on Maya's main thread once the library is loaded
+        '''
+        def load():
+            self.refresh()
+            if onLoaded is not None:
+                maya.utils.executeDeferred(onLoaded)
+
+        thread = threading.Thread(target=load, name='rigloo control library')
+        thread.daemon = True
+        thread.start()
+
+    @property
+    def loaded(self):
+        return self._shapes is not None
+
+    def invalidate(self):
+        '''
+        Forces the library to be read from disk the next time it is used.
+        '''
+        self._shapes = None
+        self._stamp = None
+
+    def mark_saved(self):
+        '''
+        Records the current state of the cache file after the library wrote it,
+        so our own saves do not trigger a reload.
+        '''
+        self._stamp = self._file_stamp()
+
+    @property
+    def shapes(self):
+        if self._shapes is None:
+            # Waits for a background load that is still running
+            self.refresh()
+        return self._shapes
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return None
+        return stat.st_mtime, stat.st_size
+
+
 def load_control_cache():
     '''
     Trys to load the control cache file.
@@ -20,15 +107,27 @@ def load_control_cache():
         return {}
 
 
+def parse_control_shapes(data):
+    '''
+    Converts raw cache data into lists of Control objects.
+    :param data: A dictionary of raw control shapes
+    :return: A dictionary of Control lists keyed by shape name
+    '''
+    return {name: [Control(c['cvs'], c['knots'], c['degree']) for c in shape]
+            for name, shape in data.iteritems()}
+
+
 def save_control_cache():
     '''
-    Saves the current values of control_shapes to the json cache file.
+    Saves the current values of the control library to the json cache file.
     '''
     def jdefault(o):
         return o.__dict__
 
     with open(CONTROLFILENAME, 'w') as c:
-        json.dump(control_shapes, c, default=jdefault, indent=4)
+        json.dump(control_library.shapes, c, default=jdefault, indent=4)
+
+    control_library.mark_saved()
 
 
 def update_control_cache():
@@ -47,9 +146,8 @@ def create_new_control_cache():
     Overwrites the cache file and replaces with a fresh one.
     :return: 
     '''
-    global control_shapes
-    new_control_shape = {'default': default_control, 'none': empty_control}
-    control_shapes = new_control_shape
+    control_library.shapes.clear()
+    control_library.shapes.update({'default': default_control, 'none': empty_control})
     save_control_cache()
 
 
@@ -61,6 +159,43 @@ def control_cache_exists():
     return os.path.isfile(CONTROLFILENAME)
 
 
+def refresh_control_library():
+    '''
+    Reloads the control library if the cache file was changed on disk.
+    Call this once before a build, rather than once per control.
+    '''
+    return control_library.refresh()
+
+
+def refresh_control_library_async(onLoaded=None):
+    '''
+    Loads the control library on a background thread.
+    :param onLoaded: An optional function, run on Maya's main thread once the library is loaded
+    '''
+    control_library.refresh_async(onLoaded)
+
+
+def control_library_loaded():
+    '''
+    :return: Whether the control library was read, without reading it.
+    '''
+    return control_library.loaded
+
+
+def invalidate_control_library():
+    '''
+    Forces the control library to be reloaded the next time a control is requested.
+    '''
+    control_library.invalidate()
+
+
+def get_control_names():
+    '''
+    :return: The names of every shape in the control library.
+    '''
+    return control_library.shapes.keys()
+
+
 ########### Curve Functions ##############
 class Control():
     '''
@@ -71,6 +206,14 @@ class Control():
         self.knots = k
         self.degree = d
 
+    def copy(self):
+        '''
+        :return: A new Control with its own cv and knot lists.
+        '''
+        # The 'none' control stores its cvs as a flat list of values
+        cvs = [list(cv) if hasattr(cv, '__len__') else cv for cv in self.cvs]
+        return Control(cvs, list(self.knots), self.degree)
+
 
 def cache_curve(curve, name):
     '''
@@ -80,7 +223,7 @@ def cache_curve(curve, name):
     :return: The newly created json file
     '''
     curveInfo = get_curve_info(curve)
-    control_shapes[name] = curveInfo
+    control_library.shapes[name] = curveInfo
     update_control_cache()
 
 
@@ -103,7 +246,7 @@ def remove_curve(name) :
     Removes a specified curve from the control shapes dict.
     :param name: The name of the curve
     '''
-    del control_shapes[name]
+    del control_library.shapes[name]
     update_control_cache()
 
 
@@ -115,59 +258,261 @@ def get_curve_info(curve):
     '''
     controls = []
     for c in curve:
-        cvs = []
-        for cv in c.getCVs():
-            v = []
-            v.append(cv.x)
-            v.append(cv.y)
-            v.append(cv.z)
-            cvs.append(v)
-        control = Control(cvs, c.getKnots(), c.degree())
+        cvs, knots, degree = capture_curve_shape(c)
+        control = Control(_to_list(cvs), _to_list(knots), degree)
         controls.append(control)
     return controls
 
 
-def create_control_curve(name):
+########## Capture Functions #############
+
+# The cv and knot buffers last read from each curve shape, keyed by the shape's uuid
+_captured_curves = {}
+
+# The dirty callbacks watching each captured curve shape, keyed by the shape's uuid
+_capture_callbacks = {}
+
+# Curve plugs that change the object space shape of a curve
+_CURVE_GEOMETRY_PLUGS = ('controlPoints', 'create', 'local')
+
+# The scene callbacks that drop every capture when a scene or reference is loaded
+# Loaded nodes keep the uuids they were saved with, so captures from before could be stale
+_scene_callbacks = []
+
+
+def capture_curve_shape(shape):
+    '''
+    Reads the cvs and knots of a curve shape, each in a single api call.
+    Shapes that have not changed since they were last captured are returned from the cache.
+    :param shape: The curve shape to read
+    :return: A tuple of the cv buffer, the knot buffer and the degree
+    '''
+    selection = om2.MSelectionList()
+    selection.add(shape.longName())
+    node = selection.getDependNode(0)
+    key = om2.MFnDependencyNode(node).uuid().asString()
+
+    try:
+        return _captured_curves[key]
+    except KeyError:
+        pass
+
+    curveFn = om2.MFnNurbsCurve(selection.getDagPath(0))
+    cvs = _to_buffer(curveFn.cvPositions(om2.MSpace.kObject))
+    knots = _to_buffer(curveFn.knots())
+
+    # Drop the homogeneous component of the cv positions
+    if np is not None:
+        cvs = cvs[:, :3]
+    else:
+        cvs = [cv[:3] for cv in cvs]
+
+    _watch_curve_shape(node, key)
+    _captured_curves[key] = (cvs, knots, curveFn.degree)
+
+    return _captured_curves[key]
+
+
+def seed_curve_capture(shape, cvs, knots, degree):
+    '''
+    Stores the capture of a curve shape whose cvs are already known,
+    such as a control that was just created from curve info.
+    :param shape: The full path to the curve shape
+    '''
+    selection = om2.MSelectionList()
+    selection.add(shape)
+    node = selection.getDependNode(0)
+    key = om2.MFnDependencyNode(node).uuid().asString()
+
+    _watch_curve_shape(node, key)
+    _captured_curves[key] = (_to_buffer(cvs), _to_buffer(knots), degree)
+
+
+def invalidate_curve_capture(key=None):
+    '''
+    Removes a captured curve so it is read from the scene next time.
+    :param key: The uuid of the curve shape, if None every capture is removed
+    '''
+    if key is None:
+        for callback in _capture_callbacks.values():
+            _remove_callback(callback)
+        _capture_callbacks.clear()
+        _captured_curves.clear()
+    else:
+        _captured_curves.pop(key, None)
+        callback = _capture_callbacks.pop(key, None)
+        if callback is not None:
+            _remove_callback(callback)
+
+
+def _remove_callback(callback):
+    try:
+        om2.MMessage.removeCallback(callback)
+    except RuntimeError:
+        # The callback went with its node, such as when a new scene was opened
+        pass
+
+
+def _watch_curve_shape(node, key):
+    '''
+    Adds a callback that removes the curve's capture when its geometry is edited.
+    '''
+    _install_scene_callbacks()
+
+    if key not in _capture_callbacks:
+        _capture_callbacks[key] = om2.MNodeMessage.addNodeDirtyPlugCallback(node, _on_curve_dirty, key)
+
+
+def _install_scene_callbacks():
+    if _scene_callbacks:
+        return
+
+    for message in (om2.MSceneMessage.kAfterOpen, om2.MSceneMessage.kAfterNew,
+                    om2.MSceneMessage.kAfterCreateReference, om2.MSceneMessage.kAfterLoadReference):
+        _scene_callbacks.append(om2.MSceneMessage.addCallback(message, _on_scene_loaded))
+
+
+def _on_scene_loaded(*args):
+    # Also removes the dirty callbacks, whose nodes may no longer exist
+    invalidate_curve_capture()
+
+
+def _on_curve_dirty(node, plug, key):
+    attribute = plug.partialName(useLongNames=True).split('[')[0].split('.')[0]
+    if attribute in _CURVE_GEOMETRY_PLUGS:
+        _captured_curves.pop(key, None)
+
+
+def _to_buffer(values):
+    if np is not None:
+        return np.array(values, dtype=float)
+    return [list(value) if hasattr(value, '__len__') else value for value in values]
+
+
+def _to_list(buffer):
+    if np is not None:
+        return buffer.tolist()
+    return [list(value) if isinstance(value, list) else value for value in buffer]
+
+
+def create_control_curve(name, controlName='curve', color=None):
     '''
     Creates a curve based on input curve info.
     :return: The newly created curve
     '''
-    curveInfo = get_control(name)
-    parent = pmc.group(em=True)
+    return build_control_curve(get_control(name), name=controlName, color=color)
+
+
+def create_control_curve_from_data(data, controlName='curve', color=None):
+    '''
+    Creates a curve from raw curve data, as stored in rig files.
+    :return: The newly created curve
+    '''
+    return build_control_curve(parse_curve_data(data), name=controlName, color=color)
+
+
+def parse_curve_data(data):
+    '''
+    Converts raw curve data, as stored in rig files, into a list of Control objects.
+    '''
+    return [Control(c['cvs'], c['knots'], c['degree']) for c in data]
+
+
+def transform_curve_info(curveInfo, matrix):
+    '''
+    Returns a copy of the curve info with every cv transformed by a matrix.
+    This bakes scale and orientation into the cvs before the curve is created,
+    instead of freezing transforms on the finished curve.
+    :param curveInfo: A list of Control objects
+    :param matrix: The transformation matrix to apply, translation is ignored
+    :return: A new list of Control objects
+    '''
+    if matrix.isEquivalent(dt.Matrix()):
+        return curveInfo
+
+    rows = [[matrix[row][column] for column in range(3)] for row in range(3)]
+
+    controls = []
     for c in curveInfo:
-        curve = pmc.curve(p=c.cvs, k=c.knots, d = c.degree)
-        pmc.parent(curve.getShape(), parent, shape=True, r=True)
-        pmc.delete(curve)
-    return parent
+        if np is not None:
+            cvs = np.asarray(c.cvs, dtype=float).reshape(-1, 3).dot(np.array(rows))
+        else:
+            cvs = [[sum(cv[i] * rows[i][column] for i in range(3)) for column in range(3)] for cv in _cv_points(c.cvs)]
+        controls.append(Control(cvs, c.knots, c.degree))
+    return controls
 
-def create_control_curve_from_data(data):
-    parent = pmc.group(em=True)
 
-    newControl = data
-    curveInfo = []
-    for c in newControl:
-        control = Control(c['cvs'], c['knots'], c['degree'])
-        curveInfo.append(control)
+def build_control_curve(curveInfo, name='curve', color=None):
+    '''
+    Creates a transform and builds every curve shape directly beneath it.
+    The override color is set on each shape as it is created.
+    Shapes with too few cvs for their degree, like the 'none' control, are skipped.
+    :param curveInfo: A list of Control objects, one for each shape
+    :param name: The name of the new transform
+    :param color: An optional rgb list to use as the shapes override color
+    :return: The newly created transform
+    '''
+    control = pmc.createNode('transform', name=name, skipSelect=True)
+    parent = control.longName()
 
     for c in curveInfo:
-        curve = pmc.curve(p=c.cvs, k=c.knots, d=c.degree)
-        pmc.parent(curve.getShape(), parent, shape=True, r=True)
-        pmc.delete(curve)
-    return parent
+        if len(_cv_points(c.cvs)) <= c.degree:
+            continue
+
+        shape = cmds.createNode('nurbsCurve', name=control.nodeName() + 'Shape', parent=parent, skipSelect=True)
+        # createNode only returns a path when the name isn't unique, so always resolve the full path
+        shape = cmds.ls(shape, long=True)[0]
+        cmds.setAttr(shape + '.cached', *_curve_data(c.cvs, c.knots, c.degree), type='nurbsCurve')
+
+        if color is not None:
+            cmds.setAttr(shape + '.overrideEnabled', True)
+            cmds.setAttr(shape + '.overrideRGBColors', True)
+            cmds.setAttr(shape + '.overrideColorRGB', color[0], color[1], color[2])
+
+        # The shape is born in its final form, so its capture is already known
+        seed_curve_capture(shape, c.cvs, c.knots, c.degree)
+
+    return control
+
+
+def _curve_data(cvs, knots, degree):
+    '''
+    Flattens curve info into the argument list setAttr expects for nurbsCurve data.
+    The curve is open and non rational, matching the curves made by the curve command.
+    '''
+    points = [float(value) for cv in _cv_points(cvs) for value in cv]
+    count = len(points) // 3
+
+    data = [degree, count - degree, 0, False, 3, len(knots)]
+    data.extend(float(knot) for knot in knots)
+    data.append(count)
+    data.extend(points)
+    return data
+
+
+def _cv_points(cvs):
+    '''
+    Returns the cvs as a list of [x, y, z] points.
+    Most shapes store nested points, but the 'none' control stores a flat list of values.
+    '''
+    if np is not None:
+        return np.asarray(cvs, dtype=float).reshape(-1, 3).tolist()
+
+    cvs = list(cvs)
+    if cvs and not hasattr(cvs[0], '__len__'):
+        return [cvs[index:index + 3] for index in range(0, len(cvs), 3)]
+    return [list(cv) for cv in cvs]
+
 
 def get_control(name):
     '''
     Returns a cached control if it exists.
+    The control comes from the in memory library, the cache file is not read.
+    The controls are copies, so editing them leaves the library untouched.
     :param controlName: The name of the desired control.
     :return: The curve info of the desired control
     '''
-    curves = load_control_cache()
-    newControl = curves[name]
-    curveInfo = []
-    for c in newControl:
-        control = Control( c['cvs'], c['knots'],c['degree'] )
-        curveInfo.append(control)
-    return curveInfo
+    return [control.copy() for control in control_library.shapes[name]]
 
 
 ########## Maya Functions ###############
@@ -214,7 +559,7 @@ def move_to_selection(obj):
         move_to_transform(obj, selection[0])
 
 
-def move_to_transform(obj, target, upVector= dt.Vector(0,1,0)):
+def move_to_transform(obj, target, upVector=None):
     ''' 
     Moves an inputed object to a target position.
     Orients to the upVector of the target.
@@ -223,6 +568,9 @@ def move_to_transform(obj, target, upVector= dt.Vector(0,1,0)):
     :param upVector: The local up vector of the target
     '''
 
+    if upVector is None:
+        upVector = dt.Vector(0, 1, 0)
+
     # The world up vector
     worldUp = dt.Vector(0, 1, 0)
 
@@ -278,4 +626,4 @@ empty_control = [Control(
     )]
 
 
-control_shapes = load_control_cache()
+control_library = ControlLibrary(CONTROLFILENAME)
@@ -0,0 +1,210 @@
+import maya.api.OpenMaya as om2
+
+import rigstartup
+
+# Only needed once a node is resolved
+pmc = rigstartup.LazyModule('pymel.core', globals())
+
+
+class NodeCache(object):
+    '''
+    A process wide cache of node names resolved to PyNodes.
+    Entries are dropped by scene callbacks when nodes are added, removed or renamed,
+    and the whole cache is cleared when a scene is opened or created.
+    Keys that are dag paths are dropped whenever a dag node is renamed or reparented,
+    since the path of every descendant changes with it.
+    '''
+    def __init__(self):
+        # Resolved nodes keyed by the name they were requested with
+        # A value of None means the name did not resolve to a node
+        self._nodes = {}
+
+        # Cache keys grouped by the leaf name of the node they point to
+        self._keysByName = {}
+
+        # Cache keys grouped by the hash of the node they point to
+        self._keysByHandle = {}
+
+        # Cache keys that did not resolve to a node
+        self._missing = set()
+
+        # Cache keys that are dag paths rather than plain names
+        self._paths = set()
+
+        self._callbacks = []
+
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, name):
+        '''
+        Returns the PyNode for a node name.
+        :param name: The name of the node
+        :return: The PyNode for the name
+        :raises pmc.MayaNodeError: When no single node matches the name
+        '''
+        try:
+            node = self._nodes[name]
+            self.hits += 1
+        except KeyError:
+            self.misses += 1
+            self.install()
+
+            try:
+                node = pmc.PyNode(name)
+            except TypeError:
+                node = None
+
+            self._store(name, node)
+
+        if node is None:
+            raise pmc.MayaNodeError(name)
+
+        return node
+
+    def remember(self, node):
+        '''
+        Adds a node that is already resolved, such as one from the selection.
+        :param node: The PyNode to store
+        '''
+        self.install()
+        self._store(node.name(), node)
+
+    def clear(self, *args):
+        self._nodes.clear()
+        self._keysByName.clear()
+        self._keysByHandle.clear()
+        self._missing.clear()
+        self._paths.clear()
+
+    def install(self):
+        '''
+        Adds the scene callbacks that keep the cache valid.
+        '''
+        if self._callbacks:
+            return
+
+        self._callbacks = [
+            om2.MDGMessage.addNodeAddedCallback(self._onNodeAdded, 'dependNode'),
+            om2.MDGMessage.addNodeRemovedCallback(self._onNodeRemoved, 'dependNode'),
+            om2.MNodeMessage.addNameChangedCallback(om2.MObject.kNullObj, self._onNameChanged),
+            om2.MDagMessage.addAllDagChangesCallback(self._onDagChanged),
+            om2.MSceneMessage.addCallback(om2.MSceneMessage.kAfterOpen, self.clear),
+            om2.MSceneMessage.addCallback(om2.MSceneMessage.kAfterNew, self.clear)
+        ]
+
+    def uninstall(self):
+        '''
+        Removes the scene callbacks and clears the cache.
+        '''
+        for callback in self._callbacks:
+            om2.MMessage.removeCallback(callback)
+        self._callbacks = []
+        self.clear()
+
+    @property
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': float(self.hits) / requests if requests else 0.0,
+            'size': len(self._nodes)
+        }
+
+    #### Private Methods ####
+
+    def _store(self, name, node):
+        self._nodes[name] = node
+        self._keysByName.setdefault(self._leafName(name), set()).add(name)
+
+        if '|' in name:
+            self._paths.add(name)
+
+        if node is None:
+            self._missing.add(name)
+        else:
+            selection = om2.MSelectionList()
+            selection.add(getattr(node, 'longName', node.name)())
+            handle = om2.MObjectHandle(selection.getDependNode(0)).hashCode()
+            self._keysByHandle.setdefault(handle, set()).add(name)
+
+    def _drop(self, keys):
+        for key in keys:
+            self._nodes.pop(key, None)
+
+    def _dropName(self, name):
+        self._drop(self._keysByName.pop(self._leafName(name), ()))
+
+    def _dropNode(self, node):
+        self._drop(self._keysByHandle.pop(om2.MObjectHandle(node).hashCode(), ()))
+
+    def _dropPaths(self):
+        self._drop(self._paths)
+        self._paths.clear()
+
+    def _dropMissing(self):
+        # A name that failed to resolve may resolve now, so forget every failure
+        self._drop(self._missing)
+        self._missing.clear()
+
+    def _leafName(self, name):
+        return name.split('|')[-1]
+
+    #### Callbacks ####
+
+    def _onNodeAdded(self, node, *args):
+        self._dropName(om2.MFnDependencyNode(node).name())
+        self._dropMissing()
+
+    def _onNodeRemoved(self, node, *args):
+        self._dropNode(node)
+        self._dropName(om2.MFnDependencyNode(node).name())
+        self._dropMissing()
+
+    def _onNameChanged(self, node, previousName, *args):
+        self._dropNode(node)
+        self._dropName(previousName)
+        self._dropName(om2.MFnDependencyNode(node).name())
+        self._dropMissing()
+
+        # Renaming a dag node changes the path of everything beneath it
+        if node.hasFn(om2.MFn.kDagNode):
+            self._dropPaths()
+
+    def _onDagChanged(self, *args):
+        # Reparenting changes the path of the node and everything beneath it
+        self._dropPaths()
+
+
+_cache = NodeCache()
+
+
+def resolve(name):
+    '''
+    Returns the PyNode for a node name, using the cache when possible.
+    :raises pmc.MayaNodeError: When no single node matches the name
+    '''
+    return _cache.resolve(name)
+
+
+def remember(node):
+    '''
+    Stores an already resolved PyNode in the cache.
+    '''
+    _cache.remember(node)
+
+
+def clear():
+    _cache.clear()
+
+
+def uninstall():
+    _cache.uninstall()
+
+
+def stats():
+    '''
+    :return: A dictionary with the hit, miss and hit rate of the cache.
+    '''
+    return _cache.stats
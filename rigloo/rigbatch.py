@@ -0,0 +1,206 @@
+'''
+Validates, migrates and compacts rig files without maya.
+
+Usage:
+    python rigbatch.py [--write] [--format {keep,json,rigb}] [--precision N] [--jobs N] [--report report.json]
+                       path [path ...]
+
+Paths can be rig files or folders, which are searched recursively. Without --write files are only checked.
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+
+import rigfile
+import rigschema
+
+
+RIG_EXTENSIONS = (rigfile.JSON_EXTENSION, rigfile.BINARY_EXTENSION)
+
+
+########## Processing ###############
+def process_file(path, write=False, format='keep', precision=None):
+    '''
+    Validates and migrates a single rig file, optionally writing it back compacted.
+    :param path: The rig file
+    :param write: Whether to write the migrated rig back to disk
+    :param format: The format to write, either keep, json or rigb
+    :param precision: The number of decimal places to save curve data with, None keeps the rig's own setting
+    :return: A report dictionary for the file
+    '''
+    start = time.time()
+    report = {
+        'path': path,
+        'output': None,
+        'ok': False,
+        'errors': [],
+        'warnings': [],
+        'changes': [],
+        'sizeBefore': 0,
+        'sizeAfter': 0,
+        'shapes': 0,
+        'version': None
+    }
+
+    try:
+        _process_file(path, write, format, precision, report)
+    except Exception as e:
+        # A malformed rig is reported against its file, so one bad file doesn't stop the whole run
+        report['errors'].append('Could not process file: %s: %s' % (type(e).__name__, e))
+
+    report['ok'] = not report['errors']
+    report['seconds'] = time.time() - start
+    return report
+
+
+def _process_file(path, write, format, precision, report):
+    # Fills in the report for a single file
+    try:
+        report['sizeBefore'] = os.path.getsize(path)
+        componentData, shapes, report['version'] = rigfile.read(path)
+    except (IOError, OSError, ValueError) as e:
+        report['errors'].append('Could not read file: %s' % e)
+        return
+
+    if isinstance(componentData, dict):
+        report['changes'] = rigschema.upgrade(componentData, report['version'])
+    report['errors'], report['warnings'] = rigschema.validate(componentData)
+    report['shapes'] = len(shapes)
+
+    if precision is not None:
+        shapes.precision = precision
+
+    if write and not report['errors']:
+        output = _output_path(path, format)
+        try:
+            # Writing through rigfile stores every shape once in the file's shape table
+            root, ext = os.path.splitext(output)
+            temp = root + '.tmp' + ext
+            rigfile.save(temp, componentData, shapes)
+            rigfile.replace(temp, output)
+            report['output'] = output
+            report['sizeAfter'] = os.path.getsize(output)
+        except (IOError, OSError) as e:
+            report['errors'].append('Could not write file: %s' % e)
+
+
+def _process(args):
+    # Pool workers can only be handed a single argument
+    return process_file(*args)
+
+
+def find_rig_files(paths):
+    '''
+    Returns every rig file in a list of files and folders.
+    '''
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for filename in sorted(files):
+                    base, ext = os.path.splitext(filename)
+                    if ext.lower() in RIG_EXTENSIONS and not base.endswith(('.autosave', '.tmp')):
+                        yield os.path.join(root, filename)
+        else:
+            yield path
+
+
+def run(paths, write=False, format='keep', precision=None, jobs=None, stream=sys.stdout):
+    '''
+    Processes every rig file in a list of files and folders with a pool of processes.
+    :return: A list of report dictionaries, one per file
+    '''
+    files = list(find_rig_files(paths))
+    tasks = [(path, write, format, precision) for path in files]
+
+    start = time.time()
+    reports = []
+
+    jobs = jobs or multiprocessing.cpu_count()
+
+    # Hand out files in chunks, so small files don't spend their time waiting on the pool
+    chunksize = max(1, len(tasks) // (jobs * 16))
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for report in pool.imap_unordered(_process, tasks, chunksize=chunksize):
+            reports.append(report)
+            stream.write(_report_line(report) + '\n')
+    finally:
+        pool.close()
+        pool.join()
+
+    stream.write(_summary(reports, time.time() - start) + '\n')
+    return reports
+
+
+########## Reporting ###############
+def _report_line(report):
+    if report['errors']:
+        status = 'FAILED'
+    elif report['changes'] or report['version'] != rigschema.SCHEMA_VERSION:
+        status = 'MIGRATED'
+    else:
+        status = 'OK'
+
+    line = '%-8s %s (%d changes, %d warnings, %d shapes)' % (
+        status, report['path'], len(report['changes']), len(report['warnings']), report['shapes'])
+
+    for error in report['errors']:
+        line += '\n         ' + error
+
+    return line
+
+
+def _summary(reports, seconds):
+    failed = len([r for r in reports if not r['ok']])
+    migrated = len([r for r in reports if r['ok'] and (r['changes'] or r['version'] != rigschema.SCHEMA_VERSION)])
+    before = sum(r['sizeBefore'] for r in reports)
+    after = sum(r['sizeAfter'] for r in reports if r['output'])
+    written = sum(r['sizeBefore'] for r in reports if r['output'])
+
+    lines = [
+        '%d files in %.2fs (%.1f files/s, %.1f MB/s)' % (
+            len(reports), seconds, len(reports) / max(seconds, 1e-6), before / 1048576.0 / max(seconds, 1e-6)),
+        '%d failed, %d migrated' % (failed, migrated)
+    ]
+    if written:
+        lines.append('%d files written, %.1f KB -> %.1f KB' % (
+            len([r for r in reports if r['output']]), written / 1024.0, after / 1024.0))
+
+    return '\n'.join(lines)
+
+
+########## Private Functions ###############
+def _output_path(path, format):
+    if format == 'keep':
+        return path
+    extension = rigfile.BINARY_EXTENSION if format == 'rigb' else rigfile.JSON_EXTENSION
+    return os.path.splitext(path)[0] + extension
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Validate, migrate and compact rig files.')
+    parser.add_argument('paths', nargs='+', help='Rig files or folders to process')
+    parser.add_argument('--write', action='store_true', help='Write migrated and compacted files back to disk')
+    parser.add_argument('--format', choices=('keep', 'json', 'rigb'), default='keep',
+                        help='The format to write files in')
+    parser.add_argument('--precision', type=int, default=None,
+                        help='The number of decimal places to save curve data with')
+    parser.add_argument('--jobs', type=int, default=None, help='The number of processes to use')
+    parser.add_argument('--report', help='Write the full per file report to a json file')
+    args = parser.parse_args(argv)
+
+    reports = run(args.paths, write=args.write, format=args.format, precision=args.precision, jobs=args.jobs)
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(reports, f, indent=4)
+
+    return 1 if any(not r['ok'] for r in reports) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,348 @@
+'''
+Compares and merges rig component data, component by component and field by field.
+
+Usage:
+    python rigdiff.py base.json other.json
+    python rigdiff.py base.json ours.json theirs.json --output merged.json
+
+A merge with conflicts is only saved when --output is given, otherwise our rig file is left as it was.
+'''
+import sys
+import json
+import copy
+import argparse
+
+import rigfile
+import rigschema
+
+
+# Stands in for a field or component that doesn't exist on one side
+_MISSING = object()
+
+# Index fields only describe the order of components
+# They are renumbered after a merge instead of conflicting, and a diff describes them as moves
+ORDER_KEY = 'index'
+
+
+########## Diffing ###############
+def diff(base, other):
+    '''
+    Finds the changes that turn one set of component data into another.
+    Indexes are not diffed as fields. Added components record the component they follow, and the fewest
+    components needed to reorder the rig are recorded as moves, so inserting one component is a single change.
+    Runs in time linear to the size of both rigs, plus n log n to order them.
+    :param base: The original component data dictionary
+    :param other: The changed component data dictionary
+    :return: A list of change dictionaries, each with an op of add, remove, move, set or unset
+    '''
+    changes = []
+
+    for id, component in base.iteritems():
+        if id not in other:
+            changes.append({'op': 'remove', 'id': id})
+
+    # Components that keep their place relative to each other, every other kept component is moved
+    order = _order(other)
+    basePositions = dict((id, position) for position, id in enumerate(_order(base)))
+    kept = _longest_increasing([id for id in order if id in basePositions], basePositions)
+
+    after = None
+    for id in order:
+        component = other[id]
+        if id not in base:
+            changes.append({'op': 'add', 'id': id, 'after': after, 'value': component})
+        else:
+            if id not in kept:
+                changes.append({'op': 'move', 'id': id, 'after': after})
+            if base[id] != component:
+                # Comparing whole components first skips the field by field diff for everything unchanged
+                changes.extend(diff_component(id, base[id], component))
+        after = id
+
+    return changes
+
+
+def diff_component(id, base, other):
+    '''
+    Finds the field changes between two versions of a single component.
+    The index is left out, the order of components is described by moves instead.
+    '''
+    changes = []
+
+    for attr, value in other.iteritems():
+        if attr != ORDER_KEY and base.get(attr, _MISSING) != value:
+            changes.append({'op': 'set', 'id': id, 'attr': attr, 'value': value})
+
+    for attr in base:
+        if attr != ORDER_KEY and attr not in other:
+            changes.append({'op': 'unset', 'id': id, 'attr': attr})
+
+    return changes
+
+
+def apply(componentData, changes):
+    '''
+    Applies a list of changes to component data, in place.
+    Components are renumbered after any add, remove or move, so the indexes stay a sequence from 1.
+    '''
+    order = _order(componentData)
+    reordered = False
+
+    for change in changes:
+        op = change['op']
+        if op == 'add':
+            componentData[change['id']] = copy.deepcopy(change['value'])
+            _place(order, change['id'], change.get('after'))
+            reordered = True
+        elif op == 'remove':
+            if componentData.pop(change['id'], None) is not None:
+                order.remove(change['id'])
+                reordered = True
+        elif op == 'move':
+            if change['id'] in componentData:
+                _place(order, change['id'], change['after'])
+                reordered = True
+        elif op == 'set':
+            componentData[change['id']][change['attr']] = copy.deepcopy(change['value'])
+        elif op == 'unset':
+            componentData[change['id']].pop(change['attr'], None)
+
+    if reordered:
+        for index, id in enumerate(order):
+            componentData[id][ORDER_KEY] = index + 1
+
+
+def changed_components(componentData, changes):
+    '''
+    Returns the ids of every component that needs to be rebuilt after a set of changes.
+    This is every changed component, along with every component that uses one of them as a space.
+    :param componentData: The component data the changes were applied to
+    :param changes: A list of changes, as returned by diff
+    :return: A set of component ids
+    '''
+    changed = set(change['id'] for change in changes)
+
+    # Map each component to the components using it as a space
+    children = {}
+    for id, component in componentData.iteritems():
+        for key in rigschema.SPACE_KEYS:
+            space = component.get(key)
+            if space:
+                children.setdefault(space, set()).add(id)
+
+    affected = set()
+    pending = list(changed)
+    while pending:
+        id = pending.pop()
+        if id not in affected:
+            affected.add(id)
+            pending.extend(children.get(id, ()))
+
+    return affected
+
+
+########## Merging ###############
+def merge(base, ours, theirs):
+    '''
+    Merges two sets of edits made to the same rig.
+    Fields changed on only one side are taken from that side, and fields changed the same way on both sides are
+    kept. Fields changed differently on both sides are conflicts, which keep our value.
+    :param base: The component data both sides started from
+    :param ours: Our edited component data
+    :param theirs: Their edited component data
+    :return: A tuple of the merged component data and a list of conflict dictionaries
+    '''
+    merged = {}
+    conflicts = []
+
+    for id in _ordered_ids(base, ours, theirs):
+        b = base.get(id, _MISSING)
+        o = ours.get(id, _MISSING)
+        t = theirs.get(id, _MISSING)
+
+        if o is _MISSING and t is _MISSING:
+            continue
+
+        if o is _MISSING or t is _MISSING:
+            kept = t if o is _MISSING else o
+            if b is _MISSING:
+                # Added on one side only
+                merged[id] = copy.deepcopy(kept)
+            elif kept == b:
+                # Removed on one side, untouched on the other
+                continue
+            else:
+                conflicts.append({'id': id, 'attr': None, 'base': b,
+                                  'ours': _value(o), 'theirs': _value(t)})
+                merged[id] = copy.deepcopy(kept)
+            continue
+
+        component, componentConflicts = merge_component(id, {} if b is _MISSING else b, o, t)
+        merged[id] = component
+        conflicts.extend(componentConflicts)
+
+    _renumber(merged)
+
+    return merged, conflicts
+
+
+def merge_component(id, base, ours, theirs):
+    '''
+    Merges the fields of a single component.
+    :return: A tuple of the merged component and a list of conflict dictionaries
+    '''
+    component = {}
+    conflicts = []
+
+    for attr in _ordered_ids(base, ours, theirs):
+        b = base.get(attr, _MISSING)
+        o = ours.get(attr, _MISSING)
+        t = theirs.get(attr, _MISSING)
+
+        if o == t:
+            value = o
+        elif o == b:
+            value = t
+        elif t == b or attr == ORDER_KEY:
+            value = o
+        else:
+            conflicts.append({'id': id, 'attr': attr, 'base': _value(b), 'ours': _value(o), 'theirs': _value(t)})
+            value = o
+
+        if value is not _MISSING:
+            component[attr] = copy.deepcopy(value)
+
+    return component, conflicts
+
+
+########## Private Functions ###############
+def _ordered_ids(*dicts):
+    # Every key of the dictionaries, in a stable order
+    keys = []
+    seen = set()
+    for d in dicts:
+        for key in d:
+            if key not in seen:
+                seen.add(key)
+                keys.append(key)
+    return keys
+
+
+def _value(value):
+    return None if value is _MISSING else value
+
+
+def _order(componentData):
+    # The ids of the components, sorted by index
+    return sorted(componentData, key=lambda id: (componentData[id].get(ORDER_KEY, len(componentData)), id))
+
+
+def _longest_increasing(ids, positions):
+    # The largest set of ids whose positions already increase, found by patience sorting in n log n
+    tails = []
+    previous = {}
+    for id in ids:
+        position = positions[id]
+        low, high = 0, len(tails)
+        while low < high:
+            middle = (low + high) // 2
+            if positions[tails[middle]] < position:
+                low = middle + 1
+            else:
+                high = middle
+        previous[id] = tails[low - 1] if low else None
+        if low == len(tails):
+            tails.append(id)
+        else:
+            tails[low] = id
+
+    kept = set()
+    id = tails[-1] if tails else None
+    while id is not None:
+        kept.add(id)
+        id = previous[id]
+    return kept
+
+
+def _place(order, id, after):
+    # Moves an id to just after another in the order, or to the front when after is None
+    # An id following a component that no longer exists keeps its place, or goes last if it is new
+    if id in order:
+        if after is not None and after not in order:
+            return
+        order.remove(id)
+
+    if after is None:
+        order.insert(0, id)
+    elif after in order:
+        order.insert(order.index(after) + 1, id)
+    else:
+        order.append(id)
+
+
+def _renumber(componentData):
+    # Keep indexes a sequence from 1, after components were added or removed on either side
+    for index, id in enumerate(_order(componentData)):
+        if ORDER_KEY in componentData[id]:
+            componentData[id][ORDER_KEY] = index + 1
+
+
+def _load(path):
+    componentData, shapes = rigfile.load_lazy(path)
+    return shapes.expand_components(componentData), shapes
+
+
+def _describe(change, componentData):
+    component = componentData.get(change['id'], {})
+    name = component.get('name', change['id'])
+    if change['op'] == 'add':
+        return '+ %s (%s)' % (change['value'].get('name', change['id']), change['value'].get('type'))
+    if change['op'] == 'remove':
+        return '- %s' % name
+    if change['op'] == 'move':
+        if change['after'] is None:
+            return '~ %s moved to the top' % name
+        return '~ %s moved after %s' % (name, componentData.get(change['after'], {}).get('name', change['after']))
+    if change['op'] == 'unset':
+        return '  %s.%s removed' % (name, change['attr'])
+    if change['attr'] in rigfile.SHAPE_FIELDS:
+        return '  %s.%s changed' % (name, change['attr'])
+    return '  %s.%s = %s' % (name, change['attr'], json.dumps(change['value']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Diff two rig files, or merge three.')
+    parser.add_argument('base', help='The original rig file')
+    parser.add_argument('ours', help='The changed rig file, or our side of a merge')
+    parser.add_argument('theirs', nargs='?', help='Their side of a merge')
+    parser.add_argument('--output', help='Where to save the merged rig, defaults to our rig file when there are '
+                                         'no conflicts')
+    args = parser.parse_args(argv)
+
+    base, _ = _load(args.base)
+    ours, shapes = _load(args.ours)
+
+    if args.theirs is None:
+        for change in diff(base, ours):
+            print _describe(change, base)
+        return 0
+
+    theirs, _ = _load(args.theirs)
+    merged, conflicts = merge(base, ours, theirs)
+
+    for conflict in conflicts:
+        name = merged.get(conflict['id'], {}).get('name', conflict['id'])
+        print 'CONFLICT %s%s' % (name, '.' + conflict['attr'] if conflict['attr'] else '')
+
+    # A conflicted merge would overwrite our rig with values picked for us, so it is only saved somewhere else
+    if conflicts and not args.output:
+        print 'Not saved, resolve the conflicts or pass --output to save the merge with our values'
+        return 1
+
+    rigfile.save(args.output or args.ours, merged, rigfile.ShapeTable(precision=shapes.precision))
+
+    return 1 if conflicts else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,454 @@
+import os
+import sys
+import json
+import zlib
+import hashlib
+import struct
+import array
+import collections
+
+import rigschema
+
+
+JSON_EXTENSION = '.json'
+BINARY_EXTENSION = '.rigb'
+
+# Magic, format version, metadata size, float count
+_MAGIC = 'RIGB'
+_VERSION = 1
+_HEADER = struct.Struct('<4sHII')
+
+# Component fields holding a list of control shapes, stored by reference in the shape table
+SHAPE_FIELDS = ('mainControlData',)
+
+# The number of decimal places curve data is saved with, which keeps every value within 0.00005 of the original
+# Rig files saved before precision existed keep their curves at full precision, which is a precision of None
+DEFAULT_PRECISION = 4
+
+
+class RigFileError(ValueError):
+    pass
+
+
+########## Reading and Writing ###############
+def is_binary(path):
+    return os.path.splitext(path)[1].lower() == BINARY_EXTENSION
+
+
+def load(path):
+    '''
+    Loads rig data from a file, picking the format from the extension.
+    :param path: The path to a .json or .rigb file
+    :return: The component data dictionary
+    '''
+    componentData, shapes = load_lazy(path)
+    return shapes.expand_components(componentData)
+
+
+def load_lazy(path):
+    '''
+    Loads rig data from a file without expanding any control shapes.
+    Shape fields in the component data keep their hashes until they are expanded by the shape table.
+    Files saved at an older schema version are migrated, files at the current version are used as is.
+    Only the curves are deferred, the rest of the component data is read up front. Json files are still parsed in
+    full, so they skip creating cv lists but not reading them. Binary files keep their curves as one packed array
+    until a shape is expanded.
+    :param path: The path to a .json or .rigb file
+    :return: A tuple with the component data dictionary and its ShapeTable
+    '''
+    componentData, shapes, version = read(path)
+
+    if version != rigschema.SCHEMA_VERSION:
+        if version > rigschema.SCHEMA_VERSION:
+            raise RigFileError('Rig file version %s is newer than the supported version %s'
+                               % (version, rigschema.SCHEMA_VERSION))
+        rigschema.upgrade(componentData, version)
+
+    return componentData, shapes
+
+
+def read(path):
+    '''
+    Reads rig data from a file exactly as it was saved, without migrating it.
+    :param path: The path to a .json or .rigb file
+    :return: A tuple with the component data dictionary, its ShapeTable and the schema version it was saved at
+    '''
+    if is_binary(path):
+        with open(path, 'rb') as f:
+            contents, floats = _read_binary(f.read())
+    else:
+        with open(path) as f:
+            contents = _load_json(f)
+        floats = None
+
+    # Files saved before the shape table existed hold their shapes inline, and have no version
+    if not is_packed(contents):
+        return _unpack(contents, floats), ShapeTable(precision=None), 0
+
+    shapes = ShapeTable(contents['shapes'], floats, precision=contents.get('precision'))
+    return _unpack(contents['componentData'], floats), shapes, contents.get('version', 0)
+
+
+def save(path, data, shapes=None):
+    '''
+    Saves rig data to a file, picking the format from the extension.
+    :param path: The path to a .json or .rigb file
+    :param data: The component data dictionary
+    :param shapes: The ShapeTable for any shape hashes left in the component data, its precision is used for
+        every curve saved
+    '''
+    precision = shapes.precision if shapes is not None else None
+
+    renamed = {}
+    contents = _pack_shapes(data, shapes, precision, renamed)
+    contents['version'] = rigschema.SCHEMA_VERSION
+    contents['precision'] = precision
+
+    if is_binary(path):
+        with open(path, 'wb') as f:
+            f.write(dumps(contents))
+    else:
+        with open(path, 'w') as f:
+            json.dump(contents, f, indent=4)
+
+    # The table now matches the file, so the next save at this precision doesn't quantize the shapes again
+    if shapes is not None:
+        shapes.mark_saved(contents['shapes'], renamed, precision)
+
+
+def replace(source, destination):
+    '''
+    Moves a file over another, used to swap in a file that was written to a temporary path.
+    '''
+    try:
+        os.rename(source, destination)
+    except OSError:
+        # Windows will not rename over an existing file
+        os.remove(destination)
+        os.rename(source, destination)
+
+
+def convert(source, destination):
+    '''
+    Converts a rig file between the json and binary formats.
+    '''
+    save(destination, load(source))
+
+
+########## Shape Table ###############
+def shape_hash(shape):
+    '''
+    Returns a hash of a control shape's contents, used as its key in the shape table.
+    '''
+    return hashlib.sha1(json.dumps(shape, sort_keys=True, separators=(',', ':'))).hexdigest()
+
+
+def pack_shapes(componentData, shapes=None, precision=None):
+    '''
+    Moves every control shape into a table keyed by content hash, so identical shapes are only stored once.
+    :param componentData: The component data dictionary
+    :param shapes: The ShapeTable for any shape hashes already in the component data
+    :param precision: The number of decimal places to round curve data to, or None to keep full precision
+    :return: A dictionary with the component data, where shapes are replaced by their hash, and the shape table
+    '''
+    return _pack_shapes(componentData, shapes, precision, {})
+
+
+def unpack_shapes(contents):
+    '''
+    Replaces every shape hash in the file contents with its shape.
+    Each unique shape is only expanded once and shared by every component referencing it.
+    Files saved before the shape table existed are returned unchanged.
+    :param contents: The file contents, as returned by pack_shapes
+    :return: The component data dictionary
+    '''
+    if not is_packed(contents):
+        return contents
+
+    return ShapeTable(contents['shapes']).expand_components(contents['componentData'])
+
+
+def quantize(value, precision):
+    '''
+    Rounds every float in curve data to a number of decimal places.
+    Each value moves by at most half of the last decimal place, and values that round to zero are stored as 0.0.
+    :param value: Curve data, or any list or dictionary of it
+    :param precision: The number of decimal places, or None to leave the data unchanged
+    :return: The rounded copy of the data
+    '''
+    if precision is None:
+        return value
+    if isinstance(value, float):
+        value = round(value, precision)
+        # Snap -0.0 to 0.0, so noise around zero doesn't produce different hashes
+        return value if value != 0.0 else 0.0
+    if isinstance(value, list):
+        return [quantize(item, precision) for item in value]
+    if isinstance(value, dict):
+        return dict((key, quantize(item, precision)) for key, item in value.iteritems())
+    return value
+
+
+def is_packed(contents):
+    return isinstance(contents, dict) and 'componentData' in contents and 'shapes' in contents
+
+
+def _pack_shapes(componentData, shapes, precision, renamed):
+    # Fills renamed with the hashes that changed because their shape was quantized to a new precision
+    table = {}
+    components = {}
+
+    for id, component in componentData.iteritems():
+        component = dict(component)
+        for field in SHAPE_FIELDS:
+            if isinstance(component.get(field), list):
+                component[field] = [_add_shape(shape, table, shapes, precision, renamed)
+                                    for shape in component[field]]
+        components[id] = component
+
+    return {'componentData': components, 'shapes': table}
+
+
+def _add_shape(shape, table, shapes, precision, renamed):
+    # Controls without a custom shape are stored as None and left as is
+    if shape is None:
+        return None
+
+    reference = None
+    if _is_shape_ref(shape):
+        # A hash can only be saved with the table that holds its shape
+        if shapes is None or shape not in shapes:
+            raise RigFileError('Control shape %s is not in the shape table' % shape)
+
+        # Shapes already stored at this precision are copied over under the hash they already have
+        key = shapes.key(shape)
+        if precision is None or shapes.stored_precision(key) == precision:
+            table.setdefault(key, shapes.get(key))
+            return key
+
+        reference = shape
+        shape = shapes.get(key)
+
+    # Rounding before hashing also merges shapes that only differed by float noise
+    shape = quantize(shape, precision)
+    key = shape_hash(shape)
+    table.setdefault(key, shape)
+
+    if reference is not None and reference != key:
+        renamed[reference] = key
+    return key
+
+
+def _is_shape_ref(shape):
+    return isinstance(shape, basestring)
+
+
+class ShapeTable(object):
+    '''
+    The control shapes of a rig file, keyed by hash.
+    Shapes are only expanded into cv and knot lists the first time they are asked for,
+    and every component referencing a shape shares the same expanded copy.
+    The precision is the rig's setting for how many decimal places its curves are saved with.
+    Saving at a new precision adds the quantized shapes to the table, and the old hashes lead to them.
+    '''
+    def __init__(self, shapes=None, floats=None, precision=DEFAULT_PRECISION):
+        self._shapes = shapes or {}
+        self._floats = floats
+        self._expanded = {}
+
+        self.precision = precision
+
+        # The precision the shapes in the table were last saved at
+        self.storedPrecision = precision
+
+        # Shapes still stored at an older precision, keyed by hash
+        self._olderPrecisions = {}
+
+        # Hashes replaced by a save at a new precision, mapped to the hash of the quantized shape
+        self._renamed = {}
+
+    def key(self, key):
+        '''
+        Returns the hash a shape is stored under, following any save that quantized it to a new precision.
+        '''
+        return self._renamed.get(key, key)
+
+    def get(self, key):
+        key = self._renamed.get(key, key)
+        try:
+            return self._expanded[key]
+        except KeyError:
+            shape = _unpack(self._shapes[key], self._floats)
+            self._expanded[key] = shape
+            return shape
+
+    def stored_precision(self, key):
+        '''
+        :return: The precision a shape in the table was saved at.
+        '''
+        return self._olderPrecisions.get(self.key(key), self.storedPrecision)
+
+    def mark_saved(self, table, renamed, precision):
+        '''
+        Records the shapes just written to a file, so the next save doesn't quantize them again.
+        :param table: The saved shape table, keyed by hash
+        :param renamed: The hashes that changed because their shape was quantized, mapped to the new hash
+        :param precision: The precision the shapes were saved at
+        '''
+        if precision != self.storedPrecision:
+            # Shapes this save didn't write keep the precision they were stored at
+            for key in self._shapes:
+                if key not in table:
+                    self._olderPrecisions.setdefault(key, self.storedPrecision)
+            self.storedPrecision = precision
+
+        for key, shape in table.iteritems():
+            if key not in self._shapes:
+                self._shapes[key] = shape
+                self._expanded[key] = shape
+            self._olderPrecisions.pop(key, None)
+
+        for reference, key in renamed.iteritems():
+            self._renamed[reference] = key
+
+    def expand(self, shapes):
+        '''
+        Returns a list of shapes with every hash replaced by its shape.
+        '''
+        if not isinstance(shapes, list):
+            return shapes
+        return [self.get(shape) if _is_shape_ref(shape) else shape for shape in shapes]
+
+    def expand_component(self, component):
+        '''
+        Returns a copy of a component's data with its shape fields expanded.
+        '''
+        component = dict(component)
+        for field in SHAPE_FIELDS:
+            if field in component:
+                component[field] = self.expand(component[field])
+        return component
+
+    def expand_components(self, componentData):
+        return dict((id, self.expand_component(component)) for id, component in componentData.iteritems())
+
+    def __contains__(self, key):
+        return self.key(key) in self._shapes
+
+    def __len__(self):
+        return len(self._shapes)
+
+
+########## Binary Format ###############
+def dumps(data):
+    '''
+    Packs rig data into the binary format.
+    The component data is stored as compressed compact json, with the cvs and knots of every curve
+    moved into a single packed array of doubles that the json refers to by offset.
+    :param data: The component data dictionary
+    :return: The file contents as a byte string
+    '''
+    floats = array.array('d')
+    metadata = zlib.compress(json.dumps(_pack(data, floats), separators=(',', ':')))
+
+    if sys.byteorder != 'little':
+        floats.byteswap()
+
+    return _HEADER.pack(_MAGIC, _VERSION, len(metadata), len(floats)) + metadata + floats.tostring()
+
+
+def loads(contents):
+    '''
+    Unpacks rig data from the binary format.
+    :param contents: The file contents as a byte string
+    :return: The component data dictionary
+    '''
+    metadata, floats = _read_binary(contents)
+    return _unpack(metadata, floats)
+
+
+########## Private Functions ###############
+def _load_json(f):
+    # Parses a json file, keeping the outermost object in the order it was written
+    # Old rig files hold their components at the top, and components without an index are migrated in file order
+    # Every other object is a plain dictionary, so the order costs next to nothing
+    outermost = []
+
+    def keepPairs(pairs):
+        # Objects are finished innermost first, so the outermost object is always the last one
+        outermost[:] = [pairs]
+        return dict(pairs)
+
+    contents = json.load(f, object_pairs_hook=keepPairs)
+    if isinstance(contents, dict):
+        return collections.OrderedDict(outermost[0])
+    return contents
+
+
+def _read_binary(contents):
+    # Returns the json metadata and the packed float array, without expanding any curves
+    if len(contents) < _HEADER.size:
+        raise RigFileError('File is too small to be a binary rig file')
+
+    magic, version, metadataSize, floatCount = _HEADER.unpack_from(contents)
+    if magic != _MAGIC:
+        raise RigFileError('File is not a binary rig file')
+    if version > _VERSION:
+        raise RigFileError('Binary rig file version %s is newer than the supported version %s' % (version, _VERSION))
+
+    start = _HEADER.size + metadataSize
+    if len(contents) != start + floatCount * 8:
+        raise RigFileError('Binary rig file is truncated')
+
+    floats = array.array('d')
+    floats.fromstring(contents[start:])
+    if sys.byteorder != 'little':
+        floats.byteswap()
+
+    # A corrupt file raises the same error as a bad header, rather than zlib's own
+    try:
+        metadata = json.loads(zlib.decompress(contents[_HEADER.size:start]))
+    except zlib.error as e:
+        raise RigFileError('Binary rig file is corrupt: %s' % e)
+
+    return metadata, floats
+
+
+def _is_curve(value):
+    # Only curves made entirely of floats are packed, so ints survive a round trip unchanged
+    return (isinstance(value, dict) and set(value) == {'cvs', 'knots', 'degree'}
+            and all(type(k) is float for k in value['knots'])
+            and all(len(cv) == 3 and all(type(p) is float for p in cv) for cv in value['cvs']))
+
+
+def _pack(value, floats):
+    if _is_curve(value):
+        cvOffset = len(floats)
+        for cv in value['cvs']:
+            floats.extend(cv)
+        knotOffset = len(floats)
+        floats.extend(value['knots'])
+        return {'degree': value['degree'],
+                'packed': [cvOffset, len(value['cvs']), knotOffset, len(value['knots'])]}
+    if isinstance(value, dict):
+        return dict((key, _pack(item, floats)) for key, item in value.iteritems())
+    if isinstance(value, list):
+        return [_pack(item, floats) for item in value]
+    return value
+
+
+def _unpack(value, floats):
+    if floats is None:
+        return value
+    if isinstance(value, dict):
+        if set(value) == {'degree', 'packed'}:
+            cvOffset, cvCount, knotOffset, knotCount = value['packed']
+            points = floats[cvOffset:cvOffset + cvCount * 3].tolist()
+            return {'degree': value['degree'],
+                    'cvs': [points[i:i + 3] for i in range(0, len(points), 3)],
+                    'knots': floats[knotOffset:knotOffset + knotCount].tolist()}
+        return dict((key, _unpack(item, floats)) for key, item in value.iteritems())
+    if isinstance(value, list):
+        return [_unpack(item, floats) for item in value]
+    return value
+
@@ -0,0 +1,303 @@
+import os
+import copy
+import json
+import logging
+import threading
+import Queue
+
+import rigfile
+
+
+JOURNAL_EXTENSION = '.journal'
+AUTOSAVE_SUFFIX = '.autosave'
+
+# The journal is compacted into a snapshot after this many entries, or after this many seconds without edits
+COMPACT_EVERY = 200
+COMPACT_INTERVAL = 30.0
+
+logger = logging.getLogger(__name__)
+
+
+########## Paths ###############
+def journal_path(path):
+    return path + JOURNAL_EXTENSION
+
+
+def snapshot_path(path):
+    root, ext = os.path.splitext(path)
+    return root + AUTOSAVE_SUFFIX + (ext or rigfile.JSON_EXTENSION)
+
+
+########## Recovery ###############
+def has_recovery(path):
+    '''
+    :return: True if there are autosaved edits for a rig file that were never saved.
+    '''
+    try:
+        return os.path.getsize(journal_path(path)) > 0 or os.path.exists(snapshot_path(path))
+    except OSError:
+        return os.path.exists(snapshot_path(path))
+
+
+def recover(path):
+    '''
+    Rebuilds the component data of a rig from its last snapshot and the journal written after it.
+    Falls back to the rig file itself when there is no snapshot.
+    :param path: The path of the rig file
+    :return: A tuple with the component data dictionary and its ShapeTable
+    '''
+    if os.path.exists(snapshot_path(path)):
+        componentData, shapes = rigfile.load_lazy(snapshot_path(path))
+    elif os.path.exists(path):
+        componentData, shapes = rigfile.load_lazy(path)
+    else:
+        componentData, shapes = {}, rigfile.ShapeTable()
+
+    try:
+        with open(journal_path(path)) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A crash can leave the last entry half written
+                    break
+                apply_entry(componentData, entry)
+    except IOError:
+        pass
+
+    return componentData, shapes
+
+
+def find_recoveries(directory):
+    '''
+    Finds every rig with autosaved edits in a folder, such as the autosaves of rigs that were never saved.
+    :param directory: The folder holding the autosaves
+    :return: A sorted list of rig file paths that have a recovery
+    '''
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+
+    paths = set()
+    for name in names:
+        path = os.path.join(directory, name)
+        if name.endswith(JOURNAL_EXTENSION):
+            path = path[:-len(JOURNAL_EXTENSION)]
+        else:
+            root, ext = os.path.splitext(path)
+            if not root.endswith(AUTOSAVE_SUFFIX):
+                continue
+            path = root[:-len(AUTOSAVE_SUFFIX)] + ext
+
+        if has_recovery(path):
+            paths.add(path)
+
+    return sorted(paths)
+
+
+def discard(path):
+    '''
+    Removes the journal and snapshot for a rig file.
+    '''
+    for autosave in (journal_path(path), snapshot_path(path)):
+        try:
+            os.remove(autosave)
+        except OSError:
+            pass
+
+
+def apply_entry(componentData, entry):
+    '''
+    Applies a single journal entry to a component data dictionary.
+    Entries only ever replace values, so replaying entries that are already applied is harmless.
+    '''
+    op = entry['op']
+    if op == 'set':
+        try:
+            componentData[entry['id']][entry['attr']] = entry['value']
+        except KeyError:
+            pass
+    elif op == 'add':
+        componentData[entry['id']] = entry['value']
+    elif op == 'remove':
+        componentData.pop(entry['id'], None)
+
+
+########## Journal ###############
+class RigJournal(object):
+    '''
+    Records edits to a rig as an append only journal, written next to the rig file by a background thread.
+    Edits are found by comparing component data against the last recorded state, so only changed values
+    are written. The background thread keeps its own copy of the rig, which it periodically writes out
+    as a full snapshot before truncating the journal.
+    A new journal replaces any autosave already at its path. With snapshot set, the starting state is written
+    as the snapshot, for rigs that hold edits their file doesn't, otherwise the old autosave is removed.
+    '''
+    def __init__(self, path, componentData, shapes=None, snapshot=False, compactEvery=COMPACT_EVERY,
+                 compactInterval=COMPACT_INTERVAL):
+        self.path = path
+        self.compactEvery = compactEvery
+        self.compactInterval = compactInterval
+
+        # The state the journal has recorded, used to find changes on the main thread
+        self._state = copy.deepcopy(componentData)
+
+        # The background thread's copy of the rig, only touched by that thread
+        self._replica = copy.deepcopy(componentData)
+        self._shapes = shapes if shapes is not None else rigfile.ShapeTable()
+        self._entries = 0
+
+        self._queue = Queue.Queue()
+        self._queue.put(('start', snapshot))
+        self._thread = threading.Thread(target=self._run, name='RigJournal')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def update(self, componentData):
+        '''
+        Records every difference between the component data and the last recorded state.
+        Use after structural changes, such as adding, removing or moving components.
+        '''
+        for id in list(self._state):
+            if id not in componentData:
+                del self._state[id]
+                self._put({'op': 'remove', 'id': id})
+
+        for id, component in componentData.iteritems():
+            if id not in self._state:
+                self._state[id] = copy.deepcopy(component)
+                self._put({'op': 'add', 'id': id, 'value': copy.deepcopy(component)})
+            else:
+                for attr, value in component.iteritems():
+                    self.updateValue(id, attr, value)
+
+    def updateValue(self, id, attr, value):
+        '''
+        Records a single component value if it differs from the last recorded state.
+        '''
+        try:
+            state = self._state[id]
+        except KeyError:
+            return
+
+        if attr in state and state[attr] == value:
+            return
+
+        state[attr] = copy.deepcopy(value)
+        self._put({'op': 'set', 'id': id, 'attr': attr, 'value': state[attr]})
+
+    def save(self, path, componentData, shapes=None, onSaved=None):
+        '''
+        Writes the rig file, then removes the autosave.
+        The file is written by the background thread after any entries still queued, this returns straight away.
+        If the file could not be written, the autosave is kept.
+        :param onSaved: An optional function, called on the background thread once the save is done,
+            with the error that stopped it or None
+        '''
+        self.update(componentData)
+
+        self._queue.put(('save', (path, copy.deepcopy(componentData), shapes, onSaved)))
+
+    def flush(self):
+        '''
+        Blocks until every queued entry is written.
+        '''
+        self._queue.join()
+
+    def close(self, discard=False):
+        '''
+        Writes every queued entry and stops the background thread, optionally removing the autosave.
+        '''
+        if not self._thread.is_alive():
+            return
+
+        self._queue.put(('close', discard))
+        self._thread.join()
+
+    #### Private Methods ####
+
+    def _put(self, entry):
+        self._queue.put(('entry', entry))
+
+    def _run(self):
+        while True:
+            try:
+                task, value = self._queue.get(timeout=self.compactInterval)
+            except Queue.Empty:
+                if self._entries:
+                    try:
+                        self._compact()
+                    except (IOError, OSError, TypeError, ValueError):
+                        logger.exception('Could not autosave %s', self.path)
+                continue
+
+            try:
+                if task == 'entry':
+                    self._append(value)
+                elif task == 'save':
+                    path, componentData, shapes, onSaved = value
+                    try:
+                        self._save(path, componentData, shapes)
+                        error = None
+                    except (IOError, OSError, TypeError, ValueError) as e:
+                        # Handed back to the caller, which reports it
+                        error = e
+                    if onSaved is not None:
+                        onSaved(error)
+                elif task == 'start':
+                    if value:
+                        self._compact()
+                    else:
+                        discard(self.path)
+                elif task == 'close':
+                    if value:
+                        discard(self.path)
+                    elif self._entries:
+                        self._compact()
+                    return
+            except (IOError, OSError, TypeError, ValueError):
+                # The autosave must never take down the session, the next compaction will try again
+                logger.exception('Could not autosave %s', self.path)
+            finally:
+                self._queue.task_done()
+
+    def _append(self, entry):
+        apply_entry(self._replica, entry)
+        self._makeDirectory()
+
+        with open(journal_path(self.path), 'a') as f:
+            f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+
+        self._entries += 1
+        if self._entries >= self.compactEvery:
+            self._compact()
+
+    def _makeDirectory(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _compact(self):
+        self._makeDirectory()
+
+        # Write the snapshot to a temporary file first, so a crash never leaves a broken snapshot
+        snapshot = snapshot_path(self.path)
+        root, ext = os.path.splitext(snapshot)
+        temp = root + '.tmp' + ext
+        rigfile.save(temp, self._replica, self._shapes)
+        rigfile.replace(temp, snapshot)
+
+        open(journal_path(self.path), 'w').close()
+        self._entries = 0
+
+    def _save(self, path, componentData, shapes):
+        rigfile.save(path, componentData, shapes)
+
+        self._replica = componentData
+        self._shapes = shapes if shapes is not None else self._shapes
+        self._entries = 0
+
+        # Only the journal of this rig file is replaced by the save
+        if path == self.path:
+            discard(self.path)
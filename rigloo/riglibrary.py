@@ -0,0 +1,263 @@
+import os
+import hashlib
+import sqlite3
+
+import rigfile
+
+
+RIG_EXTENSIONS = (rigfile.JSON_EXTENSION, rigfile.BINARY_EXTENSION)
+
+# Bump this when the tables change, older indexes are rebuilt from scratch
+SCHEMA_VERSION = 1
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS folders (
+    path TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS rigs (
+    path TEXT PRIMARY KEY,
+    name TEXT,
+    mtime REAL,
+    size INTEGER,
+    hash TEXT,
+    componentCount INTEGER
+);
+CREATE TABLE IF NOT EXISTS components (
+    path TEXT,
+    id TEXT,
+    type TEXT,
+    name TEXT
+);
+CREATE TABLE IF NOT EXISTS targets (
+    path TEXT,
+    componentId TEXT,
+    target TEXT
+);
+CREATE INDEX IF NOT EXISTS componentsByPath ON components (path);
+CREATE INDEX IF NOT EXISTS componentsByType ON components (type);
+CREATE INDEX IF NOT EXISTS targetsByPath ON targets (path);
+CREATE INDEX IF NOT EXISTS targetsByComponent ON targets (path, componentId);
+CREATE INDEX IF NOT EXISTS targetsByTarget ON targets (target);
+'''
+
+
+class RigLibrary(object):
+    '''
+    An on disk index of every rig file in a set of library folders.
+    Each rig is indexed by name, file hash and modification time, along with the type, name and targets
+    of its components. Rescanning only parses files whose modification time or size changed.
+    '''
+    def __init__(self, indexPath):
+        self.indexPath = indexPath
+
+        directory = os.path.dirname(indexPath)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self._connection = sqlite3.connect(indexPath)
+        self._createTables()
+
+    #### Folders ####
+
+    @property
+    def folders(self):
+        return [row[0] for row in self._connection.execute('SELECT path FROM folders ORDER BY path')]
+
+    def addFolder(self, folder):
+        with self._connection:
+            self._connection.execute('INSERT OR IGNORE INTO folders VALUES (?)', (os.path.normpath(folder),))
+
+    def removeFolder(self, folder):
+        folder = os.path.normpath(folder)
+        with self._connection:
+            self._connection.execute('DELETE FROM folders WHERE path = ?', (folder,))
+            for path in self._indexedPaths(folder):
+                self._removeRig(path)
+
+    #### Indexing ####
+
+    def scan(self):
+        '''
+        Brings the index up to date with every library folder.
+        :return: A tuple with the number of rigs that were reindexed and the number that were removed
+        '''
+        updated = 0
+        removed = 0
+
+        with self._connection:
+            for folder in self.folders:
+                prefix = os.path.join(folder, '')
+                stamps = dict((row[0], (row[1], row[2])) for row in self._connection.execute(
+                    'SELECT path, mtime, size FROM rigs WHERE substr(path, 1, ?) = ?', (len(prefix), prefix)))
+
+                seen = set()
+                for path in self._rigFiles(folder):
+                    seen.add(path)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+
+                    if stamps.get(path) != (stat.st_mtime, stat.st_size):
+                        if self._indexRig(path, stat):
+                            updated += 1
+
+                for path in set(stamps) - seen:
+                    self._removeRig(path)
+                    removed += 1
+
+        return updated, removed
+
+    #### Searching ####
+
+    def search(self, name=None, componentType=None, target=None, limit=1000):
+        '''
+        Finds rigs matching every given filter.
+        :param name: A pattern for the rig name, case insensitive, * matches anything
+        :param componentType: The type of a component the rig must have
+        :param target: A glob pattern for a joint targeted by that component, such as *_thigh_L
+        :param limit: The maximum number of rigs to return
+        :return: A list of (name, path, componentCount) tuples, sorted by name
+        '''
+        query = ['SELECT DISTINCT rigs.name, rigs.path, rigs.componentCount FROM rigs']
+        clauses = []
+        args = []
+
+        if componentType or target:
+            query.append('JOIN components ON components.path = rigs.path')
+        if target:
+            query.append('JOIN targets ON targets.path = components.path AND targets.componentId = components.id')
+
+        if name:
+            if '*' not in name:
+                name = '*' + name + '*'
+            clauses.append("rigs.name LIKE ? ESCAPE '\\'")
+            args.append(name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_').replace('*', '%'))
+        if componentType:
+            clauses.append('components.type = ?')
+            args.append(componentType)
+        if target:
+            clauses.append('targets.target GLOB ?')
+            args.append(target)
+
+        if clauses:
+            query.append('WHERE ' + ' AND '.join(clauses))
+        query.append('ORDER BY rigs.name LIMIT ?')
+        args.append(limit)
+
+        return [tuple(row) for row in self._connection.execute(' '.join(query), args)]
+
+    def componentTypes(self):
+        return [row[0] for row in self._connection.execute('SELECT DISTINCT type FROM components ORDER BY type')]
+
+    def rigInfo(self, path):
+        '''
+        :return: A dictionary with the indexed data for a rig file, or None if it is not indexed.
+        '''
+        row = self._connection.execute(
+            'SELECT name, mtime, size, hash, componentCount FROM rigs WHERE path = ?', (path,)).fetchone()
+        if row is None:
+            return None
+
+        return {
+            'name': row[0],
+            'mtime': row[1],
+            'size': row[2],
+            'hash': row[3],
+            'componentCount': row[4],
+            'componentTypes': [r[0] for r in self._connection.execute(
+                'SELECT type FROM components WHERE path = ?', (path,))],
+            'targets': [r[0] for r in self._connection.execute(
+                'SELECT DISTINCT target FROM targets WHERE path = ?', (path,))]
+        }
+
+    def close(self):
+        self._connection.close()
+
+    #### Private Methods ####
+
+    def _createTables(self):
+        version = self._connection.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            with self._connection:
+                for table in ('rigs', 'components', 'targets'):
+                    self._connection.execute('DROP TABLE IF EXISTS ' + table)
+
+        self._connection.executescript(SCHEMA)
+        self._connection.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+
+    def _rigFiles(self, folder):
+        for root, _, files in os.walk(folder):
+            for filename in files:
+                base, ext = os.path.splitext(filename)
+                # Skip autosave snapshots and their temporary files
+                if ext.lower() in RIG_EXTENSIONS and not base.endswith(('.autosave', '.tmp')):
+                    yield os.path.join(root, filename)
+
+    def _indexedPaths(self, folder):
+        prefix = os.path.join(folder, '')
+        return [row[0] for row in self._connection.execute(
+            'SELECT path FROM rigs WHERE substr(path, 1, ?) = ?', (len(prefix), prefix))]
+
+    def _indexRig(self, path, stat):
+        try:
+            with open(path, 'rb') as f:
+                fileHash = hashlib.sha1(f.read()).hexdigest()
+        except IOError:
+            return False
+
+        # A file that was only touched keeps its index, only the stamp is updated
+        row = self._connection.execute('SELECT hash FROM rigs WHERE path = ?', (path,)).fetchone()
+        if row is not None and row[0] == fileHash:
+            self._connection.execute('UPDATE rigs SET mtime = ?, size = ? WHERE path = ?',
+                                     (stat.st_mtime, stat.st_size, path))
+            return False
+
+        try:
+            # Control shapes are never needed for the index, so they are left unexpanded
+            componentData, _ = rigfile.load_lazy(path)
+        except (EnvironmentError, ValueError):
+            # rigfile raises RigFileError, a ValueError, for corrupt or truncated files
+            # One broken rig is indexed as empty rather than stopping the scan
+            componentData = {}
+
+        if not isinstance(componentData, dict):
+            componentData = {}
+
+        self._removeRig(path)
+
+        components = []
+        targets = []
+        for id, component in componentData.iteritems():
+            if not isinstance(component, dict):
+                continue
+            components.append((path, id, component.get('type'), component.get('name')))
+            for target in _componentTargets(component):
+                targets.append((path, id, target))
+
+        self._connection.execute('INSERT INTO rigs VALUES (?, ?, ?, ?, ?, ?)',
+                                 (path, os.path.splitext(os.path.basename(path))[0],
+                                  stat.st_mtime, stat.st_size, fileHash, len(components)))
+        self._connection.executemany('INSERT INTO components VALUES (?, ?, ?, ?)', components)
+        self._connection.executemany('INSERT INTO targets VALUES (?, ?, ?)', targets)
+
+        return True
+
+    def _removeRig(self, path):
+        for table in ('rigs', 'components', 'targets'):
+            self._connection.execute('DELETE FROM %s WHERE path = ?' % table, (path,))
+
+
+def _componentTargets(component):
+    targets = []
+
+    target = component.get('target')
+    if target:
+        targets.append(target)
+
+    bindTargets = component.get('bindTargets')
+    if isinstance(bindTargets, list):
+        targets.extend(t for t in bindTargets if t)
+
+    return targets
+
@@ -1,18 +1,28 @@
-import rigloo_tools
 import rigloo_ui as ui
-import controltools
-import pymel.core as pmc
+import rigfile
+import rigstartup
 import logging
 from Qt import QtCore, QtWidgets, QtGui
 from Qt.QtCore import Slot, Signal
 import os
+import maya.cmds as cmds
+import maya.utils
 from maya.app.general.mayaMixin import MayaQWidgetDockableMixin
 
+# Pymel and the modules built on it are slow to import, so they are imported the first time they are used
+# This lets the window open before the rig tools have loaded
+rigloo_tools = rigstartup.LazyModule('rigloo_tools', globals(),
+                                     onImport=lambda module: module.setLogLevel(LOG_LEVEL))
+controltools = rigstartup.LazyModule('controltools', globals())
+nodecache = rigstartup.LazyModule('nodecache', globals())
+pmc = rigstartup.LazyModule('pymel.core', globals())
+
 ##############################
 #          Logging           #
 ##############################
 
-file_handler = logging.FileHandler(os.path.join(os.environ['MAYA_APP_DIR'],'fossil.log'))
+# The log file is only opened once something is logged to it
+file_handler = logging.FileHandler(os.path.join(os.environ['MAYA_APP_DIR'],'fossil.log'), delay=True)
 file_handler.setFormatter(logging.Formatter('%(asctime)s : %(name)s : %(levelname)s : %(message)s'))
 file_handler.setLevel(logging.DEBUG)
 
@@ -50,7 +60,10 @@ def setLogLevel(level):
         logger.setLevel(level)
 
     ui.setLogLevel(level)
-    rigloo_tools.setLogLevel(level)
+
+    # The rig tools pick up the level when they are imported
+    if rigloo_tools.loaded:
+        rigloo_tools.setLogLevel(level)
 
 def removeLogHandlers():
 
@@ -67,7 +80,8 @@ def removeLogHandlers():
         del logger
 
     ui.removeLogHandlers()
-    rigloo_tools.removeLogHandlers()
+    if rigloo_tools.loaded:
+        rigloo_tools.removeLogHandlers()
 
 
 ##############################
@@ -75,7 +89,7 @@ def removeLogHandlers():
 ##############################
 
 def maya_api_version():
-    return int(pmc.about(api=True))
+    return int(cmds.about(api=True))
 
 ##############################
 #       Window Classes       #
@@ -145,9 +159,9 @@ class MayaComponentWindow(MayaQWidgetDockableMixin, ui.MainComponentWindow):
 
     def deleteControl(self, control):
 
-        if pmc.workspaceControl(control, q=True, exists=True):
-            pmc.workspaceControl(control, e=True, close=True)
-            pmc.deleteUI(control, control=True)
+        if cmds.workspaceControl(control, q=True, exists=True):
+            cmds.workspaceControl(control, e=True, close=True)
+            cmds.deleteUI(control, control=True)
 
     # Show window with docking ability
     def run(self):
@@ -167,7 +181,7 @@ class MayaComponentWindow(MayaQWidgetDockableMixin, ui.MainComponentWindow):
             # I'm calling it again, since the MayaQWidgetDockableMixin dose not have the option to use the "tabToControl" flag,
             # which was the only way i found i can dock my window next to the channel controls, attributes editor and modelling toolkit.
             self.show(dockable=True, area='right', floating=False)
-            pmc.workspaceControl(workspaceControlName, e=True, ttc=["AttributeEditor", -1], wp="preferred",
+            cmds.workspaceControl(workspaceControlName, e=True, ttc=["AttributeEditor", -1], wp="preferred",
                                   mw=350)
             self.raise_()
 
@@ -199,8 +213,22 @@ class MayaComponentWindow(MayaQWidgetDockableMixin, ui.MainComponentWindow):
 class ModelController(ui.ViewController):
 
     def __init__(self, *args, **kwargs):
+        # Whether the control library is being read in the background
+        self._loadingControls = False
+
         ui.ViewController.__init__(self, *args, **kwargs)
 
+        # Offer autosaves from a previous session before a new rig can replace them
+        recovered = self._recoverRigs()
+
+        if recovered is not None:
+            self._currentRig = recovered
+            self._currentRigBuilt = False
+            self.logger.debug('Recovered a rig from its autosave, setting it as the current rig')
+            self.onNewRig.emit()
+            self._refreshView()
+            return
+
         try:
             self._currentRig = self._model.activeRigs[0]
             self._currentRigBuilt = True
@@ -218,11 +246,25 @@ class ModelController(ui.ViewController):
     def setComponentValue(self, id, data):
         # This takes the data from the ui
         # And sends it to the model for storage
-        self.logger.debug('Updating component data for %s', data['name'])
+        self.logger.debug('Updating %s for component %s', data.keys(), id)
 
         for argument, value in data.iteritems():
             self._model.setComponentValue(self._currentRig, id, argument, value)
 
+    @Slot(dict)
+    def updateComponents(self, data):
+        # Applies a batch of edits from the ui as one update
+        # Then refreshes the view once for the whole batch
+        self.logger.debug('Updating component data for %d components', len(data))
+
+        changed = False
+        for id, values in data.iteritems():
+            if self._model.setComponentValues(self._currentRig, id, values):
+                changed = True
+
+        if changed:
+            self._refreshView()
+
     @Slot(str)
     def addComponent(self, componentType):
         # Tells the model to add a new component
@@ -266,21 +308,28 @@ class ModelController(ui.ViewController):
         selected = pmc.selected()
         oldData = self.componentData[id]
 
+        # The selection is already resolved, so store it for the components that will use it
+        for target in selected:
+            nodecache.remember(target)
+
+        # New values are built rather than changing the model's data in place, so the model sees the change
+        values = {}
+
         try:
             nameData = [target.name() for target in selected if
                         target not in oldData['bindTargets'] and isinstance(target, pmc.nodetypes.DagNode)]
 
-            oldData['bindTargets'].extend(nameData)
+            values['bindTargets'] = oldData['bindTargets'] + nameData
         except KeyError:
             try:
                 nameData = [target.name() for target in selected if isinstance(target, pmc.nodetypes.DagNode)]
-                oldData['target'] = nameData[0]
+                values['target'] = nameData[0]
                 self.logger.info('No deform targets found in data for %s, instead adding a target', self.componentData[id])
             except IndexError:
                 self.logger.info('Looks like nothing is selected, ignoring add selected.')
                 pass
 
-        self.setComponentValue(id, oldData)
+        self.setComponentValue(id, values)
 
         self._refreshView()
 
@@ -291,6 +340,10 @@ class ModelController(ui.ViewController):
 
         self.logger.debug('Creating a new rig')
 
+        if self._task is not None:
+            self._showError('Cancel or finish the running build before creating a new rig.', title='Rig Busy')
+            return
+
         self._currentRig = self._model.createRig()
         self.onNewRig.emit()
         self._refreshView()
@@ -301,26 +354,106 @@ class ModelController(ui.ViewController):
         # Tells the model to load the specified rig
         # tells the view to show the componentData and refresh the components
         self.logger.debug('Loading a rig from %s', directory)
-        self._currentRig = self._model.loadRig(directory)
+
+        # The library dialog can still ask for a rig while a build runs
+        if self._task is not None:
+            self._showError('Cancel or finish the running build before loading a rig.', title='Rig Busy')
+            return
+
+        # If the rig has autosaved edits that were never saved, offer to recover them
+        if self._model.hasRecovery(directory):
+            answer = QtWidgets.QMessageBox.question(self._window, 'Recover Rig',
+                                                    'This rig has unsaved changes from a previous session. Recover them?',
+                                                    QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No)
+            if answer == QtWidgets.QMessageBox.Yes:
+                self._currentRig = self._model.recoverRig(directory)
+            else:
+                self._model.discardRecovery(directory)
+                self._currentRig = self._model.loadRig(directory)
+        else:
+            self._currentRig = self._model.loadRig(directory)
         self._currentRigBuilt = False
         self.onNewRig.emit()
         self._refreshView()
 
+    @Slot()
+    def openLibrary(self):
+        # Shows the rig library dialog, rescanning any library files that changed
+        self.logger.debug('Opening the rig library')
+
+        dialog = ui.RigLibraryDialog(self._window)
+        dialog.onSearch.connect(self.searchLibrary)
+        dialog.onRescan.connect(self.rescanLibrary)
+        dialog.onAddFolder.connect(self.addLibraryFolder)
+        dialog.onRigChosen.connect(self.loadRig)
+        self._libraryDialog = dialog
+
+        self.rescanLibrary()
+        dialog.show()
+
+    @Slot(str, str, str)
+    def searchLibrary(self, name, componentType, target):
+        results = self._model.library.search(name=name or None, componentType=componentType or None,
+                                             target=target or None)
+        self._libraryDialog.setResults(results)
+
+    @Slot()
+    def rescanLibrary(self):
+        updated, removed = self._model.library.scan()
+        self.logger.debug('Rig library rescanned, %s rigs updated, %s removed', updated, removed)
+
+        self._libraryDialog.setComponentTypes(self._model.library.componentTypes())
+        self._libraryDialog.search()
+
+    @Slot(str)
+    def addLibraryFolder(self, folder):
+        self._model.library.addFolder(folder)
+        self.rescanLibrary()
+
+    @Slot()
+    def setCurvePrecision(self):
+        precision = self._model.curvePrecision(self._currentRig)
+
+        # Rigs kept at full precision start from the default instead
+        if precision is None:
+            precision = rigfile.DEFAULT_PRECISION
+
+        precision, accepted = QtWidgets.QInputDialog.getInt(self._window, 'Curve Precision',
+                                                            'Decimal places for saved curve data:', precision, 0, 15)
+        if accepted:
+            self.logger.debug('Setting the curve precision of %s to %s', self._currentRig, precision)
+            self._model.setCurvePrecision(self._currentRig, precision)
+
     @Slot()
     def saveRig(self):
         # Saves the active rig to the model's data
+        # The file is written in the background, any error is reported once it is done
         self.logger.debug('Saving the rig')
         self._loadViewData()
-        self._model.saveRig(self._currentRig)
+
+        def onSaved(error):
+            if error is not None:
+                self._showError('The rig could not be saved: %s' % error, title='Save Failed')
+
+        self._model.saveRig(self._currentRig, onSaved=onSaved)
 
     @Slot(str)
     def saveRigAs(self, directory):
 
         self.logger.debug('Saving rig in %s', directory)
         self._loadViewData()
-        self._currentRig = self._model.saveRigAs(directory, self._currentRig)
-        self.onNewRig.emit()
-        self._refreshView()
+
+        # The file is written in the background, the saved rig becomes the current rig once it is done
+        def onSaved(rigName, error):
+            if error is not None:
+                self._showError('The rig could not be saved to %s: %s' % (directory, error), title='Save Failed')
+                return
+
+            self._currentRig = rigName
+            self.onNewRig.emit()
+            self._refreshView()
+
+        self._model.saveRigAs(directory, self._currentRig, onSaved=onSaved)
 
     @Slot()
     def removeRig(self):
@@ -335,7 +468,7 @@ class ModelController(ui.ViewController):
         # Try to remove the current rig
         self._model.removeRig(self._currentRig, bakeMode=self.bakeMode)
 
-        # Then remove the rig from fileInfo
+        # Then remove the rig from the metadata node
         self._model.clearCache(self._currentRig)
 
         self._currentRigBuilt = False
@@ -343,21 +476,17 @@ class ModelController(ui.ViewController):
     @Slot()
     def previewRig(self):
 
+        if self._task is not None:
+            self.logger.debug('A rig task is already running, ignoring preview')
+            return
+
         if self._model.isReady(self._currentRig) is None:
             self.logger.debug('Rig is ready to build, refreshing the rig')
 
-            # Remove the rig
-            if self._currentRigBuilt:
-                self.logger.debug('Rig is built, removing')
-                self.removeRig()
-            else:
-                self.logger.debug('Rig is not built, skipping remove')
-                self._loadViewData()
-
-            # Then build the rig
-            self._model.buildRig(self._currentRig)
+            self._prepareBuild()
 
-            self._currentRigBuilt = True
+            # Then build the rig a component at a time
+            self._runTask(self._currentRig, self._buildSteps(self._currentRig), bind=False)
 
         else:
             self.logger.debug('showing error')
@@ -367,20 +496,23 @@ class ModelController(ui.ViewController):
     def bindRig(self):
         self.logger.debug('Attempting to bind the current rig.')
 
-        # Refresh the rig
-        self.previewRig()
+        if self._task is not None:
+            self.logger.debug('A rig task is already running, ignoring bind')
+            return
 
-        # If bake mode is on, bake the rig first
-        if self._bakeMode:
-            self.logger.debug('Bake mode is set to True, baking to rig.')
-            self._model.bakeRig(self._currentRig)
+        if self._model.isReady(self._currentRig) is not None:
+            self._showError(self._model.isReady(self._currentRig))
+            return
 
-        # Then bind it to the skeleton
-        self.logger.debug('Binding rig to skeleton, caching the rig.')
-        self._model.bindRig(self._currentRig)
+        # Refresh the rig, then bake and bind it
+        self._prepareBuild()
+        self._runTask(self._currentRig, self._bindSteps(self._currentRig), bind=True)
 
-        # And cache the rig
-        self._model.cacheRig(self._currentRig)
+    @Slot()
+    def cancelTask(self):
+        if self._task is not None:
+            self.logger.debug('Cancelling the running rig task')
+            self._task.cancel()
 
     @Slot(str)
     def switchActiveRig(self, rigName):
@@ -397,6 +529,9 @@ class ModelController(ui.ViewController):
         # This is useful for when the window closes
         self.logger.debug('Removing the preview')
 
+        # A build still running when the window closes is cancelled and its nodes deleted
+        self.cancelTask()
+
         if self._currentRigBuilt:
             self.logger.debug('Rig is built, grabbing scene data')
             self._model.loadSceneData(self._currentRig)
@@ -407,24 +542,111 @@ class ModelController(ui.ViewController):
     def stopLogging(self):
         removeLogHandlers()
 
+    @Slot()
+    def closeModel(self):
+        # Write any autosave entries still queued and remove the model's scene callbacks before the window goes away
+        self._model.close()
+
     #### Private Methods ####
 
+    def _recoverRigs(self):
+        # Asks whether to recover each rig with autosaved edits from a previous session
+        # Returns the name of the last rig recovered, or None
+        recovered = None
+
+        for path in self._model.recoveries():
+            name = os.path.basename(os.path.splitext(path)[0])
+            answer = QtWidgets.QMessageBox.question(self._window, 'Recover Rig',
+                                                    'The rig %s has unsaved changes from a previous session. '
+                                                    'Recover them?' % name,
+                                                    QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No)
+            if answer == QtWidgets.QMessageBox.Yes:
+                recovered = self._model.recoverRig(path)
+            else:
+                self._model.discardRecovery(path)
+
+        return recovered
+
+    def _prepareBuild(self):
+        # Remove the rig
+        if self._currentRigBuilt:
+            self.logger.debug('Rig is built, removing')
+            self.removeRig()
+        else:
+            self.logger.debug('Rig is not built, skipping remove')
+            self._loadViewData()
+
+    def _buildSteps(self, rigName):
+        for done, total in self._model.buildRigSteps(rigName):
+            yield 'Building', done, total
+
+    def _bindSteps(self, rigName):
+        for step in self._buildSteps(rigName):
+            yield step
+
+        # If bake mode is on, bake the rig first
+        if self._bakeMode:
+            self.logger.debug('Bake mode is set to True, baking to rig.')
+            for done, total in self._model.bakeRigSteps(rigName):
+                yield 'Baking', done, total
+
+        # Then bind it to the skeleton
+        self.logger.debug('Binding rig to skeleton.')
+        for done, total in self._model.bindRigSteps(rigName):
+            yield 'Binding', done, total
+
+    def _runTask(self, rigName, steps, bind):
+
+        def onFinished(completed):
+            self._task = None
+            self.onTaskFinished.emit()
+
+            if not completed:
+                # Take out what the task built and bound before it stopped
+                self.logger.info('Rig task for %s did not complete', rigName)
+                self._model.cancelRig(rigName)
+                self._currentRigBuilt = False
+                return
+
+            self._currentRigBuilt = True
+
+            # And cache the rig
+            if bind:
+                self.logger.debug('Rig bound, caching the rig.')
+                self._model.cacheRig(rigName)
+
+        self._task = rigloo_tools.RigTask(steps, onProgress=self.onTaskProgress.emit, onFinished=onFinished)
+        self._task.start()
+
 
     def _refreshView(self):
         # Update the view's componentData
         # Tell the view to regenerate components
         self.logger.debug('Refreshing the view.')
-        self.onRefreshComponents.emit(self.componentData, self.componentTypeData,
-                                      self.controlTypeData, self.componentSettings,
+        self.onRefreshComponents.emit(self.componentData, self._model.componentVersions(self._currentRig),
+                                      self.componentTypeData, self.controlTypeData, self.componentSettings,
                                       self._model.activeRigs, self._currentRig)
         self.logger.debug('Refreshed view successfully')
 
     def _loadViewData(self):
-        # Update the model with new data from the view
+        # Update the model with only the values edited in the view
 
-        for id, componentData in self._window.data.iteritems():
+        for id, componentData in self._window.dirtyData.iteritems():
             self.setComponentValue(id, componentData)
 
+    def _loadControlLibrary(self):
+        # Read the control library in the background, then hand its shapes to the view
+        if self._loadingControls:
+            return
+        self._loadingControls = True
+
+        def onLoaded():
+            self._loadingControls = False
+            self.logger.debug('Control library loaded, filling in the control lists')
+            self.onControlTypeDataUpdated.emit(self.controlTypeData)
+
+        controltools.refresh_control_library_async(onLoaded)
+
 
     ##### private properties #####
 
@@ -436,7 +658,13 @@ class ModelController(ui.ViewController):
     @property
     def controlTypeData(self):
         # Return a list of just the keys from the controltools
-        return [key for key, value in controltools.control_shapes.iteritems()]
+        # Until the library has been read in the background there are no shapes to choose from
+        if not controltools.control_library_loaded():
+            self._loadControlLibrary()
+            return []
+
+        controltools.refresh_control_library()
+        return controltools.get_control_names()
 
     @property
     def componentTypeData(self):
@@ -454,42 +682,63 @@ controller = None
 
 def load(debug=False):
     global mainWindow
-    global controller
-    global LOG_LEVEL
+
+    rigstartup.begin()
 
     logging.basicConfig(level=logging.DEBUG, filename=os.path.join(os.environ['MAYA_APP_DIR'],'rigloo.log'),
                         format=logging.Formatter('%(name)s : %(levelname)s : %(message)s'))
 
+    # setLogLevel stores the level itself
     if debug is True:
-        LOG_LEVEL = setLogLevel(logging.DEBUG)
+        setLogLevel(logging.DEBUG)
     else:
-        LOG_LEVEL = setLogLevel(logging.WARNING)
+        setLogLevel(logging.WARNING)
 
     # If the window already exists, don't create a new one
     if mainWindow is None:
 
-        # Grab the maya application and the main maya window
-        app = QtWidgets.QApplication.instance()
-        mayaWindow = {o.objectName(): o for o in app.topLevelWidgets()}["MayaWindow"]
+        with rigstartup.timed('Create window'):
+            # Grab the maya application and the main maya window
+            app = QtWidgets.QApplication.instance()
+            mayaWindow = {o.objectName(): o for o in app.topLevelWidgets()}["MayaWindow"]
+
+            # Create the window
+            mainWindow = MayaComponentWindow(mayaWindow)
+
+            signals = get_signals(MayaComponentWindow)
+            for signal in signals:
+                getattr(mainWindow, signal).connect(reload)
+
+        # The rig tools are loaded and the scene's rigs found once the window has been drawn
+        mainWindow.statusBar().showMessage('Loading rigs...')
+        maya.utils.executeDeferred(_createController)
 
-        # Create the window
-        mainWindow = MayaComponentWindow(mayaWindow)
+    # Show the window
+    with rigstartup.timed('Show window'):
+        mainWindow.run()
+
+def _createController():
+    global controller
 
-        signals = get_signals(MayaComponentWindow)
-        for signal in signals:
-            getattr(mainWindow, signal).connect(reload)
+    # Import the rig tools as their own step, so the report separates them from finding the rigs
+    # Pymel isn't imported here, only once something first builds a rig or reads the selection
+    rigloo_tools.load()
 
+    with rigstartup.timed('Find active rigs'):
         # Create the data
         data = rigloo_tools.RigToolsData()
 
         # Create the model
         model = rigloo_tools.RigToolsModel(data)
 
+    with rigstartup.timed('Create controller'):
         # Create the controller
         controller = MayaController(mainWindow, model)
 
-    # Show the window
-    mainWindow.run()
+    mainWindow.statusBar().clearMessage()
+
+    # Show where the time went, rigstartup.report() prints it again later
+    logging.getLogger(__name__).info(rigstartup.report())
 
 @Slot()
 def reload(*args, **kwargs):
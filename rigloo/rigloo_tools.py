@@ -1,17 +1,33 @@
-import pymel.core as pmc
-import pymel.core.datatypes as dt
+import rigstartup
 import controltools
 import rigtools
+import nodecache
+import rigfile
+import rigmeta
+import rigjournal
+import riglibrary
+import rigschema
+import maya.utils
+import maya.cmds as cmds
+import maya.api.OpenMaya as om2
 import os
+import copy
 import json
+import time
 import uuid
 import logging
+import itertools
+
+# Pymel is slow to import, so it is imported the first time a rig touches the scene
+pmc = rigstartup.LazyModule('pymel.core', globals())
+dt = rigstartup.LazyModule('pymel.core.datatypes', globals())
 
 ##############################
 #          Logging           #
 ##############################
 
-file_handler = logging.FileHandler(os.path.join(os.environ['MAYA_APP_DIR'], 'fossil.log'))
+# The log file is only opened once something is logged to it
+file_handler = logging.FileHandler(os.path.join(os.environ['MAYA_APP_DIR'], 'fossil.log'), delay=True)
 file_handler.setFormatter(logging.Formatter('%(asctime)s : %(name)s : %(levelname)s : %(message)s'))
 file_handler.setLevel(logging.DEBUG)
 
@@ -66,173 +82,20 @@ def removeLogHandlers():
 #       Rig Settings         #
 ##############################
 
-COMPONENT_TYPES = {
-    'BasicComponent': {
-        'name': 'defaultComponent',
-        'type': 'BasicComponent',
-        'mainControlType': 'default',
-        'mainControlScale': 10.0,
-        'target': None,
-        'parentSpace': None,
-        'uprightSpace': None,
-        'icon': "/icons/icon-BasicComponent.svg",
-        'enabled': True,
-        'spaceSwitchEnabled': False,
-        'useCustomCurve': False,
-        'hidden': False,
-        'mainControlData': None,
-        'mainControlColor': [0.0,0.0,1.0]
-    },
-    'ScaleComponent': {
-        'name': 'defaultScaleComponent',
-        'type': 'ScaleComponent',
-        'mainControlType': 'default',
-        'mainControlScale': 10.0,
-        'target': None,
-        'parentSpace': None,
-        'uprightSpace': None,
-        'icon': "/icons/icon-ScaleComponent.svg",
-        'enabled': True,
-        'spaceSwitchEnabled': False,
-        'useCustomCurve': False,
-        'mainControlData': None,
-        'mainControlColor': [0.0,0.0,1.0]
-    },
-    'FKComponent': {
-        'name': 'defaultFKComponent',
-        'type': 'FKComponent',
-        'mainControlType': 'default',
-        'mainControlScale': 10.0,
-        'target': None,
-        'parentSpace': None,
-        'uprightSpace': None,
-        'icon': "/icons/icon-FKComponent.svg",
-        'enabled': True,
-        'spaceSwitchEnabled': False,
-        'isLeafJoint': False,
-        'useCustomCurve': False,
-        'mainControlData': None,
-        'mainControlColor': [0.0,0.0,1.0]
-    },
-    'IKComponent': {
-        'name': 'defaultIKComponent',
-        'type': 'IKComponent',
-        'mainControlType': 'cube',
-        'mainControlScale': 10.0,
-        'bindTargets': [],
-        'parentSpace': None,
-        'uprightSpace': None,
-        'stretchEnabled': False,
-        'squashEnabled': False,
-        'icon': "/icons/icon-IKComponent.svg",
-        'poleVectorEnabled': True,
-        'enabled': True,
-        'spaceSwitchEnabled': False,
-        'isLeafJoint': False,
-        'useCustomCurve': False,
-        'mainControlData': None,
-        'poleCurveType': 'triangle',
-        'poleCurveScale': 1.0,
-        'poleCurveDistance': 5.0,
-        'baseCurveType':'cube',
-        'baseCurveScale':10.0,
-        'baseParentSpace':None,
-        'baseUprightSpace':None,
-        'baseSpaceSwitchEnabled':False,
-        'useCustomBaseCurve':False,
-        'useCustomOffsetCurve':False,
-        'useCustomPoleCurve':False,
-        'offsetCurveType':'sphere',
-        'offsetCurveScale':5.0,
-        'mainControlColor': [0.0,0.0,1.0],
-        'stretchScale':1.0,
-        'squashScale':1.0
-    },
-    'LegIKComponent': {
-        'name': 'defaultIKComponent',
-        'type': 'LegIKComponent',
-        'mainControlType': 'cube',
-        'mainControlScale': 10.0,
-        'bindTargets': [],
-        'parentSpace': None,
-        'uprightSpace': None,
-        'stretchEnabled': False,
-        'squashEnabled': False,
-        'icon': "/icons/icon-IKComponent.svg",
-        'poleVectorEnabled': True,
-        'enabled': True,
-        'spaceSwitchEnabled': False,
-        'isLeafJoint': False,
-        'useCustomCurve': False,
-        'mainControlData': None,
-        'poleCurveType': 'triangle',
-        'poleCurveScale': 1.0,
-        'poleCurveDistance': 5.0,
-        'baseCurveType':'cube',
-        'baseCurveScale':10.0,
-        'baseParentSpace':None,
-        'baseUprightSpace':None,
-        'baseSpaceSwitchEnabled':False,
-        'offsetCurveType':'sphere',
-        'offsetCurveScale':5.0,
-        'mainControlColor': [0.0,0.0,1.0],
-        'stretchScale':1.0,
-        'useCustomBaseCurve':False,
-        'useCustomOffsetCurve':False,
-        'useCustomPoleCurve':False,
-        'squashScale':1.0
-    },
-    'MultiFKComponent': {
-        'name': 'defaultMultiFKComponent',
-        'type': 'MultiFKComponent',
-        'mainControlType': 'default',
-        'mainControlScale': 10.0,
-        'bindTargets': [],
-        'parentSpace': None,
-        'uprightSpace': None,
-        'stretchEnabled': False,
-        'squashEnabled': False,
-        'icon': "/icons/icon-MultiFKComponent.svg",
-        'enabled': True,
-        'spaceSwitchEnabled': False,
-        'isLeafJoint': False,
-        'useCustomCurve': False,
-        'mainControlData': None,
-        'mainControlColor': [0.0,0.0,1.0],
-        'stretchScale':1.0,
-        'squashScale':1.0
-    },
-    'SpineIKComponent': {
-        'name': 'defaultSpineIKComponent',
-        'type': 'SpineIKComponent',
-        'mainControlType': 'square',
-        'mainControlScale': 30.0,
-        'bindTargets': [],
-        'aimAxis': [1,0,0],
-        'parentSpace': None,
-        'uprightSpace': None,
-        'stretchEnabled': False,
-        'squashEnabled': False,
-        'icon': "/icons/icon-SpineIKComponent.svg",
-        'enabled': True,
-        'spaceSwitchEnabled': False,
-        'isLeafJoint': False,
-        'useCustomCurve': False,
-        'mainControlData': None,
-        'mainControlColor': [0.0,0.0,1.0],
-        'secondaryParentSpace': None,
-        'secondaryUprightSpace': None,
-        'secondarySpaceSwitchEnabled': False,
-        'secondaryCurveType': 'default',
-        'secondaryCurveScale': 30.0,
-        'useCustomSecondaryCurve':False,
-        'spineControlScale':5.0,
-        'spineControlType':'default',
-        'useCustomSpineCurve':False,
-        'stretchScale':1.0,
-        'squashScale':1.0
-    }
-}
+# Where edits to rigs that have not been saved to a file yet are autosaved
+AUTOSAVE_DIR = os.path.join(os.environ['MAYA_APP_DIR'], 'rigloo_autosave')
+
+# The index of every rig in the rig library folders
+LIBRARY_INDEX = os.path.join(os.environ['MAYA_APP_DIR'], 'rigloo_library.db')
+
+# The component types and their defaults are kept in rigschema, so they can be used without maya
+COMPONENT_TYPES = rigschema.COMPONENT_TYPES
+
+# How long a rig task may run before handing control back to maya, in seconds
+TASK_STEP_BUDGET = 0.05
+
+# Hands out component versions, shared by every rig so a reloaded rig never repeats the versions of the last one
+_COMPONENT_VERSIONS = itertools.count(1)
 
 ##############################
 #     Utility Classes        #
@@ -262,6 +125,96 @@ class safeCreate(object):
         if exc_val is not None:
             pmc.undo()
 
+class RigTask(object):
+    '''
+    Runs a long rig operation a few steps at a time on maya's idle queue, so the ui stays responsive.
+    The steps are a generator yielding (label, done, total) tuples. A cancelled or failed task leaves taking out
+    what the steps created to onFinished, such as with Rig.cancel, which knows what its rig created.
+    Each batch of steps is its own undo chunk, no chunk is left open while maya handles other events.
+    :param onProgress: Called with the label, steps done, total steps and estimated seconds remaining
+    :param onFinished: Called with True if the task completed, or False if it was cancelled or failed
+    '''
+
+    def __init__(self, steps, onProgress=None, onFinished=None, budget=TASK_STEP_BUDGET):
+        self.logger = addLogger(type(self).__name__)
+
+        self._steps = steps
+        self._onProgress = onProgress
+        self._onFinished = onFinished
+        self._budget = budget
+
+        self.running = False
+
+        # The label of the current phase and when it started, used to estimate the time remaining
+        self._label = None
+        self._labelStart = 0.0
+
+    def start(self):
+        self.running = True
+        maya.utils.executeDeferred(self._tick)
+
+    def cancel(self):
+        '''
+        Stops the task, onFinished is called with False.
+        '''
+        if self.running:
+            self.logger.info('Task cancelled')
+            self._finish(False)
+
+    #### Private Methods ####
+
+    def _tick(self):
+        if not self.running:
+            return
+
+        deadline = time.time() + self._budget
+        step = None
+        result = None
+
+        pmc.undoInfo(openChunk=True)
+
+        try:
+            while time.time() < deadline:
+                step = next(self._steps)
+        except StopIteration:
+            result = True
+        except Exception:
+            self.logger.exception('Task failed')
+            result = False
+        finally:
+            pmc.undoInfo(closeChunk=True)
+
+        if result is not None:
+            self._finish(result)
+            return
+
+        if step is not None and self._onProgress is not None:
+            label, done, total = step
+            self._onProgress(label, done, total, self._estimate(label, done, total))
+
+        # Let maya process events before running the next steps
+        maya.utils.executeDeferred(self._tick)
+
+    def _estimate(self, label, done, total):
+        if label != self._label:
+            self._label = label
+            self._labelStart = time.time()
+            return -1.0
+
+        elapsed = time.time() - self._labelStart
+        if done <= 0:
+            return -1.0
+        return elapsed / done * (total - done)
+
+    def _finish(self, completed):
+        self.running = False
+
+        # Let the steps clean up, such as restoring the current time
+        self._steps.close()
+
+        if self._onFinished is not None:
+            self._onFinished(completed)
+
 class noneList:
     def __getitem__(self, index):
         return None
@@ -276,62 +229,49 @@ class ControlCurve():
         self.curveData = curveData
         self.curveType = curveType
         self.scale = scale
-        self.color = dt.Color(color[0], color[1], color[2])
+        self.color = list(color)
 
-    def create(self, name='default', upVector=[1,0,0]):
+    def create(self, name='default', upVector=[1,0,0], rotation=None):
 
-        vector = dt.Vector(upVector)
+        color = list(self.color)
 
         if self.curveData:
             # Create a control curve from the raw data
-            control = controltools.create_control_curve_from_data(self.curveData)
+            curveInfo = controltools.parse_curve_data(self.curveData)
         else:
-            # Use curve tools to generate a control from the control library
-            control = controltools.create_control_curve(self.curveType)
-
-        # Rename the control curve
-        pmc.rename(control, name+'_ctrl')
-
-        # Set the base scale of the curve
-        if self.curveData is None:
-            self._matchScale(control, self.scale)
+            # Use curve tools to grab a control from the control library
+            curveInfo = controltools.get_control(self.curveType)
 
-        # Rotate the control cvs to the desired orientation
-        self._matchTarget(object=control, upVector=vector)
+        # Scale and orient the cvs before the curve exists, so nothing needs to be frozen
+        matrix = self._shapeMatrix(dt.Vector(upVector), rotation)
+        curveInfo = controltools.transform_curve_info(curveInfo, matrix)
 
-        # Set the override color of the curve
-        for shape in control.getShapes():
-            pmc.setAttr(shape.overrideColorRGB, self.color)
-            pmc.setAttr(shape.overrideRGBColors, True)
-            pmc.setAttr(shape.overrideEnabled, True)
+        return controltools.build_control_curve(curveInfo, name=name+'_ctrl', color=color)
 
-        return control
+    def _shapeMatrix(self, upVector, rotation=None):
 
-    def _matchTarget(self, object, upVector):
+        # Set the base scale of the curve
+        # Custom curve data is already stored at its final scale
+        if self.curveData is None:
+            matrix = dt.Matrix(self.scale, 0.0, 0.0, 0.0,
+                               0.0, self.scale, 0.0, 0.0,
+                               0.0, 0.0, self.scale, 0.0,
+                               0.0, 0.0, 0.0, 1.0)
+        else:
+            matrix = dt.Matrix()
 
         # The world up vector
         worldUp = dt.Vector(0, 1, 0)
 
-        # The Transformation matrix of the target in world space
-        targetSpace = dt.Matrix()
-
-        # The input upVector transformed into target rotation space
-        targetUp = upVector.rotateBy(targetSpace)
-
         # Create a Quaternion  to represent the rotation
         # From the object orientation to the target orientation
-        rotation = worldUp.rotateTo(targetUp)
-        object.setRotation(rotation, space='world')
-        pmc.makeIdentity(object, apply=True, rotate=True, scale=False, translate=False)
+        matrix = matrix * worldUp.rotateTo(upVector).asMatrix()
 
-        # Transform the object into the target space
-        object.setMatrix(targetSpace, worldSpace=True)
+        # Apply any extra rotation on top of the orientation
+        if rotation is not None:
+            matrix = matrix * rotation.asMatrix()
 
-    def _matchScale(self, target, source):
-
-        target.setScale((source, source, source))
-
-        pmc.makeIdentity(target, apply=True, rotate=False, scale=True, translate=False)
+        return matrix
 
 defaultFKControl = ControlCurve(scale=10.0)
 
@@ -386,6 +326,9 @@ class BasicComponent(object):
         # Set the standard variables
         self._name = name
         self._mainControl = None
+
+        # The nodes created when binding, outside the component's group
+        self._bindNodes = []
         self._mainControlScale = mainControlScale
         self._mainControlColor = mainControlColor
         self.spaceSwitchEnabled = spaceSwitchEnabled
@@ -409,7 +352,7 @@ class BasicComponent(object):
         # Target is just a name, so grab the actual pynode for it, if it exists
         if target is not None:
             try:
-                self._target = pmc.PyNode(target)
+                self._target = nodecache.resolve(target)
             except TypeError:
                 self._target = None
         else:
@@ -819,6 +762,11 @@ class BasicComponent(object):
         # Returns a list of all targets this component effects
         return []
 
+    @property
+    def bindNodes(self):
+        # Returns the nodes created when binding, which aren't removed with the component group
+        return self._bindNodes
+
     @property
     def ready(self):
 
@@ -851,7 +799,8 @@ class Rig(object):
     An object for building components from a set of component data.
     '''
 
-    def __init__(self, name, componentData, directory, built=False, bound=False, baked=False, rigGroup=None):
+    def __init__(self, name, componentData, directory, built=False, bound=False, baked=False, rigGroup=None,
+                 shapes=None):
 
         # Set up a logger for the rig class
         self.logger = addLogger(type(self).__name__)
@@ -865,47 +814,66 @@ class Rig(object):
         # Assign a key to access data
         self._componentData = componentData
 
-        # Create a dictionary to hold all active components
-        self._components = {}
+        # A version for each component, raised whenever the component's data changes
+        # So the ui can find the components that changed without comparing their data
+        self._versions = dict((id, next(_COMPONENT_VERSIONS)) for id in componentData)
 
-        # If this rig has been built, grab its riggroup
-        if rigGroup and pmc.objExists(rigGroup):
-            self.rigGroup = pmc.PyNode(rigGroup)
-        else:
-            self.rigGroup = None
+        # Control shapes are only expanded from the shape table once a component needs them
+        self._shapes = shapes if shapes is not None else rigfile.ShapeTable()
 
-        # For each component in the component data...
-        for id, com in self._componentData.iteritems():
-            # Check if component is set to 'enabled'
-            if com['enabled']:
-                # Create an instance of the component's class
-                component = self._createComponent(componentType=com['type'], **com)
+        # The dictionary of active components is created the first time it is used
+        # So loading a rig doesn't expand its control shapes until they are needed
+        self._components = None
 
-                # Add the component to this rigs active component dictionary
-                self._components[id] = component
+        # The nodes the last build and bind created, and the targets the bind connected to
+        # So a build or bind stopped part way can be taken out again
+        self._created = []
+        self._boundTargets = []
+
+        # If this rig has been built, grab its riggroup
+        # The group is only looked up the first time it is used, so finding the rigs in a scene doesn't need pymel
+        self._rigGroup = None
+        self._rigGroupName = rigGroup
 
     #### Public Methods ####
 
     def build(self):
+        for _ in self.buildSteps():
+            pass
+
+    def buildSteps(self):
+        '''
+        Builds the rig one component at a time.
+        :return: A generator yielding the number of steps done and the total after each step
+        '''
+        enabled = [(id, com) for id, com in self._componentData.iteritems() if com['enabled']]
+        total = len(enabled) + 1
+
+        # Components created before the build are replaced as each one is built
+        if self._components is None:
+            self._components = {}
+
         # Create a master group for the rig
         self.rigGroup = pmc.group(empty=True, name=self._name + '_rig')
+        self._created = [self.rigGroup]
+        self._boundTargets = []
 
         # For each component in the component data...
-        for id, com in self._componentData.iteritems():
-            # Check if component is set to 'enabled'
-            if com['enabled']:
+        for step, (id, com) in enumerate(enabled):
+
+            # Create an instance of the component's class
+            component = self._createComponent(componentType=com['type'],**com)
 
-                # Create an instance of the component's class
-                component = self._createComponent(componentType=com['type'],**com)
+            # Add the component to this rigs active component dictionary
+            self._components[id] = component
 
-                # Add the component to this rigs active component dictionary
-                self._components[id] = component
+            # Build the components and grab the group they're spawned in...
+            componentGroup = self._components[id].build()
 
-                # Build the components and grab the group they're spawned in...
-                componentGroup = self._components[id].build()
+            # And parent it to this rigs group
+            pmc.parent(componentGroup, self.rigGroup)
 
-                # And parent it to this rigs group
-                pmc.parent(componentGroup, self.rigGroup)
+            yield step + 1, total
 
         # For each component, apply the parent space
         # This ensures that all components exist before parenting occurs
@@ -927,52 +895,82 @@ class Rig(object):
 
             com.parent(self._components)
 
+        yield total, total
+
     def bind(self):
+        for _ in self.bindSteps():
+            pass
+
+    def bindSteps(self):
+        '''
+        Binds the rig one component at a time.
+        :return: A generator yielding the number of steps done and the total after each step
+        '''
+        total = len(self.components)
+
         # For each component in the rig, bind to its target
-        for id, com in self._components.iteritems():
+        for step, com in enumerate(self.components.values()):
             com.bind()
 
+            self._boundTargets.extend(com.targets)
+            self._created.extend(com.bindNodes)
+
+            yield step + 1, total
+
     def snap(self):
         # For each component in the rig, snap to its target
-        for id, com in self._components.iteritems():
+        for id, com in self.components.iteritems():
             com.snap()
 
     def bake(self, frameRange=10):
+        for _ in self.bakeSteps(frameRange):
+            pass
+
+    def bakeSteps(self, frameRange=10):
+        '''
+        Bakes the rig one frame at a time.
+        :return: A generator yielding the number of frames done and the total after each frame
+        '''
         # Create a list to store sorted components
         sortedComponents = []
+        components = self.components
 
         # Create a recursive method that adds a components parent before the component
         def addCom(id):
             if id not in sortedComponents:
-                if self._components[id].parentSpace is not None:
-                    if self._components[id].parentSpace not in sortedComponents:
-                        addCom(self._components[id].parentSpace)
+                if components[id].parentSpace is not None:
+                    if components[id].parentSpace not in sortedComponents:
+                        addCom(components[id].parentSpace)
 
-                if self._components[id].uprightSpace is not None:
-                    if self._components[id].uprightSpace not in sortedComponents:
-                        addCom(self._components[id].uprightSpace)
+                if components[id].uprightSpace is not None:
+                    if components[id].uprightSpace not in sortedComponents:
+                        addCom(components[id].uprightSpace)
 
                 sortedComponents.append(id)
             else:
                 pass
 
         # Iterate through the list, sort so that parents are always before children
-        for id, com in self._components.iteritems():
+        for id, com in components.iteritems():
             addCom(id)
 
         # Goes through every frame, snaps the controls and keys their position
-        for frame in range(frameRange):
-            pmc.setCurrentTime(frame)
-            for id in sortedComponents:
-                com = self._components[id]
-                com.snap()
-                com.bake(frame)
-        pmc.setCurrentTime(0)
+        try:
+            for frame in range(frameRange):
+                pmc.setCurrentTime(frame)
+                for id in sortedComponents:
+                    com = components[id]
+                    com.snap()
+                    com.bake(frame)
+                yield frame + 1, frameRange
+        finally:
+            # Also runs when a bake is stopped part way
+            pmc.setCurrentTime(0)
 
     def unbind(self, bake=False):
         targetList = []
 
-        for id, com in self._components.iteritems():
+        for id, com in self.components.iteritems():
             self.logger.debug('Adding targets for %s', str(com))
             targetList += com.targets
 
@@ -987,6 +985,30 @@ class Rig(object):
                 pmc.disconnectAttr(target.rotate)
                 pmc.disconnectAttr(target.scale)
 
+    def cancel(self):
+        '''
+        Takes out what the last build and bind created, for when they were stopped part way.
+        The targets bound so far are disconnected, then the nodes created are deleted, newest first.
+        '''
+        pmc.undoInfo(openChunk=True)
+        try:
+            for target in self._boundTargets:
+                pmc.disconnectAttr(target.translate)
+                pmc.disconnectAttr(target.rotate)
+                pmc.disconnectAttr(target.scale)
+
+            for node in reversed(self._created):
+                try:
+                    if pmc.objExists(node):
+                        pmc.delete(node)
+                except pmc.general.MayaNodeError:
+                    # Children are already gone with their parents
+                    pass
+        finally:
+            pmc.undoInfo(closeChunk=True)
+
+        self.remove()
+
     def remove(self):
 
         # delete the rig group
@@ -994,14 +1016,17 @@ class Rig(object):
             if self.rigGroup:
                 if pmc.objExists(self.rigGroup):
                     pmc.delete(self.rigGroup)
-        except AttributeError, pmc.general.MayaNodeError:
+        except (AttributeError, pmc.general.MayaNodeError):
+            # The group may already be gone, such as after a cancelled build was undone
             pass
 
         # And reset the value of rigGroup
         self.rigGroup = None
+        self._created = []
+        self._boundTargets = []
 
         # And finally, clear out the dictionary of active components
-        self._components.clear()
+        self._components = {}
 
     def addComponent(self, **kwargs):
 
@@ -1022,6 +1047,7 @@ class Rig(object):
 
         # Set the index of the component
         self._componentData[id]['index'] = len(self._componentData) + 1
+        self._touch(id)
 
         # Resort all the components indexes
         self._sortComponentData()
@@ -1032,6 +1058,7 @@ class Rig(object):
 
         # Remove the component from the component dictionary
         del self._componentData[id]
+        self._versions.pop(id, None)
 
         # Resort all the components indexes
         self._sortComponentData()
@@ -1051,8 +1078,10 @@ class Rig(object):
             for comId, value in self._componentData.iteritems():
                 if value['index'] == newIndex:
                     self._componentData[comId]['index'] = startIndex
+                    self._touch(comId)
 
             self._componentData[id]['index'] = newIndex
+            self._touch(id)
 
     def duplicateComponent(self, id):
 
@@ -1061,20 +1090,32 @@ class Rig(object):
         self.addComponent(**data)
 
     def setComponent(self, id, attr, value):
+        '''
+        Sets a single component value.
+        :return: True if the value changed
+        '''
 
         # Set the attribute in the component data
         try:
-            self._componentData[id][attr] = value
+            component = self._componentData[id]
         except KeyError:
             self.logger.info('Trying to set a component value, but component no longer exists. Ignoring.')
-            pass
+            return False
+
+        # Skip values that haven't changed
+        if attr in component and component[attr] == value:
+            return False
+
+        component[attr] = value
+        self._touch(id)
+        return True
 
     def getComponent(self, id):
         '''
         Returns the active component of a specific ID
         '''
 
-        return self._components[id]
+        return self.components[id]
 
     def getComponentData(self, id):
         '''
@@ -1099,11 +1140,15 @@ class Rig(object):
 
         print ('\n').join(data)
 
-        for com in self._components:
-            print self._components[com].printData
+        for com in self.components:
+            print self.components[com].printData
 
     #### Private Methods ####
 
+    def _touch(self, id):
+        # Gives a component a new version after its data changed
+        self._versions[id] = next(_COMPONENT_VERSIONS)
+
     def _createComponent(self, componentType='FKComponent', **kwargs):
         '''
         Creates a new component instance based on inputed data\
@@ -1111,7 +1156,8 @@ class Rig(object):
         '''
         componentType = eval(componentType)
 
-        component = componentType(**kwargs)
+        # Expand any control shapes the component refers to by hash
+        component = componentType(**self._shapes.expand_component(kwargs))
 
         return component
 
@@ -1124,13 +1170,42 @@ class Rig(object):
 
             if comIndex != index + 1:
                 self._componentData[sortedKeys[index]]['index'] = index + 1
+                self._touch(sortedKeys[index])
 
     #### Public Properties ####
 
+    @property
+    def components(self):
+        '''
+        The active components of the rig, created from the component data the first time they are used.
+        '''
+        if self._components is None:
+            self._components = {}
+
+            # For each component in the component data...
+            for id, com in self._componentData.iteritems():
+                # Check if component is set to 'enabled'
+                if com['enabled']:
+                    # Create an instance of the component's class
+                    component = self._createComponent(componentType=com['type'], **com)
+
+                    # Add the component to this rigs active component dictionary
+                    self._components[id] = component
+
+        return self._components
+
     @property
     def componentData(self):
         return self._componentData
 
+    @property
+    def versions(self):
+        '''
+        The version of each component, keyed by id. A component's version changes whenever its data does.
+        Component data must be changed through the rig for its version to follow.
+        '''
+        return self._versions
+
     @property
     def data(self):
         ''' Return data that can be used to recreate this rig '''
@@ -1141,9 +1216,10 @@ class Rig(object):
             rigGroup = None
 
         rigData = {
+            'version': rigschema.SCHEMA_VERSION,
             'name': self._name,
             'directory': self._directory,
-            'componentData': self._componentData,
+            'componentData': self._shapes.expand_components(self._componentData),
             'rigGroup': rigGroup
         }
 
@@ -1154,7 +1230,7 @@ class Rig(object):
 
         sceneData = {}
 
-        for id, component in self._components.iteritems():
+        for id, component in self.components.iteritems():
 
             sceneData[id] = component.sceneData
 
@@ -1162,15 +1238,46 @@ class Rig(object):
 
     @property
     def inScene(self):
-        if self.rigGroup:
+        if self._rigGroup is None and self._rigGroupName:
+            return cmds.objExists(self._rigGroupName)
+        elif self.rigGroup:
             return pmc.objExists(self.rigGroup)
         else:
             return False
 
+    @property
+    def rigGroup(self):
+        if self._rigGroup is None and self._rigGroupName:
+            try:
+                self._rigGroup = nodecache.resolve(self._rigGroupName)
+            except TypeError:
+                pass
+            self._rigGroupName = None
+
+        return self._rigGroup
+
+    @rigGroup.setter
+    def rigGroup(self, value):
+        self._rigGroup = value
+        self._rigGroupName = None
+
     @property
     def directory(self):
         return self._directory
 
+    @property
+    def shapes(self):
+        return self._shapes
+
+    @property
+    def precision(self):
+        # The number of decimal places curve data is saved with, None keeps full precision
+        return self._shapes.precision
+
+    @precision.setter
+    def precision(self, value):
+        self._shapes.precision = value
+
     @property
     def ready(self):
         # This iterates through all components and checks if they can be built
@@ -1275,11 +1382,6 @@ class FKComponent(BasicComponent):
         '''
 
         # Create the main control curve
-        if self._mainControlData[0] is None or not self._useCustomCurve:
-            self._mainControl = self._mainControlType.create(upVector=[1,0,0], name=self.name+'_main')
-        else:
-            self._mainControl = self._mainControlType.create(upVector=[0,1,0], name=self.name + '_main')
-
         if self._mainControlData[0] is None or not self._useCustomCurve:
             # Grab the orientation of the target
             jointRotation = self.target.getRotation(space='world', quaternion=True)
@@ -1290,9 +1392,11 @@ class FKComponent(BasicComponent):
             # Calculate the difference between the two orientationse
             difference = aimRotation * jointRotation.invertIt()
 
-            # Rotate the control by that difference then freeze the rotation
-            self._mainControl.rotateBy(difference)
-            pmc.makeIdentity(self._mainControl, apply=True, rotate=True, translate=False, scale=False, jointOrient=False)
+            # Create the control with its cvs already rotated by that difference
+            self._mainControl = self._mainControlType.create(upVector=[1,0,0], name=self.name+'_main',
+                                                             rotation=difference)
+        else:
+            self._mainControl = self._mainControlType.create(upVector=[0,1,0], name=self.name + '_main')
 
         # Create an orient output group, this will actually be aimed
         self._mainControlOrientOutput = pmc.group(empty=True, name=self.name + '_orient_srt')
@@ -1324,6 +1428,9 @@ class FKComponent(BasicComponent):
         squashScalePower = pmc.createNode('multiplyDivide', name=self.name+'_squashPower')
         stretchScalePower = pmc.createNode('multiplyDivide', name=self.name + '_stretchPower')
         pmc.setAttr(squashScalePower.operation, 'Power')
+        self._bindNodes.extend([point1SpaceSwitch, point2SpaceSwitch, distanceBetween, maxDistanceDiv, scaleMult,
+                                outputMax, inverseOutput, startJointTranslateMatrix, startJointTranslateWorldMatrix,
+                                squashScalePower, stretchScalePower])
 
         # Grab the two points we will base distance on
         point1 = self._stretchTarget.matrixOutput
@@ -1499,6 +1606,8 @@ class FKComponent(BasicComponent):
         translateDecompose = pmc.createNode('decomposeMatrix', name=self.name+'_parentSpaceDecomp')
         rotateDecompose = pmc.createNode('decomposeMatrix', name=self.name+'_jointOrientDecomp')
         scaleDecompose = pmc.createNode('decomposeMatrix', name=self.name+'_scaleDecomp')
+        self._bindNodes = [parentSpaceMult, jointOrientMult, jointOrientCompose, transposeMatrix,
+                           translateDecompose, rotateDecompose, scaleDecompose]
 
         # Connect the parentspace conversion mult matrix
         # This will bring the output into the targets space
@@ -1659,7 +1768,7 @@ class MultiFKComponent(FKComponent):
         for target in bindTargets:
             if target is not None:
                 try:
-                    self._bindTargets.append(pmc.PyNode(target))
+                    self._bindTargets.append(nodecache.resolve(target))
                 except TypeError:
                     self._bindTargets.append(None)
             else:
@@ -1820,13 +1929,17 @@ class MultiFKComponent(FKComponent):
     @property
     def targets(self):
 
-        targets = self._bindTargets
+        targets = list(self._bindTargets)
 
         if self._isLeafJoint:
             targets.extend([target.getParent() for target in self._bindTargets])
 
         return targets
 
+    @property
+    def bindNodes(self):
+        return [node for child in self._childComponents for node in child.bindNodes]
+
     @property
     def matrixOutput(self):
         return self._childComponents[self.endIndex].matrixOutput
@@ -2206,7 +2319,7 @@ class IKComponent(MultiFKComponent):
 
     @property
     def targets(self):
-        targets = self._bindTargets
+        targets = list(self._bindTargets)
 
         if self._isLeafJoint:
             targets.extend([target.getParent() for target in self._bindTargets])
@@ -2725,17 +2838,31 @@ class RigToolsData(object):
 
     def load(self, directory):
 
+        componentData, shapes = self.loadLazy(directory)
+        return shapes.expand_components(componentData)
+
+    def loadLazy(self, directory):
+        '''
+        Loads the component data of a rig, leaving its control shapes in a shape table until they are needed.
+        '''
+
+        # The file format is picked from the extension, either json or binary
         try:
-            with open(directory) as c:
-                return json.load(c)
+            return rigfile.load_lazy(directory)
         except IOError:
             self.logger.warning('Could not load file from %s file not found.', directory)
-            return {}
+        except rigfile.RigFileError as e:
+            self.logger.warning('Could not load file from %s: %s', directory, e)
 
-    def save(self, directory, componentData):
+        return {}, rigfile.ShapeTable()
 
-        with open(directory, 'w') as c:
-            json.dump(componentData, c, indent=4)
+    def save(self, directory, componentData, shapes=None):
+
+        rigfile.save(directory, componentData, shapes)
+
+    def convert(self, source, destination):
+
+        rigfile.convert(source, destination)
 
 class RigToolsModel(object):
     '''
@@ -2747,8 +2874,25 @@ class RigToolsModel(object):
         # Set up a logger for the model
         self.logger = addLogger(type(self).__name__)
 
+        # Bound rigs are cached on a metadata node in the scene
+        self._metadata = rigmeta.metadata
+
+        # Edits to each rig are autosaved to a journal in the background
+        # Each journal starts when its rig is created or loaded, so it records the rig before any edits
+        self._journals = {}
+
+        # Writes any autosave entries still queued when Maya quits, added with the first journal
+        self._exitCallback = None
+
         # Set up initial variables
         self._activeRigs = self._loadFromScene()
+        for rigName in self._activeRigs:
+            # Rigs with autosaves from a previous session keep them until they are recovered or discarded
+            if not rigjournal.has_recovery(self._autosavePath(rigName)):
+                self._openJournal(rigName)
+
+        # The rig library is only opened the first time it is needed
+        self._library = None
 
         # Grab the data handler
         self._data = data
@@ -2757,42 +2901,105 @@ class RigToolsModel(object):
 
     def _loadFromScene(self):
 
-        try:
-            rigData = eval(pmc.fileInfo['rigs'])
+        rigs = {}
 
-            rigs = {}
+        for rigName, rigData in self._metadata.items():
+            # Rigs cached by older versions are migrated once, current ones are used as is
+            rigschema.upgrade(rigData['componentData'], rigData.get('version', 0))
 
-            for rigName, rigData in rigData.iteritems():
-                rig = Rig(rigName, rigData['componentData'], rigData['directory'],
-                                 rigGroup=rigData['rigGroup'])
+            rig = Rig(rigName, rigData['componentData'], rigData['directory'],
+                             rigGroup=rigData['rigGroup'])
 
-                if rig.inScene:
-                    rigs[rigName] = rig
+            if rig.inScene:
+                rigs[rigName] = rig
 
-        except KeyError:
+        if not rigs:
             self.logger.info('No rigs found in scene, creating an empty rig instead')
-            rigs = {}
-            pmc.fileInfo['rigs'] = repr(rigs)
 
         return rigs
 
+    def _autosavePath(self, rigName):
+        directory = self._activeRigs[rigName].directory
+        if directory:
+            return directory
+        return os.path.join(AUTOSAVE_DIR, rigName + rigfile.JSON_EXTENSION)
+
+    def _openJournal(self, rigName, componentData=None, snapshot=False):
+        # Start a journal from the rig's current data, replacing any journal or autosave it had
+        # Snapshot writes the starting data as the autosave, for rigs holding edits their file doesn't have
+        self._closeJournal(rigName)
+
+        if self._exitCallback is None:
+            self._exitCallback = om2.MSceneMessage.addCallback(om2.MSceneMessage.kMayaExiting, self.close)
+
+        rig = self._activeRigs[rigName]
+        if componentData is None:
+            componentData = rig.componentData
+
+        journal = rigjournal.RigJournal(self._autosavePath(rigName), componentData, rig.shapes, snapshot=snapshot)
+        self._journals[rigName] = journal
+        return journal
+
+    def _journal(self, rigName):
+        # Journals are opened with their rig, one is only missing after the model was closed,
+        # or while a recovery from a previous session is waiting on the user
+        # Callers grab the journal before editing the rig, so a reopened journal never starts from the edit
+        try:
+            return self._journals[rigName]
+        except KeyError:
+            # The rig may have edits that were only in the closed journal's autosave
+            return self._openJournal(rigName, snapshot=True)
+
+    def _recoveryName(self, path):
+        return os.path.basename(os.path.splitext(path)[0])
+
+    def _isAutosave(self, path):
+        # Rigs that were never saved are autosaved outside of any rig file
+        return os.path.normcase(os.path.dirname(os.path.abspath(path))) == os.path.normcase(AUTOSAVE_DIR)
+
+    def _closeJournal(self, rigName, discard=False):
+        try:
+            self._journals.pop(rigName).close(discard=discard)
+        except KeyError:
+            pass
+
+    def _deferred(self, function):
+        # Journals call back from their own thread, so run the function on Maya's main thread instead
+        if function is None:
+            return None
+        return lambda *args: maya.utils.executeDeferred(function, *args)
+
+    def _autosave(self, rigName, journal):
+        # Record any structural changes to the rig in the journal grabbed before the rig was edited
+        journal.update(self._activeRigs[rigName].componentData)
+
     ##### Public Methods #####
 
+    def close(self, *args):
+        '''
+        Writes every queued autosave entry and stops the journals.
+        Also removes the node cache's scene callbacks, they are added again the next time a node is resolved.
+        '''
+        for rigName in list(self._journals):
+            self._closeJournal(rigName)
+
+        if self._exitCallback is not None:
+            om2.MMessage.removeCallback(self._exitCallback)
+            self._exitCallback = None
+
+        self.logger.debug('Node cache stats: %s', nodecache.stats())
+        nodecache.uninstall()
+
     def cacheRig(self, rigName):
-        # Stores the rig input rig in fileInfo
+        # Stores the rig input rig on the metadata node
         # This way we know if there is a bound rig in the scene
-        data = eval(pmc.fileInfo['rigs'])
-        data[rigName] = self._activeRigs[rigName].data
-        pmc.fileInfo['rigs'] = repr(data)
+        self._metadata.set(rigName, self._activeRigs[rigName].data)
 
     def clearCache(self, rigName):
         # Attempt to clear the cache for the input rig
         # This is typically called when a rig is no longer bound
-        data = eval(pmc.fileInfo['rigs'])
-
         try:
-            del data[rigName]
-            pmc.fileInfo['rigs'] = repr(data)
+            self._metadata.remove(rigName)
         except KeyError:
             self.logger.info('Attempting to clear cache, but cache is empty.')
             pass
@@ -2805,28 +3012,52 @@ class RigToolsModel(object):
         # Create a new set of component data
         componentData = {}
 
+        # Any autosave for the previous new rig is replaced, including one left by a crash
+        self._closeJournal(name, discard=True)
+
         # Create a rig and add it to the active rig list
         self._activeRigs[name] = Rig(name, componentData, None)
+        self._openJournal(name)
 
         return name
 
-    def saveRigAs(self, directory, rigName):
+    def saveRigAs(self, directory, rigName, onSaved=None):
+        '''
+        Writes the rig to a new file in the background, then makes it an active rig under the file's name.
+        Nothing changes until the file is written, so a failed save leaves the rig and its autosave as they were.
+        :param onSaved: An optional function, run on Maya's main thread once the save is done,
+            with the new rig's name and the error that stopped the save, one of which is None
+        '''
 
         # Grab the name from the path
         name = os.path.basename(os.path.splitext(directory)[0])
 
-        componentData = self._activeRigs[rigName].componentData
+        rig = self._activeRigs[rigName]
+        shapes = rig.shapes
 
-        # Create a rig and add it to the active rig list
-        self._activeRigs[name] = Rig(name, componentData, directory)
+        # The data as it was saved, edits made while the file is written are journaled against it
+        savedData = copy.deepcopy(rig.componentData)
 
-        # Save a file for the rig
-        self._data.save(directory, componentData)
+        def finish(error):
+            if error is None:
+                # A rig that was never saved no longer needs its autosave, and neither does the file just written
+                self._closeJournal(rigName, discard=rig.directory is None)
+                self._closeJournal(name)
 
-        return name
+                # Create a rig and add it to the active rig list
+                self._activeRigs[name] = Rig(name, rig.componentData, directory, shapes=shapes)
+                self._openJournal(name, savedData).update(rig.componentData)
+
+            if onSaved is not None:
+                onSaved(name if error is None else None, error)
+
+        self._journal(rigName).save(directory, savedData, shapes, onSaved=self._deferred(finish))
 
     def buildRig(self, rigName):
 
+        # Pick up any changes to the control library once, before any controls are created
+        controltools.refresh_control_library()
+
         with safeCreate(self._activeRigs[rigName]):
             # Rebuild the rig
             self._activeRigs[rigName].build()
@@ -2844,6 +3075,22 @@ class RigToolsModel(object):
             frameRange = int(pmc.playbackOptions(query=True, aet=True))
             self._activeRigs[rigName].bake(frameRange=frameRange)
 
+    def buildRigSteps(self, rigName):
+        '''
+        Returns a generator that builds the rig a component at a time, for running as a RigTask.
+        '''
+        # Pick up any changes to the control library once, before any controls are created
+        controltools.refresh_control_library()
+
+        return self._activeRigs[rigName].buildSteps()
+
+    def bindRigSteps(self, rigName):
+        return self._activeRigs[rigName].bindSteps()
+
+    def bakeRigSteps(self, rigName):
+        frameRange = int(pmc.playbackOptions(query=True, aet=True))
+        return self._activeRigs[rigName].bakeSteps(frameRange=frameRange)
+
     def removeRig(self, rigName, bakeMode=False):
 
         if self.isActive(rigName):
@@ -2857,43 +3104,152 @@ class RigToolsModel(object):
         if not self.isActive(rigName):
             self._activeRigs[rigName].remove()
 
-    def saveRig(self, rigName):
-        self._data.save(self._activeRigs[rigName].directory, self._activeRigs[rigName].componentData)
+    def cancelRig(self, rigName):
+        '''
+        Takes out a rig whose build or bind was cancelled or failed part way.
+        '''
+        self._activeRigs[rigName].cancel()
+
+    def saveRig(self, rigName, onSaved=None):
+        '''
+        Writes the rig to its file in the background.
+        :param onSaved: An optional function, run on Maya's main thread once the save is done,
+            with the error that stopped the save or None
+        '''
+        rig = self._activeRigs[rigName]
+
+        if rig.directory:
+            # The file is written by the rig's journal, after any autosave entries it still has queued
+            self._journal(rigName).save(rig.directory, rig.componentData, rig.shapes, onSaved=self._deferred(onSaved))
+        else:
+            self.logger.warning('Rig %s has no file to save to.', rigName)
 
     def loadRig(self, directory):
 
         name = os.path.basename(os.path.splitext(directory)[0])
 
-        componentData = self._data.load(directory)
+        # Make sure any pending save of this file is written before reading it
+        self._closeJournal(name)
+
+        # Curve data stays in the shape table until the rig is built
+        componentData, shapes = self._data.loadLazy(directory)
 
-        self._activeRigs[name] = Rig(name, componentData, directory)
+        self._activeRigs[name] = Rig(name, componentData, directory, shapes=shapes)
+        self._openJournal(name)
 
         return name
 
+    def hasRecovery(self, directory):
+        # Checks if a rig file has autosaved edits that were never saved
+        return rigjournal.has_recovery(directory)
+
+    def recoveries(self):
+        '''
+        :return: The paths of every rig with autosaved edits from a previous session that are waiting on the user,
+            the autosaves of rigs that were never saved and of rigs found in the scene
+        '''
+        paths = [path for path in rigjournal.find_recoveries(AUTOSAVE_DIR)
+                 if self._recoveryName(path) not in self._journals]
+
+        for rigName in self._activeRigs:
+            path = self._autosavePath(rigName)
+            if rigName not in self._journals and path not in paths and rigjournal.has_recovery(path):
+                paths.append(path)
+
+        return paths
+
+    def discardRecovery(self, directory):
+        rigjournal.discard(directory)
+
+        # An active rig that was waiting on this recovery starts its journal now
+        name = self._recoveryName(directory)
+        if name in self._activeRigs and name not in self._journals:
+            self._openJournal(name)
+
+    def recoverRig(self, directory):
+        '''
+        Loads a rig from its autosave, replaying any edits made after its last snapshot.
+        :param directory: The path of the rig file, or of the autosave of a rig that was never saved
+        '''
+        name = self._recoveryName(directory)
+
+        self._closeJournal(name)
+
+        componentData, shapes = rigjournal.recover(directory)
+
+        # A rig found in the scene keeps its rig group
+        rigGroup = None
+        if name in self._activeRigs and self._activeRigs[name].rigGroup is not None:
+            rigGroup = self._activeRigs[name].rigGroup.name()
+
+        if self._isAutosave(directory):
+            directory = None
+
+        self._activeRigs[name] = Rig(name, componentData, directory, shapes=shapes, rigGroup=rigGroup)
+
+        # The recovered edits become the new autosave, so they survive another crash
+        self._openJournal(name, snapshot=True)
+
+        return name
+
+    def curvePrecision(self, rigName):
+        return self._activeRigs[rigName].precision
+
+    def setCurvePrecision(self, rigName, precision):
+        self._activeRigs[rigName].precision = precision
+
     def rigData(self, rigName):
         return self._activeRigs[rigName].componentData
 
+    def componentVersions(self, rigName):
+        return self._activeRigs[rigName].versions
+
     def addComponent(self, rigName, type):
         '''
         Adds a component to the rig based on a string for rig name and componentType
         '''
+        journal = self._journal(rigName)
         id = self._activeRigs[rigName].addComponent(**COMPONENT_TYPES[type])
+        self._autosave(rigName, journal)
         return id
 
     def removeComponent(self, rigName, id):
 
+        journal = self._journal(rigName)
         self._activeRigs[rigName].removeComponent(id)
+        self._autosave(rigName, journal)
 
     def moveComponent(self, rigName, id, moveUp):
 
+        journal = self._journal(rigName)
         self._activeRigs[rigName].moveComponent(id, moveUp)
+        self._autosave(rigName, journal)
 
     def duplicateComponent(self, rigName, id):
 
+        journal = self._journal(rigName)
         self._activeRigs[rigName].duplicateComponent(id)
+        self._autosave(rigName, journal)
 
     def setComponentValue(self, rigName, id, attr, value):
-        self._activeRigs[rigName].setComponent(id, attr, value)
+        journal = self._journal(rigName)
+        changed = self._activeRigs[rigName].setComponent(id, attr, value)
+
+        # The journal compares against its own copy of the rig, so it only records real changes
+        journal.updateValue(id, attr, value)
+
+        return changed
+
+    def setComponentValues(self, rigName, id, values):
+        '''
+        Sets several values of a single component.
+        :return: True if any value changed
+        '''
+        changed = False
+        for attr, value in values.iteritems():
+            if self.setComponentValue(rigName, id, attr, value):
+                changed = True
+        return changed
 
     def isReady(self, rigName):
         # Checks if the current rig can be built
@@ -2904,10 +3260,9 @@ class RigToolsModel(object):
             return self._activeRigs[rigName].ready
 
     def isActive(self, rigName):
-        try:
-            rigData = eval(pmc.fileInfo['rigs'])[rigName]
+        if rigName in self._metadata:
             return True
-        except KeyError:
+        else:
             self.logger.info('Rig is not currently active')
             return False
 
@@ -2925,6 +3280,12 @@ class RigToolsModel(object):
         '''Return each active rig with instructions on how to replicate them'''
         return {rigName: rig.data for rigName, rig in self._activeRigs.iteritems()}
 
+    @property
+    def library(self):
+        if self._library is None:
+            self._library = riglibrary.RigLibrary(LIBRARY_INDEX)
+        return self._library
+
     @property
     def activeRigs(self):
         ''' Return active rigs as a list'''
@@ -4,14 +4,27 @@ import os
 import logging
 import uuid
 
+import rigsearch
+
 
 RIGLOO_VERSION = 'v1.0.1-beta'
+RIG_FILE_FILTER = "All rig files (*.json *.rigb);;All JSON files (*.json);;Binary rig files (*.rigb)"
+
+# How long a component stays collapsed before its argument widgets are released, in milliseconds
+ARGUMENT_RELEASE_DELAY = 30000
+
+# The height of a component row that hasn't been shown yet, roughly a collapsed component
+COMPONENT_ROW_HEIGHT = 30
+
+# How long the view waits for edits to stop before sending them to the controller as one batch, in milliseconds
+EDIT_DEBOUNCE_DELAY = 300
 
 ##############################
 #          Logging           #
 ##############################
 
-file_handler = logging.FileHandler(os.path.join(os.environ['MAYA_APP_DIR'],'rigloo.log'))
+# The log file is only opened once something is logged to it
+file_handler = logging.FileHandler(os.path.join(os.environ['MAYA_APP_DIR'],'rigloo.log'), delay=True)
 file_handler.setFormatter(logging.Formatter('%(asctime)s : %(name)s : %(levelname)s : %(message)s'))
 file_handler.setLevel(logging.DEBUG)
 
@@ -62,6 +75,37 @@ def removeLogHandlers():
 
         del logger
 
+##############################
+#         Icon Cache         #
+##############################
+
+# Icons and rendered pixmaps, shared by every widget for the whole session
+ICONS = {}
+PIXMAPS = {}
+
+def cachedIcon(path):
+
+    try:
+        return ICONS[path]
+    except KeyError:
+        icon = ICONS[path] = QtGui.QIcon(path)
+        return icon
+
+def cachedPixmap(path, size, mode=QtGui.QIcon.Normal):
+    '''
+    Returns an icon rendered at a size and mode, only rendering it the first time it is asked for.
+    :param path: The path of the icon, either a file or a resource
+    :param size: A QSize for the pixmap
+    :param mode: A QIcon mode, such as QIcon.Normal or QIcon.Disabled
+    '''
+    key = (path, size.width(), size.height(), mode)
+
+    try:
+        return PIXMAPS[key]
+    except KeyError:
+        pixmap = PIXMAPS[key] = cachedIcon(path).pixmap(size, mode)
+        return pixmap
+
 ##############################
 #       UI Controllers       #
 ##############################
@@ -69,11 +113,12 @@ def removeLogHandlers():
 class BaseController(QtCore.QObject):
 
     # A signal to tell the ui to regenerate its components
-    onRefreshComponents = Signal(dict, list, list, dict, list, str)
+    # The first two dicts are the component data and the version of each component
+    onRefreshComponents = Signal(dict, dict, list, list, dict, list, str)
 
     # Signals to let the view and its widgets know type data was updated
-    # The dict is the updated type data
-    onControlTypeDataUpdated = Signal(dict)
+    # The list is the updated control names, the dict is the updated type data
+    onControlTypeDataUpdated = Signal(list)
     onComponentTypeDataUpdated = Signal(dict)
 
     # Signal to update the view when a new rig is created
@@ -82,6 +127,11 @@ class BaseController(QtCore.QObject):
     # A Signal to update the view when a new active rig is added
     onActiveRigsUpdated = Signal(list)
 
+    # Signals to show the progress of a long running build, bind or bake
+    # The str is what is being done, then the steps done, the total steps and the seconds remaining
+    onTaskProgress = Signal(str, int, int, float)
+    onTaskFinished = Signal()
+
     def __init__(self, window=None, model=None):
         QtCore.QObject.__init__(self)
 
@@ -101,6 +151,9 @@ class BaseController(QtCore.QObject):
         # Set a simple state value for whether the rig is built
         self._currentRigBuilt = False
 
+        # The build, bind or bake that is currently running, if any
+        self._task = None
+
 
     ##### View Slots #####
 
@@ -110,6 +163,12 @@ class BaseController(QtCore.QObject):
         # And sends it to the model for storage
         raise NotImplementedError
 
+    @Slot(dict)
+    def updateComponents(self, data):
+        # Takes a batch of edits from the ui, keyed by component id
+        # And sends them to the model as one update
+        raise NotImplementedError
+
     @Slot(str)
     def addComponent(self, componentType):
         # Tells the model to add a new component
@@ -153,6 +212,16 @@ class BaseController(QtCore.QObject):
         # Saves the active rig to the model's data
         raise NotImplementedError
 
+    @Slot()
+    def openLibrary(self):
+        # Shows the rig library, so a rig can be found and loaded
+        raise NotImplementedError
+
+    @Slot()
+    def setCurvePrecision(self):
+        # Asks for the number of decimal places the current rig's curve data is saved with
+        raise NotImplementedError
+
     @Slot(str)
     def saveRigAs(self, dir):
         # Saves the rig to a new location
@@ -174,6 +243,11 @@ class BaseController(QtCore.QObject):
         # If bake mode is on, bake the rig as well
         raise NotImplementedError
 
+    @Slot()
+    def cancelTask(self):
+        # Stops the running build, bind or bake and deletes what it created
+        raise NotImplementedError
+
     @Slot(bool)
     def toggleBake(self, value):
         # Set the bake setting state
@@ -206,6 +280,11 @@ class BaseController(QtCore.QObject):
     def stopLogging(self):
         raise NotImplementedError
 
+    @Slot()
+    def closeModel(self):
+        # Writes any pending autosave data and removes the model's scene callbacks
+        raise NotImplementedError
+
     #### Private Methods ####
 
     def _refreshView(self):
@@ -221,7 +300,7 @@ class BaseController(QtCore.QObject):
         # Update the model with new data from the scene
         raise NotImplementedError
 
-    def _showError(self, message):
+    def _showError(self, message, title='Build Failed'):
         # Shows an error message
         raise NotImplementedError
 
@@ -255,18 +334,25 @@ class ViewController(BaseController):
 
         # Connect controller signals to view slots
         self.onRefreshComponents.connect(self._window.refreshComponentWidgets)
+        self.onControlTypeDataUpdated.connect(self._window.updateControlTypeData)
         self.onNewRig.connect(self._window.createRigWidget)
+        self.onTaskProgress.connect(self._window.showProgress)
+        self.onTaskFinished.connect(self._window.hideProgress)
 
         # Connect view signals to controller slots
         self._window.onAddComponentClicked.connect(self.addComponent)
+        self._window.onComponentsEdited.connect(self.updateComponents)
         self._window.onAddSelectedClicked.connect(self.addSelected)
         self._window.onCreateNewRigClicked.connect(self.createRig)
         self._window.onLoadRigClicked.connect(self.loadRig)
+        self._window.onOpenLibraryClicked.connect(self.openLibrary)
+        self._window.onCurvePrecisionClicked.connect(self.setCurvePrecision)
         self._window.onSaveRigClicked.connect(self.saveRig)
         self._window.onSaveRigAsClicked.connect(self.saveRigAs)
         self._window.onPreviewClicked.connect(self.previewRig)
         self._window.onBindClicked.connect(self.bindRig)
         self._window.onRemoveClicked.connect(self.removeRig)
+        self._window.onCancelClicked.connect(self.cancelTask)
         self._window.onRemoveComponentClicked.connect(self.removeComponent)
         self._window.onMoveComponentClicked.connect(self.moveComponent)
         self._window.onDuplicateComponentClicked.connect(self.duplicateComponent)
@@ -274,6 +360,7 @@ class ViewController(BaseController):
         self._window.onBakeToggled.connect(self.toggleBake)
         self._window.onWindowClosed.connect(self.removePreview)
         self._window.onWindowClosed.connect(self.stopLogging)
+        self._window.onWindowClosed.connect(self.closeModel)
         self._window.onDebugToggled.connect(self.toggleDebug)
         self._window.onAdvancedToggled.connect(self.toggleAdvanced)
         self._window.onLogToggled.connect(self.toggleLog)
@@ -281,16 +368,16 @@ class ViewController(BaseController):
         # Create a private variable to store the current component settings
         self._componentSettings = dict(COMPONENT_SETTINGS)
 
-    def _showError(self, message):
+    def _showError(self, message, title='Build Failed'):
         '''
         Shows a popup to alert the user that the rig cannot be built with the
-        current inputs
+        current inputs, or that an action failed
         '''
 
         self.logger.warning(message)
 
         popup = QtWidgets.QMessageBox(self._window)
-        popup.setWindowTitle('Build Failed')
+        popup.setWindowTitle(title)
         popup.setText(message)
         popup.show()
 
@@ -385,6 +472,7 @@ class TestViewController(ViewController):
         pass
         '''
         self.onRefreshComponents.emit(self._componentData,
+                                      self._componentVersions,
                                       self._componentTypeData,
                                       self._controlTypeData,
                                       self.componentSettings,
@@ -397,7 +485,14 @@ class TestViewController(ViewController):
     def setComponentValue(self, id, data):
         # This takes the data from the ui
         # And sends it to the model for storage
-        self._componentData[id] = data
+        self._componentData[id].update(data)
+
+        self._refreshView()
+
+    @Slot(dict)
+    def updateComponents(self, data):
+        for id, values in data.iteritems():
+            self._componentData[id].update(values)
 
         self._refreshView()
 
@@ -418,6 +513,7 @@ class TestViewController(ViewController):
                 'deformTargets': ['thigh'],
                 'id': id,
                 'hidden': True,
+                'enabled': True,
                 'parentSpace': None,
                 'uprightSpace': None,
                 'aimAxis': [1, 0, 0],
@@ -434,6 +530,7 @@ class TestViewController(ViewController):
                 'deformTargets': ['thigh', 'knee', 'foot'],
                 'id' : id,
                 'hidden': True,
+                'enabled': True,
                 'parentSpace': None,
                 'uprightSpace': None,
                 'aimAxis': [1, 0, 0],
@@ -449,7 +546,8 @@ class TestViewController(ViewController):
                 'mainControlType': 'default',
                 'deformTargets': [],
                 'id': id,
-                'hidden': True
+                'hidden': True,
+                'enabled': True
             }
 
         self._componentData[id] = component
@@ -568,6 +666,256 @@ class TestViewController(ViewController):
         # Return whether the rig is baked or not
         return self._baked
 
+##############################
+#         UI Models          #
+##############################
+
+class ComponentListModel(QtCore.QAbstractListModel):
+    '''
+    A list model of the components in a rig, sorted by index.
+    Updating the model compares the version of each component against the versions it was last given, and only
+    emits row inserts, removes, moves and data changes for the components that actually changed.
+    '''
+
+    # Roles for the component's id and its full data dictionary
+    IdRole = QtCore.Qt.UserRole
+    DataRole = QtCore.Qt.UserRole + 1
+
+    def __init__(self, parent=None):
+        QtCore.QAbstractListModel.__init__(self, parent)
+
+        # The component ids, in row order
+        self._ids = []
+
+        # The component data the view shows, and the version of each component when it was last shown
+        self._componentData = {}
+        self._versions = {}
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._ids)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._ids):
+            return None
+
+        id = self._ids[index.row()]
+
+        if role == QtCore.Qt.DisplayRole:
+            return self._componentData[id].get('name')
+        elif role == self.IdRole:
+            return id
+        elif role == self.DataRole:
+            return self._componentData[id]
+
+        return None
+
+    @property
+    def componentData(self):
+        return self._componentData
+
+    def componentId(self, row):
+        return self._ids[row]
+
+    def row(self, id):
+        return self._ids.index(id)
+
+    def clear(self):
+        self.beginResetModel()
+        self._ids = []
+        self._componentData = {}
+        self._versions = {}
+        self.endResetModel()
+
+    def setComponentData(self, componentData, versions):
+        '''
+        Updates the model with new component data, emitting a notification for each changed row.
+        :param componentData: The rig's component data dictionary
+        :param versions: The version of each component, keyed by id, which changes whenever the component does
+        :return: The set of ids of the components added, removed or changed since the last update
+        '''
+        removed = set(id for id in self._versions if id not in componentData)
+        changed = set(id for id in componentData if self._versions.get(id) != versions.get(id))
+
+        self._componentData = componentData
+        self._versions = dict(versions)
+
+        if not changed and not removed:
+            return changed
+
+        order = sorted(componentData, key=lambda id: (componentData[id].get('index', 0), id))
+
+        # Fill an empty model in one go, so every component exists before any widget looks one up
+        if not self._ids:
+            self.beginResetModel()
+            self._ids = order
+            self.endResetModel()
+            return changed | removed
+
+        # Remove rows first, from the bottom up
+        for row in reversed(range(len(self._ids))):
+            if self._ids[row] in removed:
+                self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+                del self._ids[row]
+                self.endRemoveRows()
+
+        # Then move the remaining rows into their new order
+        existing = set(self._ids)
+        for row, id in enumerate([id for id in order if id in existing]):
+            if self._ids[row] != id:
+                source = self._ids.index(id)
+                self.beginMoveRows(QtCore.QModelIndex(), source, source, QtCore.QModelIndex(), row)
+                self._ids.insert(row, self._ids.pop(source))
+                self.endMoveRows()
+
+        # Then insert new rows where they belong
+        for row, id in enumerate(order):
+            if id not in existing:
+                self.beginInsertRows(QtCore.QModelIndex(), row, row)
+                self._ids.insert(row, id)
+                self.endInsertRows()
+
+        # Finally let the view know which of the remaining rows have new data
+        for row, id in enumerate(self._ids):
+            if id in changed and id in existing:
+                index = self.index(row)
+                self.dataChanged.emit(index, index)
+
+        return changed | removed
+
+class SpaceListModel(QtCore.QAbstractListModel):
+    '''
+    The components of a rig followed by a world entry, for choosing a component's spaces.
+    One is shared by every space widget in the window, so a rename only changes a single row.
+    Each row of the source model is the row with the same number here, and the world entry always comes last.
+    Every change to the source is passed on with those rows, so views keep their current items as rows move.
+    '''
+
+    WORLD = 'world'
+
+    def __init__(self, parent=None):
+        QtCore.QAbstractListModel.__init__(self, parent)
+
+        self._sourceModel = None
+
+        # The persistent rows held across a source layout change, paired with the source rows they follow
+        self._layoutIndexes = []
+
+    def setSourceModel(self, sourceModel):
+        self.beginResetModel()
+
+        if self._sourceModel is not None:
+            self._connectSource(self._sourceModel, False)
+
+        self._sourceModel = sourceModel
+
+        if sourceModel is not None:
+            self._connectSource(sourceModel, True)
+
+        self.endResetModel()
+
+    def sourceModel(self):
+        return self._sourceModel
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid() or self._sourceModel is None:
+            return 0
+        return self._sourceModel.rowCount() + 1
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or self._sourceModel is None:
+            return None
+
+        if self._isWorld(index.row()):
+            if role == QtCore.Qt.DisplayRole:
+                return self.WORLD
+            return None
+
+        return self._sourceModel.index(index.row()).data(role)
+
+    def flags(self, index):
+        if index.isValid() and self._isWorld(index.row()):
+            return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable
+        return QtCore.QAbstractListModel.flags(self, index)
+
+    #### Private Methods ####
+
+    def _isWorld(self, row):
+        return row == self._sourceModel.rowCount()
+
+    def _connectSource(self, sourceModel, connect):
+        signals = [
+            (sourceModel.rowsAboutToBeInserted, self._onRowsAboutToBeInserted),
+            (sourceModel.rowsInserted, self._onRowsInserted),
+            (sourceModel.rowsAboutToBeRemoved, self._onRowsAboutToBeRemoved),
+            (sourceModel.rowsRemoved, self._onRowsRemoved),
+            (sourceModel.rowsAboutToBeMoved, self._onRowsAboutToBeMoved),
+            (sourceModel.rowsMoved, self._onRowsMoved),
+            (sourceModel.dataChanged, self._onDataChanged),
+            (sourceModel.layoutAboutToBeChanged, self._onLayoutAboutToBeChanged),
+            (sourceModel.layoutChanged, self._onLayoutChanged),
+            (sourceModel.modelAboutToBeReset, self.beginResetModel),
+            (sourceModel.modelReset, self.endResetModel)
+        ]
+
+        for signal, slot in signals:
+            if connect:
+                signal.connect(slot)
+            else:
+                signal.disconnect(slot)
+
+    def _onRowsAboutToBeInserted(self, parent, first, last):
+        self.beginInsertRows(QtCore.QModelIndex(), first, last)
+
+    def _onRowsInserted(self, *args):
+        self.endInsertRows()
+
+    def _onRowsAboutToBeRemoved(self, parent, first, last):
+        self.beginRemoveRows(QtCore.QModelIndex(), first, last)
+
+    def _onRowsRemoved(self, *args):
+        self.endRemoveRows()
+
+    def _onRowsAboutToBeMoved(self, parent, start, end, destination, row):
+        self.beginMoveRows(QtCore.QModelIndex(), start, end, QtCore.QModelIndex(), row)
+
+    def _onRowsMoved(self, *args):
+        self.endMoveRows()
+
+    def _onDataChanged(self, topLeft, bottomRight, *args):
+        self.dataChanged.emit(self.index(topLeft.row()), self.index(bottomRight.row()))
+
+    def _onLayoutAboutToBeChanged(self, *args):
+        self.layoutAboutToBeChanged.emit()
+
+        # The world row doesn't move, the rest follow their source rows
+        self._layoutIndexes = [(index, QtCore.QPersistentModelIndex(self._sourceModel.index(index.row())))
+                               for index in self.persistentIndexList() if not self._isWorld(index.row())]
+
+    def _onLayoutChanged(self, *args):
+        for index, sourceIndex in self._layoutIndexes:
+            newIndex = self.index(sourceIndex.row()) if sourceIndex.isValid() else QtCore.QModelIndex()
+            self.changePersistentIndex(index, newIndex)
+        self._layoutIndexes = []
+
+        self.layoutChanged.emit()
+
+
+class ComponentFilterProxyModel(QtCore.QSortFilterProxyModel):
+    '''
+    Filters a single component out of a list of components, so a component can't be its own space.
+    '''
+
+    def __init__(self, excludedId, parent=None):
+        QtCore.QSortFilterProxyModel.__init__(self, parent)
+
+        self.excludedId = excludedId
+
+    def filterAcceptsRow(self, sourceRow, sourceParent):
+        id = self.sourceModel().index(sourceRow, 0, sourceParent).data(ComponentListModel.IdRole)
+        return id is None or id != self.excludedId
+
 ##############################
 #         UI Windows         #
 ##############################
@@ -578,6 +926,7 @@ class MainComponentWindow(QtWidgets.QMainWindow):
     onPreviewClicked = Signal()
     onBindClicked = Signal()
     onRemoveClicked = Signal()
+    onCancelClicked = Signal()
 
     # A signal to alert the controller when the window has been close
     onWindowClosed = Signal()
@@ -596,10 +945,20 @@ class MainComponentWindow(QtWidgets.QMainWindow):
     # A signal for saving the rig as
     onSaveRigAsClicked = Signal(str)
 
+    # A signal for opening the rig library
+    onOpenLibraryClicked = Signal()
+
+    # A signal for changing how precisely curve data is saved
+    onCurvePrecisionClicked = Signal()
+
     # A signal for adding a component
     # The string is the name of the component type
     onAddComponentClicked = Signal(str)
 
+    # A signal for a batch of edits made in the component widgets
+    # The dict holds the edited values, keyed by component id
+    onComponentsEdited = Signal(dict)
+
     # A signal for removing a component
     # The string is the id of the component
     onRemoveComponentClicked = Signal(str)
@@ -624,13 +983,6 @@ class MainComponentWindow(QtWidgets.QMainWindow):
     # A signal to let the control know a new rig was selected
     onRigSwitched = Signal(str)
 
-    # Widget Signals
-    # These are sent to slots in widget this window creates
-    onUpdateComponentWidgets = Signal(dict)
-
-    # This is sent to widgets to update their name list
-    onUpdateNameList = Signal(str, str)
-
     def __init__(self, parent=None):
         super(MainComponentWindow, self).__init__(parent=parent)
 
@@ -639,8 +991,47 @@ class MainComponentWindow(QtWidgets.QMainWindow):
         #self.logger.setLevel(LOG_LEVEL)
         #self.logger.addHandler(file_handler)
 
-        # Create a list for storing component widgets
-        self._componentWidgets = []
+        # Create a list for storing component rows, in the same order as the model's rows
+        # Only rows near the visible part of the list hold a component widget, spacers stand in for the rest
+        self._componentRows = []
+
+        # Edits taken from component widgets that were released before the edits were sent
+        self._releasedEdits = {}
+
+        # Which rows hold widgets is worked out once the layout has settled
+        self._visibleTimer = QtCore.QTimer(self)
+        self._visibleTimer.setSingleShot(True)
+        self._visibleTimer.setInterval(0)
+        self._visibleTimer.timeout.connect(self._updateVisibleRows)
+
+        # The component model drives which component widgets are created, updated or removed
+        self.componentModel = ComponentListModel(self)
+        self.componentModel.rowsInserted.connect(self._onComponentsInserted)
+        self.componentModel.rowsAboutToBeRemoved.connect(self._onComponentsRemoved)
+        self.componentModel.rowsMoved.connect(self._onComponentsMoved)
+        self.componentModel.dataChanged.connect(self._onComponentsChanged)
+        self.componentModel.modelReset.connect(self._onComponentsReset)
+
+        # Every space selector views this one list of components
+        self.spaceModel = SpaceListModel(self)
+
+        # The search field filters rows with an index kept up to date with the model
+        self.componentIndex = rigsearch.ComponentIndex()
+        self._searchText = ''
+        self.spaceModel.setSourceModel(self.componentModel)
+
+        # Edits are collected until they stop for a moment, then sent as one batch
+        self._editedIds = set()
+        self._editTimer = QtCore.QTimer(self)
+        self._editTimer.setSingleShot(True)
+        self._editTimer.setInterval(EDIT_DEBOUNCE_DELAY)
+        self._editTimer.timeout.connect(self._onEditTimeout)
+
+        # The data component widgets are created with, set on each refresh
+        self._componentTypeData = {}
+        self._controlTypeData = []
+        self._componentSettings = {}
+        self._activeRig = None
 
         # Create a default value for the main widget
         self.main_widget = None
@@ -658,7 +1049,7 @@ class MainComponentWindow(QtWidgets.QMainWindow):
 
         # Set the icon for the window
         basePath = os.path.dirname(os.path.realpath(__file__))
-        logoIcon = QtGui.QIcon(basePath + '/icons/logo-black.png')
+        logoIcon = cachedIcon(basePath + '/icons/logo-black.png')
         self.setWindowIcon(logoIcon)
 
         # Set the starting size
@@ -688,6 +1079,10 @@ class MainComponentWindow(QtWidgets.QMainWindow):
         loadAction.setStatusTip('Load a rig')
         loadAction.triggered.connect(self.onLoadRig)
 
+        libraryAction = QtWidgets.QAction('Rig Library...', self)
+        libraryAction.setStatusTip('Search the rig library')
+        libraryAction.triggered.connect(self.onOpenLibraryClicked)
+
         debugAction = QtWidgets.QAction('Debug Mode', self)
         debugAction.setCheckable(True)
         debugAction.setChecked(False)
@@ -706,6 +1101,10 @@ class MainComponentWindow(QtWidgets.QMainWindow):
         logAction.setStatusTip('Toggle Debug Mode')
         logAction.toggled.connect(self.onLogToggled)
 
+        precisionAction = QtWidgets.QAction('Curve Precision...', self)
+        precisionAction.setStatusTip('Set how many decimal places curve data is saved with')
+        precisionAction.triggered.connect(self.onCurvePrecisionClicked)
+
         bakeAction = QtWidgets.QAction('Bake To Animation', self)
         bakeAction.setCheckable(True)
         bakeAction.setChecked(False)
@@ -718,14 +1117,17 @@ class MainComponentWindow(QtWidgets.QMainWindow):
 
         fileMenu = menubar.addMenu('File')
         settingsMenu = menubar.addMenu('Settings')
+        self.fileMenu = fileMenu
         fileMenu.addAction(newAction)
         fileMenu.addAction(saveAction)
         fileMenu.addAction(saveAsAction)
         fileMenu.addAction(loadAction)
+        fileMenu.addAction(libraryAction)
         settingsMenu.addAction(debugAction)
         settingsMenu.addAction(bakeAction)
         settingsMenu.addAction(advancedAction)
         settingsMenu.addAction(logAction)
+        settingsMenu.addAction(precisionAction)
 
     def _createMainWidget(self):
 
@@ -749,6 +1151,11 @@ class MainComponentWindow(QtWidgets.QMainWindow):
 
     def _showComponentDataWidget(self):
 
+        # Remove the old component widgets before their scroll area is replaced
+        self.componentModel.clear()
+        self._releasedEdits = {}
+        self._editedIds.clear()
+
         # Create a new main widget
         self._createMainWidget()
 
@@ -771,14 +1178,14 @@ class MainComponentWindow(QtWidgets.QMainWindow):
 
         # Create a 'Remove' button
         self.removeButton = QtWidgets.QPushButton('Remove')
-        removeIcon = QtGui.QIcon(':/deleteActive.png')
+        removeIcon = cachedIcon(':/deleteActive.png')
         self.removeButton.setIcon(removeIcon)
         layout.addWidget(self.removeButton, 1, 0)
         self.removeButton.clicked.connect(self.onRemoveClicked)
 
         # Create a 'Preview' button
         self.previewButton = QtWidgets.QPushButton('Preview')
-        previewIcon = QtGui.QIcon(':/rebuild.png')
+        previewIcon = cachedIcon(':/rebuild.png')
         self.previewButton.setIcon(previewIcon)
         self.previewButton.setStyleSheet('QPushButton {background-color: #5285a6}')
         layout.addWidget(self.previewButton, 1, 1, 1, 2)
@@ -790,6 +1197,19 @@ class MainComponentWindow(QtWidgets.QMainWindow):
         layout.addWidget(self.bindButton, 1, 3)
         self.bindButton.clicked.connect(self.onBindClicked)
 
+        # Create a progress bar and cancel button, shown while a rig is built, bound or baked
+        self.progressLabel = QtWidgets.QLabel(self.main_widget)
+        layout.addWidget(self.progressLabel, 2, 0, 1, 4)
+
+        self.progressBar = QtWidgets.QProgressBar(self.main_widget)
+        layout.addWidget(self.progressBar, 3, 0, 1, 3)
+
+        self.cancelButton = QtWidgets.QPushButton('Cancel')
+        layout.addWidget(self.cancelButton, 3, 3)
+        self.cancelButton.clicked.connect(self.onCancelClicked)
+
+        self.hideProgress()
+
     def _addRigSelector(self):
 
         # Create a formlayout for the selector
@@ -814,10 +1234,47 @@ class MainComponentWindow(QtWidgets.QMainWindow):
         scroll.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOn)
         scroll.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
 
+        # Add a search field above the component list
+        searchField = QtWidgets.QLineEdit(self.main_widget)
+        searchField.setPlaceholderText('Search components, e.g. thigh, type:IK, space:hips')
+        searchField.setClearButtonEnabled(True)
+        searchField.setText(self._searchText)
+        searchField.textChanged.connect(self._onSearchChanged)
+        searchField.returnPressed.connect(self._onSearchReturnPressed)
+        self.main_layout.addWidget(searchField)
+        self.searchField = searchField
+
         self.main_layout.addWidget(scroll)
 
         self.scrollWidget = scroll
 
+        # Scrolling or resizing changes which rows need widgets
+        scroll.verticalScrollBar().valueChanged.connect(self._visibleTimer.start)
+        scroll.verticalScrollBar().rangeChanged.connect(self._visibleTimer.start)
+
+        # Create a widget to contain the components
+        self.componentWidget = QtWidgets.QWidget()
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.setAlignment(QtCore.Qt.AlignTop)
+        layout.setSpacing(0)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.componentWidget.setLayout(layout)
+        self.componentLayout = layout
+
+        # Add a horizontal line to start
+        layout.addWidget(self._addHorizontalLine())
+
+        # Then spacers for the rows above and below the ones holding widgets, which go between them
+        self._topSpacer = QtWidgets.QWidget(self.componentWidget)
+        self._topSpacer.setFixedHeight(0)
+        self._bottomSpacer = QtWidgets.QWidget(self.componentWidget)
+        self._bottomSpacer.setFixedHeight(0)
+        layout.addWidget(self._topSpacer)
+        layout.addWidget(self._bottomSpacer)
+
+        self.scrollWidget.setWidget(self.componentWidget)
+
     def _addHorizontalLine(self):
         line = QtWidgets.QFrame(self.main_widget)
         line.setFrameShape(QtWidgets.QFrame.HLine)
@@ -845,11 +1302,11 @@ class MainComponentWindow(QtWidgets.QMainWindow):
 
     ##### Controller Slots #####
 
-    @Slot(dict, list, list, dict, list, str)
-    # The controller calls this to regenerate the component ui
-    # The dict is an updated version of the component Data
-    def refreshComponentWidgets(self, componentData, componentTypeData, controlTypeData, componentSettings,
-                                activeRigs, activeRig):
+    @Slot(dict, dict, list, list, dict, list, str)
+    # The controller calls this to update the component ui
+    # The dicts are an updated version of the component Data and the version of each component
+    def refreshComponentWidgets(self, componentData, componentVersions, componentTypeData, controlTypeData,
+                                componentSettings, activeRigs, activeRig):
 
         self._refreshActiveRigs(activeRigs, activeRig)
 
@@ -857,77 +1314,72 @@ class MainComponentWindow(QtWidgets.QMainWindow):
 
         self.logger.debug('Refreshing component widgets')
 
-        # Save the position of the scrollbar
-        scrollValue = self.scrollWidget.verticalScrollBar().value()
+        self._componentTypeData = componentTypeData
 
-        # Clear the component widget list
-        del self._componentWidgets[:]
+        # Switching rigs, changing which settings are shown or loading new control shapes needs every widget rebuilt
+        if (activeRig != self._activeRig or componentSettings != self._componentSettings or
+                controlTypeData != self._controlTypeData):
+            if activeRig == self._activeRig:
+                # Only the widgets change, so edits not sent yet go to the controller with the next batch
+                self._releasedEdits = self.dirtyData
+            else:
+                # The controller takes the previous rig's edits before switching
+                self._releasedEdits = {}
 
-        # Create a widget to contain the components
-        self.componentWidget = QtWidgets.QWidget()
+            self._activeRig = activeRig
+            self._componentSettings = componentSettings
+            self._controlTypeData = controlTypeData
+            self.componentModel.clear()
 
-        layout = QtWidgets.QVBoxLayout()
-        layout.setAlignment(QtCore.Qt.AlignTop)
-        layout.setSpacing(0)
-        layout.setContentsMargins(0, 0, 0, 0)
-        self.componentWidget.setLayout(layout)
+            if self._releasedEdits:
+                self._editTimer.start()
 
-        # Add a horizontal line to start
-        topLine = self._addHorizontalLine()
-        layout.addWidget(topLine)
+        # Only the components that changed are created, updated or removed
+        # Space selectors view the same model, so they follow along without being rebuilt
+        changedIds = self.componentModel.setComponentData(componentData, componentVersions)
 
-        # For each component in the components dictionary
-        for id, data in componentData.iteritems():
+        # Only the changed components are indexed again, then the current search is applied to the new rows
+        self.componentIndex.update(componentData, changedIds)
+        self._applySearch()
 
-            try:
-                index = data['index']
-            except KeyError:
-                self.logger.info('%s Component did not have an index value, assigning a new one.', data['type'])
-                index = len(componentData) + 1
-
-            # Create a widget for the component
-            widget = ComponentWidget(data['name'], componentData, self, id,
-                                     componentTypeData,
-                                     controlTypeData,
-                                     componentSettings,
-                                     index)
-
-            # Connect the widgets signals
-            widget.onAddSelected.connect(self.onAddSelectedClicked)
-            widget.onRemoveComponentClicked.connect(self.onRemoveComponentClicked)
-            widget.onMoveComponentClicked.connect(self.onMoveComponentClicked)
-            widget.onDuplicateComponentClicked.connect(self.onDuplicateComponentClicked)
-            self.onUpdateNameList.connect(widget.onUpdateNameList)
-            widget.onNameChanged.connect(self.onUpdateNameList)
-
-            # Add the widget to the component widget dict
-            self._componentWidgets.append(widget)
-
-        # Sort the widgets by index
-        # Then add the widget to the layout
-        list = sorted(self._componentWidgets, key= lambda widget: widget.index)
-
-        for widget in list:
-            # Add the widget
-            layout.addWidget(widget)
-
-            # Also add a horizontal line
-            line = self._addHorizontalLine()
-            layout.addWidget(line)
-
-        # Then emit a signal to update all widgets that care about components
-        self.onUpdateComponentWidgets.emit(componentData)
+        self.logger.debug('refreshed components successfully')
 
-        self.scrollWidget.setWidget(self.componentWidget)
+    @Slot(str, int, int, float)
+    # The controller calls this while a rig is built, bound or baked
+    def showProgress(self, label, done, total, remaining):
 
-        self.scrollWidget.verticalScrollBar().setValue(scrollValue)
+        # Nothing else can be changed until the task finishes or is cancelled
+        self._setBusy(True)
 
-        self.logger.debug('refreshed components successfully')
+        self.progressBar.setMaximum(max(total, 1))
+        self.progressBar.setValue(done)
+
+        text = '%s %d/%d' % (label, done, total)
+        if remaining >= 0:
+            text += ' (about %ds left)' % max(int(round(remaining)), 1)
+        self.progressLabel.setText(text)
+
+        for widget in (self.progressLabel, self.progressBar, self.cancelButton):
+            widget.setVisible(True)
+
+    @Slot()
+    def hideProgress(self):
+
+        for widget in (self.progressLabel, self.progressBar, self.cancelButton):
+            widget.setVisible(False)
+
+        self._setBusy(False)
 
     @Slot(list)
     def updateControlTypeData(self, controlTypeData):
+        # The controller calls this when the control library has been read
+        # Only the control lists of the widgets that exist are filled in, widgets made later start with them
         self.logger.debug('Updating component widgets with new control type data.')
-        self.onUpdateControlTypeWidgets.emit(controlTypeData)
+        self._controlTypeData = controlTypeData
+
+        for componentRow in self._componentRows:
+            if componentRow.widget is not None:
+                componentRow.widget.setControlTypeData(controlTypeData)
 
     @Slot(list)
     def updateComponentTypeData(self, componentTypeData):
@@ -964,14 +1416,14 @@ class MainComponentWindow(QtWidgets.QMainWindow):
     @Slot()
     def onSaveAs(self):
         # Create a popup and grab the name (the underscore stores the filter, we don't care about that)
-        name, _ = QtWidgets.QFileDialog.getSaveFileName(self, 'Save New Rig', '', filter="All JSON files (*.json)")
+        name, _ = QtWidgets.QFileDialog.getSaveFileName(self, 'Save New Rig', '', filter=RIG_FILE_FILTER)
         self._directory = name
         self.onSaveRigAsClicked.emit(name)
 
     @Slot()
     def onLoadRig(self):
         # Create a popup and grab the name (the underscore stores the filter, we don't care about that)
-        name, _ = QtWidgets.QFileDialog.getOpenFileName(self, 'Load Rig', '', filter="All JSON files (*.json)")
+        name, _ = QtWidgets.QFileDialog.getOpenFileName(self, 'Load Rig', '', filter=RIG_FILE_FILTER)
         self._directory = name
         self.onLoadRigClicked.emit(name)
 
@@ -980,12 +1432,249 @@ class MainComponentWindow(QtWidgets.QMainWindow):
 
         data = {}
 
-        for component in self._componentWidgets:
-            data[component.id] = component.value
+        for row in self._componentRows:
+            if row.widget is not None:
+                data[row.id] = row.widget.value
+            else:
+                data[row.id] = dict(self.componentModel.componentData[row.id])
+        return data
+
+    @property
+    def dirtyData(self):
+        '''
+        The values edited in the view since this was last read, keyed by component id.
+        Components without edits are left out. Reading this also takes any edits still waiting to be batched.
+        '''
+        self._editTimer.stop()
+
+        rows = dict((row.id, row) for row in self._componentRows)
+
+        # Edits waiting for a component that has since been removed are dropped
+        data = dict((id, values) for id, values in self._releasedEdits.iteritems() if id in rows)
+        self._releasedEdits = {}
+
+        for id in self._editedIds:
+            try:
+                widget = rows[id].widget
+            except KeyError:
+                continue
+            if widget is not None:
+                values = widget.takeDirtyValues()
+                if values:
+                    data.setdefault(id, {}).update(values)
+
+        self._editedIds.clear()
         return data
 
     ##### Private Methods #####
 
+    def _setBusy(self, busy):
+        # Locks everything that changes or replaces the rig, including switching, creating and loading rigs
+        for widget in (self.componentWidget, self.rigComboBox, self.fileMenu,
+                       self.addButton, self.removeButton, self.previewButton, self.bindButton):
+            widget.setEnabled(not busy)
+
+    def _createComponentWidget(self, row):
+        id = self.componentModel.componentId(row)
+        data = self.componentModel.data(self.componentModel.index(row), ComponentListModel.DataRole)
+
+        widget = ComponentWidget(data['name'], self.componentModel.componentData, self, id,
+                                 self._componentTypeData,
+                                 self._controlTypeData,
+                                 self._componentSettings,
+                                 data['index'])
+
+        # Connect the widgets signals
+        widget.onAddSelected.connect(self.onAddSelectedClicked)
+        widget.onRemoveComponentClicked.connect(self.onRemoveComponentClicked)
+        widget.onMoveComponentClicked.connect(self.onMoveComponentClicked)
+        widget.onDuplicateComponentClicked.connect(self.onDuplicateComponentClicked)
+        widget.onEdited.connect(self._onComponentEdited)
+
+        # Renames reach the other components with the refresh that follows each batch of edits,
+        # instead of on every keystroke
+
+        return widget
+
+    def _deleteComponentRow(self, componentRow):
+        self._releaseComponentWidget(componentRow, keepEdits=False)
+
+    def _releaseComponentWidget(self, componentRow, keepEdits=True):
+        line = componentRow.line
+        widget = componentRow.takeWidget()
+        if widget is None:
+            return
+
+        # Edits that haven't been sent yet go to the controller with the next batch
+        if keepEdits:
+            values = widget.takeDirtyValues()
+            if values:
+                self._releasedEdits.setdefault(widget.id, {}).update(values)
+                self._editTimer.start()
+
+        for item in (widget, line):
+            self.componentLayout.removeWidget(item)
+            item.deleteLater()
+
+    def _updateVisibleRows(self):
+        # Create widgets for rows within a screen of the visible part of the list,
+        # and release widgets for rows more than two screens away
+        viewport = self.scrollWidget.viewport().height()
+        top = self.scrollWidget.verticalScrollBar().value()
+        bottom = top + viewport
+
+        # The rows that need a widget, found from the height each row was last drawn at
+        shown = []
+        rowTop = 0
+        for row, componentRow in enumerate(self._componentRows):
+            # Rows filtered out by a search take no space and don't need a widget
+            if not componentRow.visible:
+                continue
+
+            componentRow.measure()
+            rowBottom = rowTop + componentRow.height
+
+            if rowBottom >= top - viewport and rowTop <= bottom + viewport:
+                shown.append(row)
+            elif (componentRow.widget is not None and
+                  rowBottom >= top - viewport * 2 and rowTop <= bottom + viewport * 2):
+                shown.append(row)
+
+            rowTop = rowBottom
+
+        # The rows between them get widgets too, so the spacers only stand in for rows above and below
+        first, last = (shown[0], shown[-1]) if shown else (len(self._componentRows), -1)
+
+        # Released widgets keep their edits until the edit timer sends them
+        for row, componentRow in enumerate(self._componentRows):
+            inWindow = componentRow.visible and first <= row <= last
+            if not inWindow and componentRow.widget is not None:
+                self._releaseComponentWidget(componentRow)
+            elif inWindow and componentRow.widget is None:
+                componentRow.setWidget(self._createComponentWidget(row), self._addHorizontalLine())
+
+        self._layoutRows()
+
+    def _layoutRows(self):
+        # Puts the widgets of the rows holding one between the spacers, in row order,
+        # and sizes the spacers to the rows above and below them
+        layout = self.componentLayout
+        bottomIndex = layout.indexOf(self._bottomSpacer)
+        for index in reversed(range(layout.indexOf(self._topSpacer) + 1, bottomIndex)):
+            layout.takeAt(index)
+
+        above = below = 0
+        found = False
+        for componentRow in self._componentRows:
+            if not componentRow.visible:
+                continue
+
+            if componentRow.widget is not None:
+                found = True
+                below = 0
+                layout.insertWidget(layout.indexOf(self._bottomSpacer), componentRow.widget)
+                layout.insertWidget(layout.indexOf(self._bottomSpacer), componentRow.line)
+            elif found:
+                below += componentRow.height
+            else:
+                above += componentRow.height
+
+        self._topSpacer.setFixedHeight(above)
+        self._bottomSpacer.setFixedHeight(below)
+
+    def _onComponentEdited(self, id):
+        # Restart the timer, so a burst of edits is sent once they stop
+        self._editedIds.add(id)
+        self._editTimer.start()
+
+    def _onEditTimeout(self):
+        self._flushEdits()
+
+    def _flushEdits(self):
+        # Send every edit the view holds to the controller now
+        data = self.dirtyData
+        if data:
+            self.onComponentsEdited.emit(data)
+
+    def _onComponentsInserted(self, parent, first, last):
+        for row in range(first, last + 1):
+            self._componentRows.insert(row, ComponentRow(self.componentModel.componentId(row)))
+        self._visibleTimer.start()
+
+    def _onComponentsRemoved(self, parent, first, last):
+        for row in reversed(range(first, last + 1)):
+            self._deleteComponentRow(self._componentRows.pop(row))
+        self._visibleTimer.start()
+
+    def _onComponentsMoved(self, parent, start, end, destination, row):
+        componentRows = self._componentRows[start:end + 1]
+        del self._componentRows[start:end + 1]
+
+        # The destination row is counted before the moved rows were taken out
+        if row > start:
+            row -= len(componentRows)
+
+        self._componentRows[row:row] = componentRows
+        self._visibleTimer.start()
+
+    def _onComponentsChanged(self, topLeft, bottomRight, *args):
+        componentData = self.componentModel.componentData
+        replaced = False
+
+        for row in range(topLeft.row(), bottomRight.row() + 1):
+            componentRow = self._componentRows[row]
+
+            # Rows without a widget have nothing to update, their widget is created from the model when shown
+            widget = componentRow.widget
+            if widget is None:
+                continue
+
+            if widget.isOutdated(componentData):
+                # The component's arguments changed, so its argument widgets are created again
+                # This runs during a refresh, so edits not sent yet wait for the next batch rather than going now
+                self._releaseComponentWidget(componentRow)
+                componentRow.setWidget(self._createComponentWidget(row), self._addHorizontalLine())
+                replaced = True
+            else:
+                widget.setData(componentData)
+
+        if replaced:
+            self._layoutRows()
+
+    def _onComponentsReset(self):
+        for componentRow in self._componentRows:
+            self._deleteComponentRow(componentRow)
+
+        self.componentIndex.clear()
+
+        self._componentRows = [ComponentRow(self.componentModel.componentId(row))
+                               for row in range(self.componentModel.rowCount())]
+        self._layoutRows()
+        self._visibleTimer.start()
+
+    def _onSearchChanged(self, text):
+        self._searchText = text
+        self._applySearch()
+
+    def _applySearch(self):
+        # Show only the rows matching the search
+        matches = self.componentIndex.search(self._searchText) if self._searchText.strip() else None
+
+        for componentRow in self._componentRows:
+            componentRow.visible = matches is None or componentRow.id in matches
+
+            # Rows filtered out don't keep a widget
+            if not componentRow.visible:
+                self._releaseComponentWidget(componentRow)
+
+        self._visibleTimer.start()
+
+    def _onSearchReturnPressed(self):
+        # Jump to the first row matching the search, which is the first row shown
+        if any(componentRow.visible for componentRow in self._componentRows):
+            self.scrollWidget.verticalScrollBar().setValue(0)
+            self._updateVisibleRows()
+
     # This adds a menu action for the addComponent menu
     def _onAddComponentGenerator(self, componentName):
 
@@ -994,10 +1683,176 @@ class MainComponentWindow(QtWidgets.QMainWindow):
 
         return onAddComponent
 
+##############################
+#    Rig Library Dialog      #
+##############################
+
+class RigLibraryDialog(QtWidgets.QDialog):
+    '''
+    A dialog for searching the rig library by name, component type and target.
+    The search itself is done by the controller, which sends back the results.
+    '''
+
+    # A signal to run a search, the strings are the name, component type and target patterns
+    onSearch = Signal(str, str, str)
+
+    # A signal to rescan the library folders
+    onRescan = Signal()
+
+    # A signal to add a folder to the library, the string is the folder
+    onAddFolder = Signal(str)
+
+    # A signal to load a rig, the string is the directory
+    onRigChosen = Signal(str)
+
+    def __init__(self, parent=None):
+        super(RigLibraryDialog, self).__init__(parent=parent)
+
+        self.logger = addLogger(type(self).__name__)
+
+        self._setup()
+
+    def _setup(self):
+
+        self.setWindowTitle('Rig Library')
+        self.resize(500, 400)
+
+        layout = QtWidgets.QVBoxLayout(self)
+
+        # Add the search fields
+        form = QtWidgets.QFormLayout()
+        self.nameField = QtWidgets.QLineEdit(self)
+        self.nameField.setPlaceholderText('Any name')
+        self.typeField = QtWidgets.QComboBox(self)
+        self.targetField = QtWidgets.QLineEdit(self)
+        self.targetField.setPlaceholderText('Any target, e.g. *_thigh_L')
+        form.addRow('Name', self.nameField)
+        form.addRow('Component', self.typeField)
+        form.addRow('Target', self.targetField)
+        layout.addLayout(form)
+
+        # Searches are fast, so search as the user types
+        self.nameField.textChanged.connect(self.search)
+        self.typeField.currentIndexChanged.connect(self.search)
+        self.targetField.textChanged.connect(self.search)
+
+        # Add the result list
+        self.resultList = QtWidgets.QTreeWidget(self)
+        self.resultList.setHeaderLabels(['Name', 'Components', 'Path'])
+        self.resultList.setRootIsDecorated(False)
+        self.resultList.itemDoubleClicked.connect(self._onItemDoubleClicked)
+        layout.addWidget(self.resultList)
+
+        # Add the buttons
+        buttonLayout = QtWidgets.QHBoxLayout()
+        addFolderButton = QtWidgets.QPushButton('Add Folder...', self)
+        addFolderButton.clicked.connect(self._onAddFolderClicked)
+        rescanButton = QtWidgets.QPushButton('Rescan', self)
+        rescanButton.clicked.connect(self.onRescan)
+        loadButton = QtWidgets.QPushButton('Load', self)
+        loadButton.clicked.connect(self._onLoadClicked)
+        buttonLayout.addWidget(addFolderButton)
+        buttonLayout.addWidget(rescanButton)
+        buttonLayout.addStretch()
+        buttonLayout.addWidget(loadButton)
+        layout.addLayout(buttonLayout)
+
+        self.statusLabel = QtWidgets.QLabel(self)
+        layout.addWidget(self.statusLabel)
+
+    ##### Public Methods #####
+
+    def setComponentTypes(self, componentTypes):
+        current = self.typeField.currentText()
+
+        self.typeField.blockSignals(True)
+        self.typeField.clear()
+        self.typeField.addItem('')
+        self.typeField.addItems(componentTypes)
+        self.typeField.setCurrentIndex(max(self.typeField.findText(current), 0))
+        self.typeField.blockSignals(False)
+
+    def setResults(self, results):
+        '''
+        Shows a list of (name, path, componentCount) tuples.
+        '''
+        self.resultList.clear()
+
+        for name, path, componentCount in results:
+            item = QtWidgets.QTreeWidgetItem([name, str(componentCount), path])
+            item.setData(0, QtCore.Qt.UserRole, path)
+            self.resultList.addTopLevelItem(item)
+
+        self.statusLabel.setText('%d rigs found' % len(results))
+
+    def setStatus(self, message):
+        self.statusLabel.setText(message)
+
+    ##### Slots #####
+
+    @Slot()
+    def search(self):
+        self.onSearch.emit(self.nameField.text(), self.typeField.currentText(), self.targetField.text())
+
+    @Slot()
+    def _onAddFolderClicked(self):
+        folder = QtWidgets.QFileDialog.getExistingDirectory(self, 'Add Library Folder')
+        if folder:
+            self.onAddFolder.emit(folder)
+
+    @Slot()
+    def _onLoadClicked(self):
+        item = self.resultList.currentItem()
+        if item is not None:
+            self._onItemDoubleClicked(item)
+
+    def _onItemDoubleClicked(self, item, column=0):
+        self.onRigChosen.emit(item.data(0, QtCore.Qt.UserRole))
+        self.accept()
+
 ##############################
 #      Component Widget      #
 ##############################
 
+class ComponentRow(object):
+    '''
+    A row of the component list.
+    Only rows near the visible part of the list hold a component widget and the line drawn under it. The window
+    stands in for the other rows with spacers, sized from the height each row was last drawn at, so the scroll
+    position doesn't move as widgets are created and released.
+    '''
+
+    def __init__(self, id):
+        self.id = id
+        self.widget = None
+        self.line = None
+
+        # Whether the row matches the current search
+        self.visible = True
+
+        # The height of the row, rows that were never shown use the height of a collapsed title
+        self.height = COMPONENT_ROW_HEIGHT
+
+    def setWidget(self, widget, line):
+        self.widget = widget
+        self.line = line
+
+    def takeWidget(self):
+        widget = self.widget
+        if widget is None:
+            return None
+
+        self.measure()
+        self.widget = None
+        self.line = None
+
+        return widget
+
+    def measure(self):
+        # Only a widget that has been drawn knows its height
+        if self.widget is not None and self.widget.isVisible():
+            self.height = self.widget.height() + self.line.height()
+
 class ComponentWidget(QtWidgets.QWidget):
     '''
     A widget to display a single component.
@@ -1008,7 +1863,9 @@ class ComponentWidget(QtWidgets.QWidget):
     # These alert the window to changes in the gui
     onAddSelected = Signal(str)
     onUpdateData = Signal(str, dict)
-    onNameChanged = Signal(str, str)
+
+    # Lets the window know this component has edits waiting, the str is the id
+    onEdited = Signal(str)
 
     # Widget Signals
     # These alert the ui to changes in the data
@@ -1016,7 +1873,6 @@ class ComponentWidget(QtWidgets.QWidget):
     onRemoveComponentClicked = Signal(str)
     onMoveComponentClicked = Signal(str, bool)
     onDuplicateComponentClicked = Signal(str)
-    onUpdateNameList = Signal(str, str)
 
     def __init__(self, name, componentData, parent, id, componentTypeData, controlTypeData, componentSettings, index):
         QtWidgets.QWidget.__init__(self)
@@ -1027,6 +1883,9 @@ class ComponentWidget(QtWidgets.QWidget):
         # Grab a reference to the parent widget
         self.parent = parent
 
+        # Grab the list of components the space widgets choose from
+        self.spaceModel = parent.spaceModel
+
         # Grab a reference to the component dictionary
         self.arguments = componentData[id]
 
@@ -1069,20 +1928,48 @@ class ComponentWidget(QtWidgets.QWidget):
         vertical_layout.addWidget(self.argumentContainer)
 
         # Create a vertical layout to house the groupboxes
-        groupLayout = QtWidgets.QVBoxLayout()
-        self.argumentContainer.setLayout(groupLayout)
+        self.groupLayout = QtWidgets.QVBoxLayout()
+        self.argumentContainer.setLayout(self.groupLayout)
 
         # Create a list to store argumentWidgets
+        # These are only created while the component is expanded, the component data holds the values otherwise
         self.argumentWidgets = {}
+        self._expanded = False
+
+        # Release the argument widgets once the component has been collapsed for a while
+        self._releaseTimer = QtCore.QTimer(self)
+        self._releaseTimer.setSingleShot(True)
+        self._releaseTimer.setInterval(ARGUMENT_RELEASE_DELAY)
+        self._releaseTimer.timeout.connect(self._releaseArguments)
+
+        # The arguments edited in the view since the controller last took them
+        self._dirty = set()
+
+        # Edited values whose widgets were released before the controller took them
+        # The component data belongs to the model, so the view never writes into it
+        self._pending = {}
+
+        # Store the arguments the widgets were created for, to know when they need creating again
+        self._argumentKeys = set(self.arguments)
+        self._type = self.arguments['type']
+
+        # Set the default state of visibility
+        self.hidden = self.arguments['hidden']
+
+    def _buildArguments(self):
+
+        if self.argumentWidgets:
+            return
+
+        self.logger.debug('Creating argument widgets for %s', self.name)
 
         for groupTuple in COMPONENT_GROUPS:
 
             groupBox = self._addArgumentGroup(groupTuple)
-            
+
             if groupBox:
-                groupLayout.addWidget(groupBox)
+                self.groupLayout.addWidget(groupBox)
 
-        
         extraArguments = [argument for argument in self.arguments if argument not in self.argumentWidgets]
 
         if len(extraArguments) > 0:
@@ -1090,22 +1977,31 @@ class ComponentWidget(QtWidgets.QWidget):
             groupBox = self._addArgumentGroup(tuple)
 
             if groupBox:
-                groupLayout.addWidget(groupBox)
-        
+                self.groupLayout.addWidget(groupBox)
+
         # Set any name changes to update the title
         self.argumentWidgets['name'].textChanged.connect(self._updateTitle)
-        self.argumentWidgets['name'].nameChanged.connect(self.onNameChanged)
 
-        for name, widget in self.argumentWidgets.iteritems():
-            if isinstance(widget, QRigComponentComboBox):
-                self.onUpdateNameList.connect(widget.onNameChanged)
 
-        # Set the default state of visibility
-        try:
-            self.hidden = self.arguments['hidden']
-        except KeyError:
-            self.logger.info('No hidden argument found, setting hidden to default.')
-            self.hidden = False
+    @Slot()
+    def _releaseArguments(self):
+
+        if self._expanded or not self.argumentWidgets:
+            return
+
+        self.logger.debug('Releasing argument widgets for %s', self.name)
+
+        # Keep any edits the controller hasn't taken yet before the widgets go
+        for key in self._dirty:
+            if key in self.argumentWidgets:
+                self._pending[key] = self.argumentWidgets[key].value
+
+        self.argumentWidgets = {}
+
+        while self.groupLayout.count():
+            groupBox = self.groupLayout.takeAt(0).widget()
+            if groupBox is not None:
+                groupBox.deleteLater()
 
     def _addTitle(self):
 
@@ -1128,10 +2024,8 @@ class ComponentWidget(QtWidgets.QWidget):
         # Add an arrow icon
         self.rightArrowLabel = QtWidgets.QLabel(self.titleButton)
         self.downArrowLabel = QtWidgets.QLabel(self.titleButton)
-        rightArrow = QtGui.QIcon(':/arrowRight.png').pixmap(size)
-        downArrow = QtGui.QIcon(':/arrowDown.png').pixmap(size)
-        self.rightArrowLabel.setPixmap(rightArrow)
-        self.downArrowLabel.setPixmap(downArrow)
+        self.rightArrowLabel.setPixmap(cachedPixmap(':/arrowRight.png', size))
+        self.downArrowLabel.setPixmap(cachedPixmap(':/arrowDown.png', size))
 
         titleLayout.addWidget(self.rightArrowLabel)
         titleLayout.addWidget(self.downArrowLabel)
@@ -1140,35 +2034,34 @@ class ComponentWidget(QtWidgets.QWidget):
         basePath = os.path.dirname(os.path.realpath(__file__))
 
         try:
-            icon = QtGui.QIcon(basePath + self.componentTypeData[self.arguments['type']]['icon'])
+            self._iconPath = basePath + self.componentTypeData[self.arguments['type']]['icon']
         except KeyError:
             self.logger.info('Not Icon set in component settings, using icon for basicComponent instead')
-            icon = QtGui.QIcon(basePath + self.componentTypeData['BasicComponent']['icon'])
+            self._iconPath = basePath + self.componentTypeData['BasicComponent']['icon']
+        self._iconSize = size
+
+        # The pixmap is set by the enabled state
         self.iconLabel = QtWidgets.QLabel()
-        self.iconLabel.setPixmap(icon.pixmap(size))
         titleLayout.addWidget(self.iconLabel)
 
         # Add an enabling checkbox
         checkBox = QtWidgets.QCheckBox()
         titleLayout.addWidget(checkBox)
+        self.enabledCheckBox = checkBox
 
         # Add a title
         self.title = QtWidgets.QLabel(self._getTitle(self.name))
         titleLayout.addWidget(self.title)
 
         # Set the default state of enabled
-        try:
-            self.enabled = self.arguments['enabled']
-        except KeyError:
-            self.logger.info('No enabled state found in %s, setting to default', self.name)
-            self.enabled = True
+        self.enabled = self.arguments['enabled']
         checkBox.setChecked(self.enabled)
         checkBox.toggled.connect(self._toggleEnabled)
 
         # Add a settings button
         settingsButton = QtWidgets.QPushButton()
         settingsButton.setFlat(True)
-        settingsIcon = QtGui.QIcon(':/gear.png')
+        settingsIcon = cachedIcon(':/gear.png')
         settingsButton.setIcon(settingsIcon)
 
         # Create a menu for the button
@@ -1193,7 +2086,17 @@ class ComponentWidget(QtWidgets.QWidget):
         titleLayout.addWidget(settingsButton)
         titleLayout.setAlignment(settingsButton, QtCore.Qt.AlignRight)
 
+    # This marks a single argument as edited when its widget changes
+    def _onArgumentChangedGenerator(self, key):
+
+        def onArgumentChanged():
+            self._dirty.add(key)
+            self.onValueChanged()
+
+        return onArgumentChanged
+
     def _toggle_visibility(self):
+        self._dirty.add('hidden')
         self.hidden = not self.hidden
         try:
             self.arrowLabel.setPixmap(self.arrow2)
@@ -1204,12 +2107,23 @@ class ComponentWidget(QtWidgets.QWidget):
         self.onValueChanged()
 
     def _toggleEnabled(self):
+        self._dirty.add('enabled')
         self.enabled = not self.enabled
         self.onValueChanged()
 
     def _getTitle(self, name):
         return self.arguments['type'] + ' : ' + name
 
+    def setControlTypeData(self, controlTypeData):
+        '''
+        Fills in the control lists of the argument widgets, keeping each one's chosen control.
+        '''
+        self.controlTypeData = controlTypeData
+
+        for widget in self.argumentWidgets.values():
+            if isinstance(widget, QControlComboBox):
+                widget.setControlTypes(controlTypeData)
+
     def _createArgumentWidget(self, key, value):
         # Create the widget for the argument
         try:
@@ -1219,7 +2133,7 @@ class ComponentWidget(QtWidgets.QWidget):
             self.argumentWidgets[key] = widget
 
             # Connect to the widget's value changed signal
-            widget.onValueChanged.connect(self.onValueChanged)
+            widget.onValueChanged.connect(self._onArgumentChangedGenerator(key))
             return widget
         except KeyError:
             if not key in COMPONENT_SETTINGS_DEBUG and not key in COMPONENT_SETTINGS_ADVANCED:
@@ -1238,7 +2152,7 @@ class ComponentWidget(QtWidgets.QWidget):
         for name in types:
             widget = None
             try:
-                widget = self._createArgumentWidget(name, self.arguments[name])
+                widget = self._createArgumentWidget(name, self._pending.get(name, self.arguments[name]))
             except KeyError:
                 pass
 
@@ -1262,6 +2176,61 @@ class ComponentWidget(QtWidgets.QWidget):
 
         return None
 
+    #### Public Methods #####
+
+    def isOutdated(self, componentData):
+        '''
+        Returns True if the component's type or arguments changed, so its argument widgets have to be created again.
+        '''
+        arguments = componentData[self.id]
+        return arguments['type'] != self._type or set(arguments) != self._argumentKeys
+
+    def setData(self, componentData):
+        '''
+        Updates the argument widgets with new component data, leaving widgets with unchanged values alone.
+        '''
+        self.componentData = componentData
+        self.arguments = componentData[self.id]
+        self.index = self.arguments['index']
+
+        for key, widget in self.argumentWidgets.iteritems():
+            widget.componentData = componentData
+            if key in self.arguments and widget.value != self.arguments[key]:
+                # Setting the value shouldn't send it straight back to the controller
+                widget.blockSignals(True)
+                widget.value = self.arguments[key]
+                widget.blockSignals(False)
+
+        self.name = self.arguments['name']
+        self._updateTitle()
+
+        self.hidden = self.arguments['hidden']
+        self.enabled = self.arguments['enabled']
+        self.enabledCheckBox.blockSignals(True)
+        self.enabledCheckBox.setChecked(self.enabled)
+        self.enabledCheckBox.blockSignals(False)
+
+    def takeDirtyValues(self):
+        '''
+        Returns the values of only the arguments edited since the last call, then marks them clean.
+        '''
+        values = {}
+        for key in self._dirty:
+            if key == 'hidden':
+                values[key] = self.hidden
+            elif key == 'enabled':
+                values[key] = self.enabled
+            elif key in self.argumentWidgets:
+                values[key] = self.argumentWidgets[key].value
+            elif key in self._pending:
+                values[key] = self._pending[key]
+            elif key in self.arguments:
+                values[key] = self.arguments[key]
+
+        self._dirty.clear()
+        self._pending = {}
+        return values
+
     #### Properties #####
 
     @property
@@ -1277,8 +2246,8 @@ class ComponentWidget(QtWidgets.QWidget):
             try:
                 value = self.argumentWidgets[key].value
             except KeyError:
-                self.logger.info('Value for %s not found, using original value instead', key)
-                value = self.arguments[key]
+                # Collapsed components have no argument widgets, their data holds the values besides unsent edits
+                value = self._pending.get(key, self.arguments[key])
 
             data[key] = value
         data['hidden'] = self.hidden
@@ -1289,10 +2258,19 @@ class ComponentWidget(QtWidgets.QWidget):
 
     @property
     def hidden(self):
-        return self.argumentContainer.isVisible()
+        return self._expanded
 
     @hidden.setter
     def hidden(self, value):
+        self._expanded = bool(value)
+
+        # Build the argument widgets the first time the component is expanded
+        if value:
+            self._releaseTimer.stop()
+            self._buildArguments()
+        elif self.argumentWidgets:
+            self._releaseTimer.start()
+
         self.argumentContainer.setVisible(value)
         self.downArrowLabel.setVisible(value)
         self.rightArrowLabel.setVisible(not value)
@@ -1304,22 +2282,27 @@ class ComponentWidget(QtWidgets.QWidget):
     @enabled.setter
     def enabled(self, value):
         self.title.setEnabled(value)
-        self.iconLabel.setEnabled(value)
+
+        # Use the cached disabled pixmap, rather than having the label render one each time it is drawn
+        mode = QtGui.QIcon.Normal if value else QtGui.QIcon.Disabled
+        self.iconLabel.setPixmap(cachedPixmap(self._iconPath, self._iconSize, mode))
 
     ##### Slots #####
 
     @Slot()
     def _updateTitle(self):
-        self.title.setText(self._getTitle(self.argumentWidgets['name'].value))
+        try:
+            name = self.argumentWidgets['name'].value
+        except KeyError:
+            name = self.arguments['name']
+        self.title.setText(self._getTitle(name))
 
     @Slot()
     # A widget calls this to let the component know something changed
     def onValueChanged(self):
 
-        self.logger.debug('Value changed signal received, updating data for %s', self.name)
-
-        # Send this components id and value
-        self.onUpdateData.emit(self.id, self.value)
+        # The window collects the edited values once edits stop, so nothing is read from the widgets yet
+        self.onEdited.emit(self.id)
 
     @Slot()
     def onAddSelectedSlot(self):
@@ -1490,7 +2473,20 @@ class QControlComboBox(QtWidgets.QComboBox, ComponentArgumentWidget):
         # Alert the component when a value is changed
         self.activated.connect(self.onValueChanged)
 
+        # The control the component uses, kept for when the control library hasn't been read yet
+        self._control = None
+
+        self.addItems(controlTypeData)
+
+    def setControlTypes(self, controlTypeData):
+        control = self.currentText() or self._control
+
+        self.blockSignals(True)
+        self.clear()
         self.addItems(controlTypeData)
+        self.blockSignals(False)
+
+        self.value = control
 
     @property
     def value(self):
@@ -1498,6 +2494,7 @@ class QControlComboBox(QtWidgets.QComboBox, ComponentArgumentWidget):
 
     @value.setter
     def value(self, value):
+        self._control = value
         self.setCurrentIndex(self.findText(value))
 
 class QComponentComboBox(QtWidgets.QComboBox, ComponentArgumentWidget):
@@ -1531,38 +2528,29 @@ class QRigComponentComboBox(QtWidgets.QComboBox, ComponentArgumentWidget):
         # Grab a reference to the componentData
         self.componentData = componentData
 
-        # Add all the components names from the componentData
-        id = parent.id
-        self.addItems([value['name'] for key, value in componentData.iteritems() if key is not id])
-        self.ids = [key for key, value in componentData.iteritems() if key is not id]
-        self.addItem('world')
-        self.ids.append(None)
-
-        # Create a variable to hold the current selections id
-        self._id = None
+        # View the window's shared list of components, leaving out this widget's own component
+        self.proxyModel = ComponentFilterProxyModel(parent.id, self)
+        self.proxyModel.setSourceModel(parent.spaceModel)
+        self.setModel(self.proxyModel)
 
     @property
     def value(self):
-        return self.ids[self.currentIndex()]
+        return self.itemData(self.currentIndex(), ComponentListModel.IdRole)
 
     @value.setter
     def value(self, value):
 
-        if value is None:
-            self.setCurrentIndex(self.findText('world'))
-        if value in self.componentData:
-            if value in self.ids:
-                self.setCurrentIndex(self.findText(self.componentData[value]['name']))
-            else:
+        index = -1
+        if value is not None:
+            index = self.findData(value, ComponentListModel.IdRole)
+            if index < 0:
                 self.logger.warning('Component ID: %s not found', value)
-                self.setCurrentIndex(self.findText('world'))
-        else:
-            self.setCurrentIndex(self.findText('world'))
 
-    @Slot(str, str)
-    def onNameChanged(self, oldName, newName):
+        # World is always the last item
+        if index < 0:
+            index = self.count() - 1
 
-        self.setItemText(self.findText(oldName), newName)
+        self.setCurrentIndex(index)
 
 class QVectorWidget(QtWidgets.QWidget, ComponentArgumentWidget):
     def __init__(self, parent, componentData, componentTypeData, controlTypeData):
@@ -1775,6 +2763,7 @@ class QColorWidget(QtWidgets.QPushButton, ComponentArgumentWidget):
         color = QtWidgets.QColorDialog.getColor()
         self.color = [float(color.red())/255, float(color.green())/255, float(color.blue())/255]
         self.setStyleSheet("QWidget { background-color: %s}" % color.name())
+        self.onValueChanged.emit()
 
 
 ##############################
@@ -1980,6 +2969,7 @@ TEST_COMPONENT_DATA = {
         'parentSpace': 'hipID',
         'uprightSpace': 'hipID',
         'hidden': False,
+        'enabled': True,
         'stretchEnabled': False,
         'squashEnabled': False
     },
@@ -1992,7 +2982,8 @@ TEST_COMPONENT_DATA = {
         'aimAxis': [1, 0, 0],
         'parentSpace': 'rootID',
         'uprightSpace': 'rootID',
-        'hidden': False
+        'hidden': False,
+        'enabled': True
 
     },
     'rootID': {
@@ -2004,7 +2995,8 @@ TEST_COMPONENT_DATA = {
         'aimAxis': [1, 0, 0],
         'parentSpace': None,
         'uprightSpace': None,
-        'hidden': False
+        'hidden': False,
+        'enabled': True
     }
 }
 
@@ -0,0 +1,139 @@
+import ast
+import json
+import maya.cmds as cmds
+import maya.api.OpenMaya as om2
+
+
+NODE_NAME = 'rigloo_rigs'
+
+# The fileInfo key rigs were cached under before the metadata node existed
+LEGACY_KEY = 'rigs'
+
+
+class RigMetadata(object):
+    '''
+    Stores the data of each bound rig on a network node in the scene.
+    Every rig is a separate json record in a multi attribute, so updating one rig never touches the others.
+    The records are mirrored in memory. The mirror is reloaded when a scene is opened or created, after an undo or
+    redo, since either could have changed a record, and when the node is deleted.
+    '''
+    def __init__(self, nodeName=NODE_NAME):
+        self.nodeName = nodeName
+
+        # Rig data and the attribute index it is stored at, keyed by rig name
+        self._records = None
+
+        self._callbacks = []
+
+    def get(self, rigName):
+        '''
+        :return: The cached data for a rig, or None if the rig is not cached.
+        '''
+        try:
+            return self._load()[rigName][1]
+        except KeyError:
+            return None
+
+    def set(self, rigName, data):
+        '''
+        Caches the data for a rig, replacing any previous record for it.
+        '''
+        records = self._load()
+
+        try:
+            index = records[rigName][0]
+        except KeyError:
+            index = max([i for i, _ in records.values()] or [-1]) + 1
+
+        node = self._createNode()
+        cmds.setAttr('%s.rigs[%d].rigName' % (node, index), rigName, type='string')
+        cmds.setAttr('%s.rigs[%d].rigData' % (node, index), json.dumps(data, separators=(',', ':')), type='string')
+
+        records[rigName] = (index, data)
+
+    def remove(self, rigName):
+        '''
+        Removes the record for a rig.
+        :raises KeyError: If the rig is not cached
+        '''
+        index = self._load().pop(rigName)[0]
+        cmds.removeMultiInstance('%s.rigs[%d]' % (self.nodeName, index), b=True)
+
+    def items(self):
+        return [(rigName, data) for rigName, (_, data) in self._load().iteritems()]
+
+    def reload(self, *args):
+        self._records = None
+
+    def __contains__(self, rigName):
+        return rigName in self._load()
+
+    #### Private Methods ####
+
+    def _load(self):
+        if self._records is not None:
+            return self._records
+
+        self._install()
+
+        records = {}
+        if cmds.objExists(self.nodeName + '.rigs'):
+            for index in cmds.getAttr(self.nodeName + '.rigs', multiIndices=True) or []:
+                rigName = cmds.getAttr('%s.rigs[%d].rigName' % (self.nodeName, index))
+                rigData = cmds.getAttr('%s.rigs[%d].rigData' % (self.nodeName, index))
+                if rigName and rigData:
+                    records[rigName] = (index, json.loads(rigData))
+
+        self._records = records
+        self._migrate()
+
+        return self._records
+
+    def _migrate(self):
+        # Move rigs cached in fileInfo by older versions onto the node
+        legacy = cmds.fileInfo(LEGACY_KEY, query=True)
+        if not legacy:
+            return
+
+        try:
+            # The old data was written with repr, so parse it as a literal instead of evaluating it
+            rigs = ast.literal_eval(legacy[0].decode('string_escape'))
+        except (ValueError, SyntaxError):
+            rigs = {}
+
+        for rigName, data in rigs.iteritems():
+            if rigName not in self._records:
+                self.set(rigName, data)
+
+        cmds.fileInfo(remove=LEGACY_KEY)
+
+    def _createNode(self):
+        if not cmds.objExists(self.nodeName):
+            cmds.createNode('network', name=self.nodeName, skipSelect=True)
+
+        if not cmds.attributeQuery('rigs', node=self.nodeName, exists=True):
+            cmds.addAttr(self.nodeName, longName='rigs', attributeType='compound', multi=True, numberOfChildren=2)
+            cmds.addAttr(self.nodeName, longName='rigName', dataType='string', parent='rigs')
+            cmds.addAttr(self.nodeName, longName='rigData', dataType='string', parent='rigs')
+
+        return self.nodeName
+
+    def _install(self):
+        if self._callbacks:
+            return
+
+        self._callbacks = [
+            om2.MSceneMessage.addCallback(om2.MSceneMessage.kAfterOpen, self.reload),
+            om2.MSceneMessage.addCallback(om2.MSceneMessage.kAfterNew, self.reload),
+            om2.MSceneMessage.addCallback(om2.MSceneMessage.kAfterImport, self.reload),
+            om2.MEventMessage.addEventCallback('Undo', self.reload),
+            om2.MEventMessage.addEventCallback('Redo', self.reload),
+            om2.MDGMessage.addNodeRemovedCallback(self._onNodeRemoved, 'network')
+        ]
+
+    def _onNodeRemoved(self, node, *args):
+        if om2.MFnDependencyNode(node).name() == self.nodeName:
+            self.reload()
+
+
+metadata = RigMetadata()
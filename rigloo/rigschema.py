@@ -0,0 +1,356 @@
+import copy
+
+
+# The version of the component data layout, stamped into every saved rig file
+# Rig files saved before versioning count as version 0
+SCHEMA_VERSION = 1
+
+########## Component Types ###############
+COMPONENT_TYPES = {
+    'BasicComponent': {
+        'name': 'defaultComponent',
+        'type': 'BasicComponent',
+        'mainControlType': 'default',
+        'mainControlScale': 10.0,
+        'target': None,
+        'parentSpace': None,
+        'uprightSpace': None,
+        'icon': "/icons/icon-BasicComponent.svg",
+        'enabled': True,
+        'spaceSwitchEnabled': False,
+        'useCustomCurve': False,
+        'hidden': False,
+        'mainControlData': None,
+        'mainControlColor': [0.0,0.0,1.0]
+    },
+    'ScaleComponent': {
+        'name': 'defaultScaleComponent',
+        'type': 'ScaleComponent',
+        'mainControlType': 'default',
+        'mainControlScale': 10.0,
+        'target': None,
+        'parentSpace': None,
+        'uprightSpace': None,
+        'icon': "/icons/icon-ScaleComponent.svg",
+        'enabled': True,
+        'hidden': False,
+        'spaceSwitchEnabled': False,
+        'useCustomCurve': False,
+        'mainControlData': None,
+        'mainControlColor': [0.0,0.0,1.0]
+    },
+    'FKComponent': {
+        'name': 'defaultFKComponent',
+        'type': 'FKComponent',
+        'mainControlType': 'default',
+        'mainControlScale': 10.0,
+        'target': None,
+        'parentSpace': None,
+        'uprightSpace': None,
+        'icon': "/icons/icon-FKComponent.svg",
+        'enabled': True,
+        'hidden': False,
+        'spaceSwitchEnabled': False,
+        'isLeafJoint': False,
+        'useCustomCurve': False,
+        'mainControlData': None,
+        'mainControlColor': [0.0,0.0,1.0]
+    },
+    'IKComponent': {
+        'name': 'defaultIKComponent',
+        'type': 'IKComponent',
+        'mainControlType': 'cube',
+        'mainControlScale': 10.0,
+        'bindTargets': [],
+        'parentSpace': None,
+        'uprightSpace': None,
+        'stretchEnabled': False,
+        'squashEnabled': False,
+        'icon': "/icons/icon-IKComponent.svg",
+        'poleVectorEnabled': True,
+        'enabled': True,
+        'hidden': False,
+        'spaceSwitchEnabled': False,
+        'isLeafJoint': False,
+        'useCustomCurve': False,
+        'mainControlData': None,
+        'poleCurveType': 'triangle',
+        'poleCurveScale': 1.0,
+        'poleCurveDistance': 5.0,
+        'baseCurveType':'cube',
+        'baseCurveScale':10.0,
+        'baseParentSpace':None,
+        'baseUprightSpace':None,
+        'baseSpaceSwitchEnabled':False,
+        'useCustomBaseCurve':False,
+        'useCustomOffsetCurve':False,
+        'useCustomPoleCurve':False,
+        'offsetCurveType':'sphere',
+        'offsetCurveScale':5.0,
+        'mainControlColor': [0.0,0.0,1.0],
+        'stretchScale':1.0,
+        'squashScale':1.0
+    },
+    'LegIKComponent': {
+        'name': 'defaultIKComponent',
+        'type': 'LegIKComponent',
+        'mainControlType': 'cube',
+        'mainControlScale': 10.0,
+        'bindTargets': [],
+        'parentSpace': None,
+        'uprightSpace': None,
+        'stretchEnabled': False,
+        'squashEnabled': False,
+        'icon': "/icons/icon-IKComponent.svg",
+        'poleVectorEnabled': True,
+        'enabled': True,
+        'hidden': False,
+        'spaceSwitchEnabled': False,
+        'isLeafJoint': False,
+        'useCustomCurve': False,
+        'mainControlData': None,
+        'poleCurveType': 'triangle',
+        'poleCurveScale': 1.0,
+        'poleCurveDistance': 5.0,
+        'baseCurveType':'cube',
+        'baseCurveScale':10.0,
+        'baseParentSpace':None,
+        'baseUprightSpace':None,
+        'baseSpaceSwitchEnabled':False,
+        'offsetCurveType':'sphere',
+        'offsetCurveScale':5.0,
+        'mainControlColor': [0.0,0.0,1.0],
+        'stretchScale':1.0,
+        'useCustomBaseCurve':False,
+        'useCustomOffsetCurve':False,
+        'useCustomPoleCurve':False,
+        'squashScale':1.0
+    },
+    'MultiFKComponent': {
+        'name': 'defaultMultiFKComponent',
+        'type': 'MultiFKComponent',
+        'mainControlType': 'default',
+        'mainControlScale': 10.0,
+        'bindTargets': [],
+        'parentSpace': None,
+        'uprightSpace': None,
+        'stretchEnabled': False,
+        'squashEnabled': False,
+        'icon': "/icons/icon-MultiFKComponent.svg",
+        'enabled': True,
+        'hidden': False,
+        'spaceSwitchEnabled': False,
+        'isLeafJoint': False,
+        'useCustomCurve': False,
+        'mainControlData': None,
+        'mainControlColor': [0.0,0.0,1.0],
+        'stretchScale':1.0,
+        'squashScale':1.0
+    },
+    'SpineIKComponent': {
+        'name': 'defaultSpineIKComponent',
+        'type': 'SpineIKComponent',
+        'mainControlType': 'square',
+        'mainControlScale': 30.0,
+        'bindTargets': [],
+        'aimAxis': [1,0,0],
+        'parentSpace': None,
+        'uprightSpace': None,
+        'stretchEnabled': False,
+        'squashEnabled': False,
+        'icon': "/icons/icon-SpineIKComponent.svg",
+        'enabled': True,
+        'hidden': False,
+        'spaceSwitchEnabled': False,
+        'isLeafJoint': False,
+        'useCustomCurve': False,
+        'mainControlData': None,
+        'mainControlColor': [0.0,0.0,1.0],
+        'secondaryParentSpace': None,
+        'secondaryUprightSpace': None,
+        'secondarySpaceSwitchEnabled': False,
+        'secondaryCurveType': 'default',
+        'secondaryCurveScale': 30.0,
+        'useCustomSecondaryCurve':False,
+        'spineControlScale':5.0,
+        'spineControlType':'default',
+        'useCustomSpineCurve':False,
+        'stretchScale':1.0,
+        'squashScale':1.0
+    }
+}
+
+# Keys every component has, on top of the defaults of its type
+COMMON_KEYS = ('id', 'index', 'hidden', 'enabled', 'type', 'name', 'mainControlData')
+
+# Settings the window reads from every component, even one whose type is unknown
+COMMON_DEFAULTS = {
+    'hidden': False,
+    'enabled': True
+}
+
+# Fields holding the id of another component
+SPACE_KEYS = ('parentSpace', 'uprightSpace', 'baseParentSpace', 'baseUprightSpace',
+              'secondaryParentSpace', 'secondaryUprightSpace')
+
+
+########## Validation ###############
+def validate(componentData):
+    '''
+    Checks rig data against the component schemas.
+    :param componentData: The component data dictionary
+    :return: A tuple of lists with the errors and warnings found
+    '''
+    errors = []
+    warnings = []
+
+    if not isinstance(componentData, dict):
+        return ['Rig data is not a dictionary'], warnings
+
+    indexes = []
+    for id, component in componentData.iteritems():
+        if not isinstance(component, dict):
+            errors.append('%s: Component data is not a dictionary' % id)
+            continue
+
+        componentErrors, componentWarnings = validate_component(component, componentData)
+        name = component.get('name', id)
+        errors.extend('%s: %s' % (name, e) for e in componentErrors)
+        warnings.extend('%s: %s' % (name, w) for w in componentWarnings)
+
+        if component.get('id', id) != id:
+            errors.append('%s: Id %s does not match its key %s' % (name, component.get('id'), id))
+
+        indexes.append(component.get('index'))
+
+    if sorted(i for i in indexes if i is not None) != list(range(1, len(indexes) + 1)):
+        warnings.append('Component indexes are not a sequence from 1 to %d' % len(indexes))
+
+    return errors, warnings
+
+
+def validate_component(component, componentData=None):
+    '''
+    Checks a single component against the schema for its type.
+    :param component: The component's data
+    :param componentData: The rig's component data, used to check space ids
+    :return: A tuple of lists with the errors and warnings found
+    '''
+    errors = []
+    warnings = []
+
+    try:
+        defaults = COMPONENT_TYPES[component['type']]
+    except KeyError:
+        return ['Unknown component type %s' % component.get('type')], warnings
+
+    for key, default in defaults.iteritems():
+        if key not in component:
+            warnings.append('Missing %s' % key)
+        elif not _matches_type(component[key], default):
+            errors.append('%s should be a %s, not %r' % (key, type(default).__name__, component[key]))
+
+    for key in component:
+        if key not in defaults and key not in COMMON_KEYS:
+            warnings.append('Unknown setting %s' % key)
+
+    if componentData is not None:
+        for key in SPACE_KEYS:
+            space = component.get(key)
+            if space and space not in componentData:
+                warnings.append('%s refers to a missing component' % key)
+
+    return errors, warnings
+
+
+########## Migration ###############
+def upgrade(componentData, version):
+    '''
+    Runs every migration needed to bring component data saved at an older schema version up to date, in place.
+    Component data that is already at the current version is left untouched, without any checks.
+    :param componentData: The component data dictionary
+    :param version: The schema version the data was saved at
+    :return: A list describing every change made
+    '''
+    changes = []
+    for step in range(version, SCHEMA_VERSION):
+        changes.extend(MIGRATIONS[step](componentData))
+    return changes
+
+
+def migrate(componentData):
+    '''
+    Brings component data saved before schema versioning up to date, in place.
+    Missing settings get the default for their component type, and missing indexes are added after the existing ones.
+    :param componentData: The component data dictionary
+    :return: A list describing every change made
+    '''
+    changes = []
+
+    # Components that aren't dictionaries are left for validate to report
+    components = [(id, component) for id, component in componentData.iteritems() if isinstance(component, dict)]
+
+    # Components without an index keep their order in the file, after every indexed component
+    # Rig files keep their components in file order when they are read, so iterating them follows the file
+    unindexed = [id for id, component in components if 'index' not in component]
+    nextIndex = max([c['index'] for id, c in components if 'index' in c] or [0]) + 1
+
+    for id in unindexed:
+        componentData[id]['index'] = nextIndex
+        changes.append('%s: Added index %d' % (id, nextIndex))
+        nextIndex += 1
+
+    for id, component in components:
+        changes.extend('%s: %s' % (id, change) for change in migrate_component(component, id))
+
+    return changes
+
+
+def migrate_component(component, id=None):
+    '''
+    Adds any settings missing from a single component, in place.
+    :return: A list describing every change made
+    '''
+    changes = []
+
+    if id is not None and 'id' not in component:
+        component['id'] = id
+        changes.append('Added id')
+
+    # Added before the type's defaults, so components of an unknown or removed type can still be shown
+    for key, default in COMMON_DEFAULTS.iteritems():
+        if key not in component:
+            component[key] = default
+            changes.append('Added %s' % key)
+
+    try:
+        defaults = COMPONENT_TYPES[component['type']]
+    except KeyError:
+        return changes
+
+    for key, default in defaults.iteritems():
+        if key not in component:
+            component[key] = copy.deepcopy(default)
+            changes.append('Added %s' % key)
+
+    return changes
+
+
+# The migration from each schema version to the next, indexed by the version migrated from
+MIGRATIONS = [
+    migrate
+]
+
+
+########## Private Functions ###############
+def _matches_type(value, default):
+    # Settings that default to None can hold anything, such as ids, names or curve data
+    if default is None or value is None:
+        return True
+    if isinstance(default, bool):
+        return isinstance(value, bool)
+    if isinstance(default, (int, float)):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if isinstance(default, list):
+        return isinstance(value, list)
+    return isinstance(value, basestring)
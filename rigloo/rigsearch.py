@@ -0,0 +1,197 @@
+import re
+import bisect
+
+import rigschema
+
+
+# The fields searched by plain text, and the qualifiers that search a single field
+SEARCH_FIELDS = {
+    'name': ('name',),
+    'type': ('type',),
+    'target': ('target', 'bindTargets'),
+    'space': rigschema.SPACE_KEYS
+}
+
+# Splits names into words, so l_thigh_jnt can be found by thigh, and namespaces and paths by their last part
+_WORD_SPLIT = re.compile(r'[^0-9a-zA-Z]+')
+
+
+class ComponentIndex(object):
+    '''
+    A search index over the components of a rig, updated a component at a time.
+    Names, types and target joints are indexed by every word they contain, in a sorted list of terms so any
+    prefix is found with a binary search. Space references are kept in a reverse index, to find the components
+    that use a component as a space.
+    '''
+    def __init__(self, componentData=None):
+        self.clear()
+
+        if componentData:
+            self.update(componentData)
+
+    def clear(self):
+        # Sorted terms, and the (field, component id) pairs each term was indexed for
+        self._terms = []
+        self._postings = {}
+
+        # The terms, spaces and name indexed for each component, used to take a component out of the index
+        self._componentTerms = {}
+        self._componentSpaces = {}
+        self._componentNames = {}
+
+        # Maps a component id to the (component id, space key) pairs that use it as a space
+        self._spaceUsers = {}
+
+        # Maps a lower case name to the ids of the components with it
+        self._names = {}
+
+    def update(self, componentData, ids=None):
+        '''
+        Brings the index up to date with the component data.
+        :param componentData: The rig's component data dictionary
+        :param ids: The ids of the components added, removed or changed since the last update, or None to index
+                    everything
+        '''
+        if ids is None:
+            self.clear()
+            ids = list(componentData)
+
+        for id in ids:
+            self._remove(id)
+            if id in componentData:
+                self._add(id, componentData[id])
+
+    def search(self, text):
+        '''
+        Finds the components matching every word of a search.
+        Words are matched against the start of any word in a component's name, type and targets.
+        A word can be limited to one field with a qualifier, such as type:fk, target:thigh or space:hips.
+        A space search finds the components using a matching component as a space.
+        :return: A set of component ids
+        '''
+        result = None
+
+        for word in text.split():
+            field, _, value = word.rpartition(':')
+            field = field.lower()
+
+            if field == 'space':
+                ids = set()
+                for spaceId in self._match(value, 'name'):
+                    ids.update(self.users(spaceId))
+            elif field in SEARCH_FIELDS:
+                ids = self._match(value, field)
+            else:
+                ids = self._match(word, None)
+
+            result = ids if result is None else result & ids
+            if not result:
+                return set()
+
+        return result if result is not None else set(self._componentTerms)
+
+    def users(self, id, spaceKeys=None):
+        '''
+        Finds the components using a component as a space.
+        :param id: The id of the space component
+        :param spaceKeys: The space fields to check, such as ('parentSpace',), defaults to every space field
+        :return: A set of component ids
+        '''
+        return set(user for user, key in self._spaceUsers.get(id, ())
+                   if spaceKeys is None or key in spaceKeys)
+
+    def find(self, name):
+        '''
+        :return: The ids of the components with a name, ignoring case.
+        '''
+        return set(self._names.get(name.lower(), ()))
+
+    def __len__(self):
+        return len(self._componentTerms)
+
+    #### Private Methods ####
+
+    def _match(self, prefix, field):
+        prefix = prefix.lower()
+        if not prefix:
+            return set()
+
+        ids = set()
+
+        # Every term starting with the prefix sits in one run of the sorted list
+        start = bisect.bisect_left(self._terms, prefix)
+        for term in self._terms[start:]:
+            if not term.startswith(prefix):
+                break
+            for termField, id in self._postings[term]:
+                if field is None or termField == field:
+                    ids.add(id)
+
+        return ids
+
+    def _add(self, id, component):
+        terms = set()
+        for field, keys in SEARCH_FIELDS.iteritems():
+            if field == 'space':
+                continue
+            for key in keys:
+                for value in _values(component.get(key)):
+                    for term in _terms(value):
+                        terms.add((term, field))
+
+        for term, field in terms:
+            if term not in self._postings:
+                bisect.insort(self._terms, term)
+                self._postings[term] = set()
+            self._postings[term].add((field, id))
+        self._componentTerms[id] = terms
+
+        spaces = set()
+        for key in rigschema.SPACE_KEYS:
+            space = component.get(key)
+            if space:
+                spaces.add((space, key))
+                self._spaceUsers.setdefault(space, set()).add((id, key))
+        self._componentSpaces[id] = spaces
+
+        name = component.get('name')
+        if name:
+            self._componentNames[id] = name.lower()
+            self._names.setdefault(name.lower(), set()).add(id)
+
+    def _remove(self, id):
+        for term, field in self._componentTerms.pop(id, ()):
+            postings = self._postings[term]
+            postings.discard((field, id))
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+
+        for space, key in self._componentSpaces.pop(id, ()):
+            users = self._spaceUsers[space]
+            users.discard((id, key))
+            if not users:
+                del self._spaceUsers[space]
+
+        name = self._componentNames.pop(id, None)
+        if name is not None:
+            ids = self._names[name]
+            ids.discard(id)
+            if not ids:
+                del self._names[name]
+
+
+def _values(value):
+    if isinstance(value, (list, tuple)):
+        return [v for v in value if v]
+    if value:
+        return [value]
+    return []
+
+
+def _terms(value):
+    # The whole value and each of its words, so both l_thigh and thigh find l_thigh_jnt
+    value = str(value).lower()
+    terms = set(word for word in _WORD_SPLIT.split(value) if word)
+    terms.add(value)
+    return terms
@@ -0,0 +1,116 @@
+'''
+Helpers for opening the tool quickly.
+Slow modules are imported the first time they are used, and each startup step is timed for a report.
+'''
+import time
+
+
+# The (label, seconds) of each startup step, in the order they finished
+STARTUP_TIMES = []
+
+_start = None
+
+
+########## Timing ###############
+def begin():
+    '''
+    Clears the timings from a previous startup and starts the clock.
+    '''
+    global _start
+
+    del STARTUP_TIMES[:]
+    _start = time.time()
+
+
+def record(label, seconds):
+    '''
+    Adds a step to the startup report.
+    '''
+    STARTUP_TIMES.append((label, seconds))
+
+
+class timed(object):
+    '''
+    Times the code run inside it as a startup step.
+
+    with rigstartup.timed('Create window'):
+        window = MainComponentWindow()
+    '''
+    def __init__(self, label):
+        self.label = label
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        record(self.label, time.time() - self._start)
+        return False
+
+
+def report():
+    '''
+    :return: A table of every startup step and how long it took, slowest first, ending with the total time.
+    '''
+    lines = ['rigloo startup:']
+    for label, seconds in sorted(STARTUP_TIMES, key=lambda step: -step[1]):
+        lines.append('  %-32s %8.1f ms' % (label, seconds * 1000))
+
+    if _start is not None:
+        lines.append('  %-32s %8.1f ms' % ('Total', (time.time() - _start) * 1000))
+
+    return '\n'.join(lines)
+
+
+########## Lazy Modules ###############
+class LazyModule(object):
+    '''
+    Stands in for a module until one of its attributes is used, then imports it.
+    The import is timed and added to the startup report.
+
+    pmc = rigstartup.LazyModule('pymel.core', globals())
+    '''
+    def __init__(self, name, globals=None, onImport=None):
+        '''
+        :param name: The module to import, such as 'pymel.core'
+        :param globals: The globals of the importing module, so relative imports resolve the same way
+        :param onImport: An optional function called with the module once it is imported
+        '''
+        self.__dict__['_name'] = name
+        self.__dict__['_globals'] = globals
+        self.__dict__['_onImport'] = onImport
+        self.__dict__['_module'] = None
+
+    @property
+    def loaded(self):
+        '''
+        Whether the module was imported, without importing it.
+        '''
+        return self._module is not None
+
+    def load(self):
+        '''
+        Imports the module if it wasn't already.
+        :return: The module
+        '''
+        if self._module is None:
+            with timed('Import ' + self._name):
+                # A fromlist returns the named submodule rather than its top level package
+                module = __import__(self._name, self._globals, None, ['__name__'])
+
+            self.__dict__['_module'] = module
+
+            if self._onImport is not None:
+                self._onImport(module)
+
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self.load(), attr, value)
+
+    def __repr__(self):
+        return '<lazy module %r%s>' % (self._name, '' if self.loaded else ', not imported')
@@ -1,5 +1,8 @@
-import pymel.core as pmc
-import pymel.core.datatypes as dt
+import rigstartup
+
+# Imported when the first constraint is made
+pmc = rigstartup.LazyModule('pymel.core', globals())
+dt = rigstartup.LazyModule('pymel.core.datatypes', globals())
 
 def parentConstraint(source, target):
 